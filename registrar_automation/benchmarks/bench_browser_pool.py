@@ -0,0 +1,79 @@
+# benchmarks/bench_browser_pool.py
+"""
+Per-task browser cost of update_course_ids, without touching the registrar.
+
+Each "task" opens a page, loads a local copy of a schedule table and reads
+its section inputs, like scrape_all_course_ids does. Compares:
+  - fresh: the old path, a ScraperAPI that starts Playwright and launches
+           Chromium for the task and closes it afterwards
+  - pool:  a BrowserContext from core/browser_pool.py (the first task is
+           cold and pays the launch; later ones reuse the browser)
+
+Needs Playwright's Chromium (`playwright install chromium`). Run from the
+project root:
+    python -m benchmarks.bench_browser_pool [--tasks 10] [--max-tasks 50]
+"""
+
+import argparse
+import statistics
+import time
+
+from core.api_scraper import ScraperAPI
+from core.browser_pool import BrowserPool
+
+SECTION_ROWS = 40
+PAGE = "<html><body><div id='instanceSectionsPanel'>{}</div></body></html>".format("".join(
+    f"<input id='instance_1234_comp_{i % 3}_sec_{i}' name='{'Lab' if i % 3 else 'Lecture'}' type='checkbox'>"
+    for i in range(SECTION_ROWS)
+))
+
+
+def scrape(page):
+    page.set_content(PAGE)
+    page.wait_for_selector("div#instanceSectionsPanel")
+    return [inp.get_attribute("id") for inp in page.locator("div#instanceSectionsPanel input").all()]
+
+
+def fresh_task():
+    scraper = ScraperAPI(headless=True)
+    try:
+        assert len(scrape(scraper._page)) == SECTION_ROWS
+    finally:
+        scraper.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--max-tasks", type=int, default=50, help="pool recycles the browser after this many tasks")
+    args = parser.parse_args()
+
+    fresh = []
+    for _ in range(args.tasks):
+        started = time.perf_counter()
+        fresh_task()
+        fresh.append(time.perf_counter() - started)
+
+    pool = BrowserPool(max_tasks=args.max_tasks)
+    pooled = []
+    try:
+        for _ in range(args.tasks):
+            started = time.perf_counter()
+            with pool.context() as context:
+                assert len(scrape(context.new_page())) == SECTION_ROWS
+            pooled.append(time.perf_counter() - started)
+        report = pool.report()
+    finally:
+        pool.close()
+
+    print(f"{args.tasks} tasks each")
+    print(f"{'path':<8}{'first s':>9}{'median s':>10}{'total s':>9}")
+    for name, timings in (("fresh", fresh), ("pool", pooled)):
+        print(f"{name:<8}{timings[0]:>9.3f}{statistics.median(timings):>10.3f}{sum(timings):>9.2f}")
+    print(f"\npool: {report['launches']} launch(es), avg launch {report['avg_launch_s']:.3f}s, "
+          f"cold task {report['avg_cold_task_s']:.3f}s, warm task {report['avg_warm_task_s'] or 0:.3f}s, "
+          f"{report['recycles']} recycle(s), browser RSS {report['browser_rss_mb'] or 0:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
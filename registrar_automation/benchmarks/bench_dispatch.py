@@ -0,0 +1,88 @@
+# benchmarks/bench_dispatch.py
+"""
+Dispatch throughput for a hot second: N jobs (default 5k) all due at once.
+
+Compares:
+  - serial:    the old path, one send_task() and one HSET round trip per job
+  - batched:   claim_due_jobs() + dispatch_jobs(), i.e. one claim script per
+               batch, every message sent through one pooled producer with
+               no declare/retry, bookkeeping and acks in one pipeline
+
+Needs a running Redis. Uses a separate database (default 15) for both the
+schedule and the broker, and FLUSHES it. Run from the project root:
+    python -m benchmarks.bench_dispatch [--jobs 5000] [--db 15]
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+import redis
+from celery import Celery
+
+from core import schedule_store
+from core.redis_client import REDIS_HOST, REDIS_PORT
+from scheduler.scheduler import dispatch_jobs, task_message, TASK_ID_FIELDS
+
+
+def seed(client, count, fire_time):
+    pipe = client.pipeline(transaction=False)
+    for _ in range(count):
+        job_id = str(uuid.uuid4())
+        plan = {
+            "job_id": job_id, "chat_id": 1, "username": "u", "password": "p",
+            "courses": [{"name": "CSCI 151", "components": []}], "mode": "test",
+            "trigger_timestamp": fire_time, "open_timestamp": fire_time, "trigger_at": fire_time, "clock_offset": 0.0,
+        }
+        schedule_store.schedule_job(pipe, job_id, json.dumps(plan), {"registration": fire_time})
+    pipe.execute()
+
+
+def serial_dispatch(app, client, now):
+    sent = 0
+    while claimed := schedule_store.claim_due_jobs(client, now):
+        for token, kind, _, job_data in claimed:
+            name, args, kwargs = task_message(kind, token, job_data)
+            task = app.send_task(name, args=args, kwargs=kwargs)
+            client.hset(f"user:{job_data['chat_id']}", TASK_ID_FIELDS[kind], task.id)
+            schedule_store.ack_jobs(client, [token])
+            sent += 1
+    return sent
+
+
+def batched_dispatch(app, client, now):
+    sent = 0
+    while claimed := schedule_store.claim_due_jobs(client, now):
+        dispatch_jobs(claimed, app=app, client=client)
+        sent += len(claimed)
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True)
+    app = Celery('bench_dispatch', broker=f'redis://{REDIS_HOST}:{REDIS_PORT}/{args.db}')
+    fire_time = int(time.time())
+
+    print(f"{args.jobs} jobs due in the same second")
+    print(f"{'path':<12}{'seconds':>10}{'jobs/s':>10}{'queued':>10}{'inflight':>10}")
+    for name, dispatch in (("serial", serial_dispatch), ("batched", batched_dispatch)):
+        client.flushdb()
+        seed(client, args.jobs, fire_time)
+        started = time.perf_counter()
+        sent = dispatch(app, client, fire_time)
+        elapsed = time.perf_counter() - started
+        queued = client.llen("celery")
+        inflight = sum(client.zcard(schedule_store.inflight_key(shard)) for shard in schedule_store.all_shards())
+        print(f"{name:<12}{elapsed:>10.3f}{sent / elapsed:>10.0f}{queued:>10}{inflight:>10}")
+
+    client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_html_extract.py
+"""
+Micro-benchmark: fast-path token extractors vs a full BeautifulSoup parse.
+
+Run from the project root:
+    python -m benchmarks.bench_html_extract [--pad-kb 150] [--repeat 200]
+
+The saved sample pages are trimmed copies of the registrar's markup; --pad-kb
+inflates each page with filler markup to the size of the live pages.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from core.html_extract import extract_csrf_token, extract_form_build_id, extract_drupal_settings
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
+
+FILLER_ROW = (
+    '<div class="views-row"><span class="field-content">'
+    '<a href="/node/1234">Announcement title</a></span>'
+    '<div class="field-body"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div></div>\n'
+)
+
+
+def load_sample(name, pad_kb):
+    with open(os.path.join(SAMPLES_DIR, name), encoding="utf-8") as f:
+        html = f.read()
+    filler = FILLER_ROW * (pad_kb * 1024 // len(FILLER_ROW))
+    return html.replace("<!--FILLER-->", filler)
+
+
+def soup_csrf_token(html):
+    tag = BeautifulSoup(html, 'html.parser').find('meta', {'name': 'csrf-token'})
+    return tag['content'] if tag else None
+
+
+def soup_form_build_id(html):
+    tag = BeautifulSoup(html, 'html.parser').find('input', {'name': 'form_build_id'})
+    return tag['value'] if tag else None
+
+
+def soup_drupal_settings(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    script_tag = soup.find('script', string=lambda text: text and 'Drupal.settings' in text)
+    json_string = script_tag.string.split('jQuery.extend(Drupal.settings, ', 1)[1].rsplit(');', 1)[0]
+    return json.loads(json_string)
+
+
+CASES = [
+    ("form_build_id", "login.html", extract_form_build_id, soup_form_build_id),
+    ("csrf_token", "my_registrar.html", extract_csrf_token, soup_csrf_token),
+    ("drupal_settings", "check_grades.html", extract_drupal_settings, soup_drupal_settings),
+]
+
+
+def time_call(func, html, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pad-kb", type=int, default=150, help="filler markup added to each page (KB)")
+    parser.add_argument("--repeat", type=int, default=200, help="iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'value':<16}{'page KB':>9}{'fast ms':>11}{'soup ms':>11}{'speedup':>10}")
+    for label, sample, fast, slow in CASES:
+        html = load_sample(sample, args.pad_kb)
+        if fast(html) != slow(html):
+            raise SystemExit(f"❌ {label}: fast path and BeautifulSoup disagree on {sample}")
+        fast_ms = time_call(fast, html, args.repeat)
+        slow_ms = time_call(slow, html, max(args.repeat // 20, 1))
+        print(f"{label:<16}{len(html) / 1024:>9.0f}{fast_ms:>11.3f}{slow_ms:>11.2f}{slow_ms / fast_ms:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
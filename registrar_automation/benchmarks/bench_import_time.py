@@ -0,0 +1,121 @@
+# benchmarks/bench_import_time.py
+"""
+Import-time budget check for every entry point.
+
+Each entry point is imported in a fresh interpreter under `python -X importtime`.
+The report shows the total import time, the heaviest top-level packages and
+any module that entry point must not load (e.g. Playwright in the web API).
+Exits non-zero if an entry point is over budget or loads a forbidden module,
+so it can gate CI or a deploy.
+
+Import times on one machine swing by up to 1.5x between runs, so budgets sit
+about 1.5x above a typical best-of-3 result: they catch an entry point that
+starts pulling in a heavy dependency tree, not a few percent of drift. The
+forbidden-module check is the exact guard.
+
+Run from the project root:
+    python -m benchmarks.bench_import_time [--repeat 5] [--top 5] [--slack 1.0]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# name: (code to run, extra environment, budget in ms, forbidden top-level packages)
+ENTRY_POINTS = {
+    "web": (
+        "import web.main",
+        {},
+        1800,
+        ("playwright", "bs4", "ntplib", "aiohttp"),
+    ),
+    "registration worker": (
+        "from core.celery_app import celery_app; celery_app.loader.import_default_modules()",
+        {"CELERY_WORKER_PROFILE": "registration"},
+        900,
+        ("playwright", "bs4", "ntplib", "fastapi"),
+    ),
+    "scraper worker": (
+        "from core.celery_app import celery_app; celery_app.loader.import_default_modules()",
+        {"CELERY_WORKER_PROFILE": "scraper"},
+        1200,
+        ("fastapi", "aiohttp"),
+    ),
+    "scheduler": (
+        "import scheduler.scheduler",
+        {},
+        700,
+        ("playwright", "bs4", "ntplib", "requests", "fastapi", "aiohttp"),
+    ),
+    "bot": (
+        "import bot.main",
+        {"BOT_TOKEN": "0:import-time-check"},
+        # aiogram builds its pydantic types at import (~1.6 s on its own).
+        4000,
+        ("playwright", "bs4", "celery", "redis", "fastapi"),
+    ),
+}
+
+
+def measure(code, env):
+    """Returns {top-level package: self ms summed over its modules} for one fresh import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=dict(os.environ, **env),
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        top = name.strip().split(".")[0]
+        packages[top] = packages.get(top, 0) + int(self_us) / 1000
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per entry point; the fastest is kept")
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages listed per entry point")
+    parser.add_argument("--slack", type=float, default=1.0, help="multiplier applied to every budget")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'entry point':<22}{'import ms':>10}{'budget':>9}  heaviest packages")
+    for name, (code, env, budget, forbidden) in ENTRY_POINTS.items():
+        try:
+            runs = [measure(code, env) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:<22}{'error':>10}  {e}")
+            failures.append(f"{name}: import failed")
+            continue
+
+        packages = min(runs, key=lambda run: sum(run.values()))
+        total = sum(packages.values())
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        print(f"{name:<22}{total:>10.0f}{budget * args.slack:>9.0f}  "
+              + ", ".join(f"{package} {ms:.0f}" for package, ms in heaviest))
+
+        if total > budget * args.slack:
+            failures.append(f"{name}: {total:.0f} ms > {budget * args.slack:.0f} ms budget")
+        loaded = sorted(set(forbidden) & set(packages))
+        if loaded:
+            failures.append(f"{name}: loads {', '.join(loaded)}")
+
+    if failures:
+        print("\n❌ " + "\n❌ ".join(failures))
+        sys.exit(1)
+    print("\n✅ All entry points within budget.")
+
+
+if __name__ == "__main__":
+    main()
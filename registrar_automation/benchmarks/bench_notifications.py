@@ -0,0 +1,170 @@
+# benchmarks/bench_notifications.py
+"""
+Cost of sending Telegram reports from a task, old path vs notification outbox.
+
+A local fake Telegram API (with per-chat and global rate limits that answer
+429 + retry_after like the real one, and a configurable latency) stands in
+for api.telegram.org. Compares:
+  - direct: what notify_user used to do, a blocking POST to the web API's
+            /notifications/send, which itself POSTs to Telegram (two hops)
+  - outbox: notify_user's XADD into the outbox, then the time the
+            notification sender needs to drain a burst of reports
+            (--chats chats x --per-chat messages each)
+
+Needs a running Redis. Uses a separate database (default 15) and FLUSHES it.
+Run from the project root:
+    python -m benchmarks.bench_notifications [--chats 100] [--per-chat 3] [--latency-ms 80]
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+import redis
+import redis.asyncio
+import requests
+from aiohttp import web, ClientSession
+
+from core.notification_outbox import enqueue_notification
+from core.redis_client import REDIS_HOST, REDIS_PORT
+from core.notification_sender import NotificationSender, GLOBAL_RATE, CHAT_INTERVAL
+
+TOKEN = "bench"
+
+
+class FakeTelegram:
+    """sendMessage with Telegram-like limits, plus the old web relay endpoint."""
+
+    def __init__(self, port, latency, chat_interval, global_rate):
+        self.port = port
+        self.latency = latency
+        self.chat_interval = chat_interval
+        self.global_rate = global_rate
+        self.last_sent = {}
+        self.window = []
+        self.accepted = 0
+        self.rejected = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    async def send_message(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        self.window = [t for t in self.window if t > now - 1]
+        chat_id = str(payload["chat_id"])
+        # A little tolerance, as the real API has.
+        if now - self.last_sent.get(chat_id, -1e9) < self.chat_interval * 0.9 or len(self.window) >= self.global_rate:
+            self.rejected += 1
+            return web.json_response(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 1}},
+                status=429,
+            )
+        self.last_sent[chat_id] = now
+        self.window.append(now)
+        self.accepted += 1
+        return web.json_response({"ok": True, "result": {"message_id": self.accepted}})
+
+    async def relay(self, request):
+        payload = await request.json()
+        async with ClientSession() as session:
+            async with session.post(f"{self.url}/bot{TOKEN}/sendMessage", json=payload) as response:
+                await response.read()
+        return web.json_response({"status": "success"})
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self.ready.wait()
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_post(f"/bot{TOKEN}/sendMessage", self.send_message)
+        app.router.add_post("/notifications/send", self.relay)
+        runner = web.AppRunner(app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self.ready.set()
+        self.loop.run_forever()
+
+
+def report_text(chat, number):
+    return f"🏁 **Registration Report** #{number}\nMode: TEST\n\n✅ **Successfully Registered:**\n- CSCI 151 (1 attempt)"
+
+
+def direct_path(fake, samples):
+    timings = []
+    with requests.Session() as session:
+        for i in range(samples):
+            started = time.perf_counter()
+            # Distinct chats, so no call is slowed down by a 429.
+            session.post(f"{fake.url}/notifications/send", json={"chat_id": 10_000 + i, "text": report_text(i, 1)}, timeout=5)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def drain(client, fake, total):
+    sender = NotificationSender(client=client, api_url=fake.url, token=TOKEN)
+    runner = asyncio.create_task(sender.run())
+    started = time.perf_counter()
+    while sender.stats["delivered"] + sender.stats["dead"] < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    sender.stop()
+    await runner
+    await client.aclose()
+    return elapsed, sender.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--per-chat", type=int, default=3, help="messages per chat in the burst")
+    parser.add_argument("--latency-ms", type=float, default=80, help="fake Telegram response time")
+    parser.add_argument("--samples", type=int, default=50, help="direct-path calls to time")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True)
+    client.flushdb()
+    fake = FakeTelegram(args.port, args.latency_ms / 1000, CHAT_INTERVAL, GLOBAL_RATE)
+    fake.start()
+
+    direct = direct_path(fake, args.samples)
+
+    total = args.chats * args.per_chat
+    enqueue = []
+    for number in range(args.per_chat):
+        for chat in range(args.chats):
+            started = time.perf_counter()
+            enqueue_notification(client, chat, report_text(chat, number))
+            enqueue.append((time.perf_counter() - started) * 1000)
+    fake.accepted = fake.rejected = 0
+
+    async_client = redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True)
+    elapsed, stats = asyncio.run(drain(async_client, fake, total))
+
+    print(f"Time a task spends per notification (fake Telegram latency {args.latency_ms:.0f} ms)")
+    print(f"{'path':<10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, timings in (("direct", direct), ("outbox", enqueue)):
+        timings = sorted(timings)
+        print(f"{name:<10}{statistics.median(timings):>10.3f}{timings[int(len(timings) * 0.99) - 1]:>10.3f}")
+
+    print(f"\nSender draining {total} messages to {args.chats} chats (limits: {GLOBAL_RATE:g}/s, 1 per {CHAT_INTERVAL:g}s per chat)")
+    print(f"  drained in {elapsed:.2f}s, {stats['requests']} HTTP requests "
+          f"({total / max(stats['requests'], 1):.1f} messages each after coalescing)")
+    print(f"  429s: {stats['rate_limited']} (server rejected {fake.rejected}), retries: {stats['retries']}, "
+          f"dead: {stats['dead']}, max delivery lag: {stats['max_lag']:.2f}s")
+
+    client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# benchmarks/bench_redis_scripts.py
+"""
+Throughput of the job-state hot paths under concurrent clients, the old
+multi-command versions vs the scripts in core/redis_scripts.py:
+  - debit:  check_user_attempts (HEXISTS, HSET, HINCRBY, maybe HINCRBY)
+  - update: update_job_fields (HGET, JSON, HSET)
+  - cancel: /registration/cancel (HEXISTS, then ZREM/HDEL/PUBLISH/HDEL/HINCRBY)
+
+Also runs each race the old paths lose: every client cancels the same job
+(the attempt must be refunded once) and concurrent updates of different
+fields of one job (none may be lost).
+
+Needs a running Redis. Uses a separate database (default 15) and FLUSHES it.
+Run from the project root:
+    python -m benchmarks.bench_redis_scripts [--clients 64] [--ops 20000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import redis.asyncio
+
+from core.schedule_store import schedule_job, queue_cancel_job
+from core.redis_scripts import debit_attempt, update_job_fields, cancel_user_job
+from core.redis_client import REDIS_HOST, REDIS_PORT
+
+ATTEMPTS = 1_000_000
+
+
+async def old_debit(client, chat_id):
+    user_key = f"user:{chat_id}"
+    if not await client.hexists(user_key, "attempts_left"):
+        await client.hset(user_key, "attempts_left", ATTEMPTS)
+    left = await client.hincrby(user_key, "attempts_left", -1)
+    if left < 0:
+        await client.hincrby(user_key, "attempts_left", 1)
+    return left
+
+
+async def new_debit(client, chat_id):
+    return await debit_attempt(client, chat_id, ATTEMPTS)
+
+
+async def old_update(client, chat_id, job_id, fields):
+    raw = await client.hget(f"job_index:{chat_id}", job_id)
+    if raw:
+        entry = json.loads(raw)
+        entry.update(fields)
+        await client.hset(f"job_index:{chat_id}", job_id, json.dumps(entry))
+
+
+async def new_update(client, chat_id, job_id, fields):
+    return await update_job_fields(client, chat_id, job_id, fields)
+
+
+async def old_cancel(client, chat_id, job_id):
+    if not await client.hexists(f"job_index:{chat_id}", job_id):
+        return None
+    pipe = client.pipeline()
+    queue_cancel_job(pipe, job_id)
+    pipe.hdel(f"job_index:{chat_id}", job_id)
+    pipe.hincrby(f"user:{chat_id}", "attempts_left", 1)
+    return await pipe.execute()
+
+
+async def new_cancel(client, chat_id, job_id):
+    return await cancel_user_job(client, chat_id, job_id)
+
+
+async def seed_jobs(client, chat_ids):
+    """One scheduled job per chat; returns {chat_id: job_id}."""
+    jobs = {}
+    pipe = client.pipeline(transaction=False)
+    for chat_id in chat_ids:
+        job_id = jobs[chat_id] = str(uuid.uuid4())
+        schedule_job(pipe, job_id, json.dumps({"job_id": job_id, "chat_id": chat_id}), {"pre_login": 2e9, "registration": 2e9 + 12})
+        pipe.hset(f"job_index:{chat_id}", job_id, json.dumps({"status": "scheduled", "courses": ["CSCI 151"]}))
+        pipe.hset(f"user:{chat_id}", "attempts_left", 10)
+    await pipe.execute()
+    return jobs
+
+
+async def run_clients(clients, ops, operation):
+    """Runs `ops` calls of operation(i) on `clients` concurrent coroutines; returns ops/s."""
+    counter = iter(range(ops))
+
+    async def worker():
+        for i in counter:
+            await operation(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return ops / (time.perf_counter() - started)
+
+
+async def throughput(client, args):
+    rows = []
+    users = 1000
+    for name, debit in (("old", old_debit), ("script", new_debit)):
+        await client.flushdb()
+        rows.append(("debit", name, await run_clients(args.clients, args.ops, lambda i: debit(client, i % users))))
+
+    for name, update in (("old", old_update), ("script", new_update)):
+        await client.flushdb()
+        jobs = await seed_jobs(client, range(users))
+        rows.append(("update", name, await run_clients(
+            args.clients, args.ops, lambda i: update(client, i % users, jobs[i % users], {"status": "running", "n": i})
+        )))
+
+    for name, cancel in (("old", old_cancel), ("script", new_cancel)):
+        await client.flushdb()
+        jobs = await seed_jobs(client, range(args.ops))
+        rows.append(("cancel", name, await run_clients(args.clients, args.ops, lambda i: cancel(client, i, jobs[i]))))
+    return rows
+
+
+async def races(client, args):
+    rows = []
+    for name, cancel in (("old", old_cancel), ("script", new_cancel)):
+        await client.flushdb()
+        jobs = await seed_jobs(client, [1])
+        await asyncio.gather(*(cancel(client, 1, jobs[1]) for _ in range(args.clients)))
+        refunds = int(await client.hget("user:1", "attempts_left")) - 10
+        rows.append(("double cancel", name, f"{refunds} refund(s) for 1 job"))
+
+    for name, update in (("old", old_update), ("script", new_update)):
+        await client.flushdb()
+        jobs = await seed_jobs(client, [1])
+        await asyncio.gather(*(update(client, 1, jobs[1], {f"field_{i}": i}) for i in range(args.clients)))
+        entry = json.loads(await client.hget("job_index:1", jobs[1]))
+        kept = sum(1 for i in range(args.clients) if f"field_{i}" in entry)
+        rows.append(("parallel update", name, f"{kept}/{args.clients} fields kept"))
+    return rows
+
+
+async def run(args):
+    pool = redis.asyncio.BlockingConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True, max_connections=args.clients)
+    client = redis.asyncio.StrictRedis(connection_pool=pool)
+    try:
+        return await throughput(client, args), await races(client, args)
+    finally:
+        await client.flushdb()
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent connections")
+    parser.add_argument("--ops", type=int, default=20000, help="operations per path")
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    rows, race_rows = asyncio.run(run(args))
+
+    print(f"{args.ops} operations per path, {args.clients} concurrent clients")
+    print(f"{'operation':<10}{'path':<9}{'ops/s':>10}")
+    for operation, name, rate in rows:
+        print(f"{operation:<10}{name:<9}{rate:>10.0f}")
+    print()
+    for race, name, outcome in race_rows:
+        print(f"{race:<17}{name:<9}{outcome}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# benchmarks/bench_schedule_index.py
+"""
+Legacy per-second list keys vs the sorted-set schedule index, with N jobs
+(default 10k) spread over a window of seconds.
+
+Measures, for each layout:
+  - idle:     one scheduler tick when nothing is due (the common case)
+  - dispatch: claiming every job, one scheduler tick per second of the window
+  - cancel:   cancelling a random sample of jobs by job_id
+
+Needs a running Redis. Uses a separate database (default 15) and FLUSHES it.
+Run from the project root:
+    python -m benchmarks.bench_schedule_index [--jobs 10000] [--window 600] [--db 15]
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+
+import redis
+
+from core import schedule_store
+from core.redis_client import REDIS_HOST, REDIS_PORT
+
+
+def make_plans(count, start, window):
+    plans = []
+    for _ in range(count):
+        job_id = str(uuid.uuid4())
+        fire = start + random.randrange(window)
+        plan = {"job_id": job_id, "chat_id": 1, "username": "u", "password": "p", "courses": [], "mode": "test"}
+        plans.append((job_id, fire, json.dumps(plan)))
+    return plans
+
+
+def seed_legacy(client, plans):
+    pipe = client.pipeline(transaction=False)
+    for job_id, fire, plan_json in plans:
+        pipe.rpush(f"schedule:{fire - 12}:pre_login", plan_json)
+        pipe.rpush(f"schedule:{fire}:registration", plan_json)
+    pipe.execute()
+
+
+def seed_index(client, plans):
+    pipe = client.pipeline(transaction=False)
+    for job_id, fire, plan_json in plans:
+        schedule_store.schedule_job(pipe, job_id, plan_json, {"pre_login": fire - 12, "registration": fire})
+    pipe.execute()
+
+
+def legacy_dispatch(client, start, window):
+    claimed = 0
+    for ts in range(start - 12, start + window):
+        for kind in schedule_store.JOB_KINDS:
+            key = f"schedule:{ts}:{kind}"
+            jobs = client.lrange(key, 0, -1)
+            if jobs:
+                claimed += len([json.loads(job) for job in jobs])
+                client.delete(key)
+    return claimed
+
+
+def index_dispatch(client, start, window):
+    claimed = 0
+    for ts in range(start - 12, start + window):
+        claimed += len(schedule_store.claim_due_jobs(client, ts))
+    return claimed
+
+
+def legacy_idle(client, ticks):
+    for _ in range(ticks):
+        for kind in schedule_store.JOB_KINDS:
+            client.lrange(f"schedule:0:{kind}", 0, -1)
+
+
+def index_idle(client, ticks):
+    for _ in range(ticks):
+        schedule_store.claim_due_jobs(client, 0)
+
+
+def legacy_cancel(client, plans):
+    for job_id, fire, _ in plans:
+        for key in (f"schedule:{fire - 12}:pre_login", f"schedule:{fire}:registration"):
+            for plan_json in client.lrange(key, 0, -1):
+                if json.loads(plan_json).get("job_id") == job_id:
+                    client.lrem(key, 1, plan_json)
+                    break
+
+
+def index_cancel(client, plans):
+    for job_id, _, _ in plans:
+        schedule_store.cancel_job(client, job_id)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--window", type=int, default=600, help="seconds the jobs are spread over")
+    parser.add_argument("--cancel", type=int, default=500, help="jobs cancelled in the cancel benchmark")
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True)
+    start = int(time.time()) + 3600
+    plans = make_plans(args.jobs, start, args.window)
+    to_cancel = random.sample(plans, min(args.cancel, len(plans)))
+
+    print(f"{args.jobs} jobs over {args.window}s, cancelling {len(to_cancel)}")
+    idle_ticks = 1000
+    print(f"{'layout':<10}{'idle us/tick':>14}{'cancel ms/job':>15}{'dispatch s':>12}{'claimed':>10}")
+    for name, seed, idle, cancel, dispatch in (
+        ("legacy", seed_legacy, legacy_idle, legacy_cancel, legacy_dispatch),
+        ("index", seed_index, index_idle, index_cancel, index_dispatch),
+    ):
+        client.flushdb()
+        seed(client, plans)
+        _, idle_s = timed(idle, client, idle_ticks)
+        _, cancel_s = timed(cancel, client, to_cancel)
+        claimed, dispatch_s = timed(dispatch, client, start, args.window)
+        print(
+            f"{name:<10}{idle_s / idle_ticks * 1e6:>14.1f}{cancel_s / len(to_cancel) * 1000:>15.3f}"
+            f"{dispatch_s:>12.3f}{claimed:>10}"
+        )
+
+    client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
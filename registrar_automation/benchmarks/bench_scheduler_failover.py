@@ -0,0 +1,157 @@
+# benchmarks/bench_scheduler_failover.py
+"""
+Failover test: several scheduler instances share one Redis, jobs fire every
+few milliseconds, and halfway through the instance holding the most shards
+is killed with SIGKILL. Its shards are re-leased by the survivors; the
+benchmark reports how late jobs were dispatched, split into jobs of the
+killed instance's shards that fell due after the kill and everything else.
+
+Dispatch time is when the Celery message shows up on the broker queue.
+
+Needs a running Redis. Uses a separate database (default 15) for both the
+schedule and the broker, and FLUSHES it. Run from the project root:
+    python -m benchmarks.bench_scheduler_failover [--instances 3] [--lease-ms 600]
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import signal
+import statistics
+import threading
+import time
+import uuid
+
+import redis
+from celery import Celery
+
+from core import schedule_store
+from core.redis_client import REDIS_HOST, REDIS_PORT
+from scheduler.leases import LEASE_KEY
+
+
+def run_instance(db, lease_ms):
+    from scheduler.scheduler import run_scheduler
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=db, decode_responses=True)
+    app = Celery('bench_failover', broker=f'redis://{REDIS_HOST}:{REDIS_PORT}/{db}')
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run_scheduler(app=app, client=client, lease_ms=lease_ms)
+
+
+def shard_holders(client):
+    holders = client.mget([LEASE_KEY.format(shard) for shard in schedule_store.all_shards()])
+    return {shard: int(holder.split(":")[1]) for shard, holder in enumerate(holders) if holder}
+
+
+def wait_for_balance(client, instances, timeout=10):
+    target = -(-schedule_store.SCHEDULE_SHARDS // instances)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        holders = shard_holders(client)
+        counts = [list(holders.values()).count(pid) for pid in set(holders.values())]
+        if len(holders) == schedule_store.SCHEDULE_SHARDS and len(counts) == instances and max(counts) <= target:
+            return holders
+        time.sleep(0.05)
+    raise SystemExit("❌ Shards never settled across the instances.")
+
+
+def collect_dispatches(client, received, stop):
+    while not stop.is_set():
+        item = client.brpop("celery", timeout=0.2)
+        if item:
+            received[json.loads(item[1])["headers"]["id"]] = time.time()
+
+
+def seed(client, start, duration, interval):
+    fire_times = {}
+    pipe = client.pipeline(transaction=False)
+    for i in range(int(duration / interval)):
+        job_id = str(uuid.uuid4())
+        fire = start + i * interval
+        plan = {"job_id": job_id, "chat_id": 1, "username": "u", "password": "p", "courses": [], "mode": "test"}
+        schedule_store.schedule_job(pipe, job_id, json.dumps(plan), {"registration": fire})
+        fire_times[schedule_store.job_member(job_id, "registration")] = fire
+    pipe.execute()
+    return fire_times
+
+
+def describe(label, lags):
+    if not lags:
+        print(f"{label:<28}{0:>6}")
+        return
+    lags = sorted(lags)
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(f"{label:<28}{len(lags):>6}{statistics.median(lags):>10.1f}{p99:>10.1f}{lags[-1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--lease-ms", type=int, default=600)
+    parser.add_argument("--duration", type=float, default=4.0, help="seconds over which jobs fall due")
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between fire times")
+    parser.add_argument("--db", type=int, default=15)
+    args = parser.parse_args()
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=args.db, decode_responses=True)
+    client.flushdb()
+
+    processes = [
+        multiprocessing.Process(target=run_instance, args=(args.db, args.lease_ms), daemon=True)
+        for _ in range(args.instances)
+    ]
+    for process in processes:
+        process.start()
+    holders = wait_for_balance(client, args.instances)
+
+    received = {}
+    stop = threading.Event()
+    consumer = threading.Thread(target=collect_dispatches, args=(client, received, stop))
+    consumer.start()
+
+    start = time.time() + 1.0
+    fire_times = seed(client, start, args.duration, args.interval)
+
+    # Kill the busiest instance halfway through.
+    victim = max(set(holders.values()), key=list(holders.values()).count)
+    victim_shards = {shard for shard, pid in holders.items() if pid == victim}
+    kill_at = start + args.duration / 2
+    time.sleep(max(kill_at - time.time(), 0))
+    os.kill(victim, signal.SIGKILL)
+    killed_at = time.time()
+
+    time.sleep(max(start + args.duration + 2 * args.lease_ms / 1000 + 1 - time.time(), 0))
+    stop.set()
+    consumer.join()
+    taken_over = wait_for_balance(client, args.instances - 1)
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    affected, others = [], []
+    for token, fire in fire_times.items():
+        if token not in received:
+            continue
+        lag_ms = (received[token] - fire) * 1000
+        in_victim_shard = schedule_store.token_shard(token) in victim_shards
+        (affected if in_victim_shard and fire >= killed_at else others).append(lag_ms)
+
+    print(f"{args.instances} instances, {schedule_store.SCHEDULE_SHARDS} shards, lease {args.lease_ms} ms, "
+          f"{len(fire_times)} jobs; killed pid {victim} holding shards {sorted(victim_shards)}")
+    print(f"shards after failover: {dict(sorted(taken_over.items()))}")
+    print(f"{'jobs':<28}{'count':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    describe("unaffected", others)
+    describe("killed instance's shards", affected)
+    missing = len(fire_times) - len(received)
+    print(f"missing: {missing}, duplicates dropped by token: {len(received) - len(set(received))}")
+
+    client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
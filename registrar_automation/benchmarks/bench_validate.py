@@ -0,0 +1,122 @@
+# benchmarks/bench_validate.py
+"""
+Concurrent /user/validate calls in one web process, old vs new client.
+
+A local fake registrar (login form, then a login POST that answers after
+--latency-ms) stands in for the real site. --users validations run at once
+on one event loop, as when many students go through the bot's FSM together:
+  - blocking: what the endpoint used to do, RegistrarAPI.validate_login
+              called inside the coroutine (the event loop waits on requests)
+  - async:    AsyncRegistrarAPI.validate_login on the shared aiohttp pool,
+              as the endpoint does now
+
+Also reports the longest event-loop stall seen by a 10 ms ticker, i.e. how
+long every other API request would have been stuck.
+
+Run from the project root:
+    python -m benchmarks.bench_validate [--users 50] [--latency-ms 200]
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+from aiohttp import web
+
+from core.api_registrar import RegistrarAPI
+from core.async_api_registrar import AsyncRegistrarAPI, close_shared_connector
+
+LOGIN_PAGE = "<html><form><input type='hidden' name='form_build_id' value='form-bench'></form></html>"
+LOGGED_IN_PAGE = "<html><a href='/user/logout'>Log out</a></html>"
+
+
+class FakeRegistrar:
+    def __init__(self, port, latency):
+        self.port = port
+        self.latency = latency
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    async def login_form(self, request):
+        return web.Response(text=LOGIN_PAGE, content_type="text/html")
+
+    async def login(self, request):
+        await request.post()
+        await asyncio.sleep(self.latency)
+        return web.Response(text=LOGGED_IN_PAGE, content_type="text/html")
+
+    @property
+    def login_url(self):
+        return f"http://127.0.0.1:{self.port}/user/login"
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self.ready.wait()
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_get("/user/login", self.login_form)
+        app.router.add_post("/user/login", self.login)
+        runner = web.AppRunner(app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self.ready.set()
+        self.loop.run_forever()
+
+
+async def blocking_validate(login_url):
+    api = RegistrarAPI(mode="test")
+    api.LOGIN_URL = login_url
+    return api.validate_login("student", "secret")
+
+
+async def async_validate(login_url):
+    async with AsyncRegistrarAPI(mode="test") as api:
+        api.LOGIN_URL = login_url
+        return await api.validate_login("student", "secret")
+
+
+async def run(validate, login_url, users):
+    """Runs `users` validations at once; returns (seconds, valid count, longest loop stall in ms)."""
+    stall = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal stall
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stall = max(stall, time.perf_counter() - started - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(validate(login_url) for _ in range(users)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    await close_shared_connector()
+    return elapsed, sum(results), stall * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="concurrent validations")
+    parser.add_argument("--latency-ms", type=float, default=200, help="fake registrar login response time")
+    parser.add_argument("--port", type=int, default=18082)
+    args = parser.parse_args()
+
+    fake = FakeRegistrar(args.port, args.latency_ms / 1000)
+    fake.start()
+
+    print(f"{args.users} concurrent validations, fake login latency {args.latency_ms:.0f} ms")
+    print(f"{'client':<10}{'total s':>9}{'valid':>7}{'max loop stall ms':>19}")
+    for name, validate in (("blocking", blocking_validate), ("async", async_validate)):
+        elapsed, valid, stall_ms = asyncio.run(run(validate, fake.login_url, args.users))
+        print(f"{name:<10}{elapsed:>9.2f}{valid:>7}{stall_ms:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
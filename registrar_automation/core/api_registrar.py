@@ -1,14 +1,109 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from urllib.parse import urlparse
+import threading
+import codecs
+import socket
 import time
 import json
+from .html_extract import (
+    extract_csrf_token, extract_form_build_id, extract_drupal_settings,
+    scan_csrf_token, scan_form_build_id,
+)
+
+# HTTP statuses of a registerSections call that are worth retrying.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Phrases of the registrar's own failure messages (lower-cased) that describe
+# a transient server-side condition worth retrying. Only applied to message
+# text; transport errors are judged by TransportFailure.
+RETRYABLE_MARKERS = (
+    "busy", "try again", "timed out", "timeout", "temporarily",
+    "service unavailable", "too many requests", "server error", "bad gateway",
+)
+
+
+class TransportFailure(str):
+    """
+    Failure reason of a registerSections call the registrar never answered
+    with a verdict (network error, HTTP error status, unreadable reply).
+    Reads like the error text; `retryable` says whether trying again can help.
+    """
+
+    def __new__(cls, text, retryable):
+        failure = super().__new__(cls, text)
+        failure.retryable = retryable
+        return failure
+
+    @classmethod
+    def from_exception(cls, error):
+        """Judges a requests exception by its type and, for HTTP errors, the status code."""
+        if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            retryable = True
+        elif isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            retryable = error.response.status_code in RETRYABLE_STATUS_CODES
+        else:
+            # A reply that is not JSON is an overload or maintenance page, not a verdict.
+            retryable = isinstance(error, requests.exceptions.InvalidJSONError)
+        return cls(str(error), retryable)
+
+
+def already_registered(reason):
+    """
+    True if a failure reason says the course is already on the schedule. For a
+    re-submission that means an earlier copy got through: a success.
+    """
+    return "already registered" in str(reason or "").lower()
+
+
+def classify_registration_result(is_success, reason):
+    """
+    Classifies a register_course outcome as 'success', 'retryable' (system busy,
+    timeouts, 429/5xx) or 'permanent' (section full, time conflict, ...).
+    """
+    if is_success:
+        return "success"
+    if isinstance(reason, TransportFailure):
+        return "retryable" if reason.retryable else "permanent"
+    text = str(reason or "").lower()
+    if any(marker in text for marker in RETRYABLE_MARKERS):
+        return "retryable"
+    return "permanent"
+
 
 class RegistrarAPI:
     """
     Handles all network communication with the registrar's website.
     """
 
-    def __init__(self, session_cookies=None, mode='test'):
+    # Number of keep-alive connections kept per host. Concurrent registration
+    # fans out over this pool, so it should cover the largest course list.
+    POOL_SIZE = 8
+
+    # Chunk size for streaming page fetches; the csrf-token meta tag normally
+    # arrives within the first chunk or two.
+    STREAM_CHUNK_SIZE = 4096
+
+    # Default seconds allowed for fetching a whole page (login, token, session check).
+    PAGE_TIMEOUT = 10
+
+    # Seconds before an unanswered registerSections call counts as a (retryable) timeout.
+    REGISTER_TIMEOUT = 8
+    # Shortest timeout worth sending a registerSections call with.
+    MIN_REGISTER_TIMEOUT = 0.5
+
+    # Hedging: when a registerSections call has not answered within the
+    # HEDGE_PERCENTILE latency observed so far in this process, an identical
+    # request goes out on another pooled connection and the first answer wins.
+    HEDGE_PERCENTILE = 90
+    HEDGE_DEFAULT_DELAY = 1.0
+    HEDGE_MIN_SAMPLES = 5
+    _latency_samples = deque(maxlen=200)
+    _latency_lock = threading.Lock()
+
+    def __init__(self, session_cookies=None, mode='test', stream_pages=False, hedge_requests=False):
 
         # Determine URL based on mode
         if mode == 'real':
@@ -21,9 +116,24 @@ class RegistrarAPI:
         self.API_URL = f"{self.REG_PAGE_URL}/json"
         self.GRADES_PAGE_URL = f"{self.BASE_URL}/my-registrar/check-grades"
         self.MAIN_PAGE_URL = f"{self.BASE_URL}/my-registrar"
+        # Static file used for cheap keep-alive pings; never hits Drupal's PHP stack.
+        self.PING_URL = f"{self.BASE_URL}/robots.txt"
+
 
+        # When enabled, token pages are read incrementally and the download is
+        # abandoned as soon as the token has been seen.
+        self.stream_pages = stream_pages
+        self.last_fetch_stats = None
+
+        self.hedge_requests = hedge_requests
+        self._hedge_calls = 0
+        self._hedge_events = []
+        self._hedge_lock = threading.Lock()
 
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
         })
@@ -100,12 +210,13 @@ class RegistrarAPI:
             return None, None
 
 
-    def fetch_csrf_token(self):
+    def fetch_csrf_token(self, timeout=None):
         """
         Public wrapper to explicitly fetch the CSRF token.
-        Useful for run_registration task.
+        Useful for run_registration task, which passes the `timeout` (seconds,
+        default PAGE_TIMEOUT) left before its polling deadline.
         """
-        return self.__get_csrf_token_from_page()
+        return self.__get_csrf_token_from_page(timeout)
 
 
     def get_student_id(self):
@@ -117,19 +228,11 @@ class RegistrarAPI:
         try:
             req = self.session.get(self.GRADES_PAGE_URL, verify=False)
             req.raise_for_status()
-            soup = BeautifulSoup(req.text, 'html.parser')
-            
-            # Find the script tag containing the Drupal settings
-            script_tag = soup.find('script', string=lambda text: text and 'Drupal.settings' in text)
-            if not script_tag:
+            data = extract_drupal_settings(req.text)
+            if data is None:
                 print("❌ Could not find the settings script tag on the grades page.")
                 return None
 
-            # Extract the JSON string from the script tag
-            json_string = script_tag.string.split('jQuery.extend(Drupal.settings, ', 1)[1].rsplit(');', 1)[0]
-            
-            # Parse the JSON
-            data = json.loads(json_string)
             student_id = data['checkGrades']['studentDetails']['midterm']['STUDENTID']
             
             if student_id:
@@ -143,51 +246,178 @@ class RegistrarAPI:
             return None
 
 
-    def register_course(self, course_data, user_id, csrf_token):
+    def register_course(self, course_data, user_id, csrf_token, timeout=None):
         """
-        Public method to register a single course.
+        Public method to register a single course. `timeout` (seconds, default
+        REGISTER_TIMEOUT) bounds the wait for the registrar's answer.
         """
-        self.session.headers.update({
-            "x-csrf-token": csrf_token,
-            "Referer": f"{self.REG_PAGE_URL}/selected",
-        })
+        self.__set_registration_headers(csrf_token)
+        return self.__register_one(course_data, user_id, timeout or self.REGISTER_TIMEOUT)
 
-        component_parts = [
-            f"instance_{course_data['instance_id']}_component_{comp['component_id']}_section_{comp['section_id']}"
-            for comp in course_data['components']
-        ]
-        sections_string = "-".join(component_parts)
-        
-        register_params = {
-            "_dc": int(time.time() * 1000),
-            "method": "registerSections",
-            "sections": sections_string,
-            "userid": user_id
-        }
 
-        course_name = course_data['name']
-        
-        print(f"📤 Registering '{course_data['name']}'...")
+    def register_courses_concurrently(self, courses, user_id, csrf_token, timeout=None):
+        """
+        Registers every course at the same moment instead of one after another.
+        All requests share this session's cookies and CSRF token and go out over
+        the session's connection pool; a barrier releases them together.
+        Each request waits at most `timeout` seconds (default REGISTER_TIMEOUT).
+        Returns a list of (is_success, reason, latency_ms) in the order of `courses`.
+        """
+        if not courses:
+            return []
+
+        self.__set_registration_headers(csrf_token)
+        timeout = timeout or self.REGISTER_TIMEOUT
+        start_barrier = threading.Barrier(len(courses))
+
+        def submit(course_data):
+            start_barrier.wait()
+            started = time.perf_counter()
+            is_success, reason = self.__register_one(course_data, user_id, timeout)
+            latency_ms = (time.perf_counter() - started) * 1000
+            return is_success, reason, latency_ms
+
+        print(f"📤 Firing {len(courses)} registration requests concurrently...")
+        with ThreadPoolExecutor(max_workers=len(courses)) as executor:
+            return list(executor.map(submit, courses))
+
+
+    def register_courses_batch(self, courses, user_id, csrf_token, timeout=None):
+        """
+        Submits every course in a single registerSections call, then splits the
+        reply into per-course outcomes. Courses the reply does not confirm as
+        registered are retried individually (concurrently), so a single
+        request covers the whole list in the common case; an "already
+        registered" answer to such a retry counts as success. The batch call and
+        the individual retries together fit in `timeout` seconds (default
+        REGISTER_TIMEOUT); retries that would not are skipped.
+        Returns a list of (is_success, reason, latency_ms) in the order of `courses`.
+        """
+        if not courses:
+            return []
+
+        self.__set_registration_headers(csrf_token)
+        timeout = timeout or self.REGISTER_TIMEOUT
+        sections_string = "-".join(self.__build_sections_string(course) for course in courses)
+
+        print(f"📤 Registering {len(courses)} course(s) in one batch...")
         print(f"   Submitting sections: {sections_string}")
-        
+
+        started = time.perf_counter()
         try:
-            r = self.session.get(self.API_URL, params=register_params, verify=False)
-            r.raise_for_status()
-            
-            # --- Parse the response ---
-            response_data = r.json()
-            message = response_data.get("message","")
-            if response_data.get("success") is True or "Registration Successful" in message:
-                print(f"   ✅ SUCCESS: Successfully registered '{course_name}'.")
-                return True, course_name
-            else:
-                # Extract the error message if available
-                error_message = response_data.get("message", "No reason provided.")
-                print(f"   ❌ FAILED: Could not register '{course_name}'. Reason: {error_message}")
-                return False, error_message   
+            response_data = self.__request_registration(sections_string, user_id, timeout)
+            outcomes = self.__split_batch_response(courses, response_data)
         except requests.exceptions.RequestException as e:
-            print(f"   ❌ An error occurred while registering '{course_name}': {e}")
-            return False, str(e)
+            print(f"   ❌ Batch request failed, falling back to per-course calls: {e}")
+            outcomes = [(None, TransportFailure.from_exception(e))] * len(courses)
+        batch_ms = (time.perf_counter() - started) * 1000
+
+        results = [None] * len(courses)
+        retry_indexes = []
+        for index, (is_success, reason) in enumerate(outcomes):
+            if is_success:
+                print(f"   ✅ SUCCESS: Successfully registered '{courses[index]['name']}'.")
+                results[index] = (True, reason, batch_ms)
+            else:
+                retry_indexes.append(index)
+
+        remaining = timeout - batch_ms / 1000
+        if retry_indexes and remaining < self.MIN_REGISTER_TIMEOUT:
+            print(f"   ⌛ No time left to retry {len(retry_indexes)} course(s) individually.")
+            for index in retry_indexes:
+                results[index] = (False, outcomes[index][1], batch_ms)
+        elif retry_indexes:
+            print(f"   🔁 {len(retry_indexes)} course(s) not confirmed by the batch, retrying individually...")
+            retried = self.register_courses_concurrently(
+                [courses[index] for index in retry_indexes], user_id, csrf_token, remaining
+            )
+            for index, (is_success, reason, latency_ms) in zip(retry_indexes, retried):
+                # The batch may have registered the course without saying so.
+                if not is_success and already_registered(reason):
+                    is_success, reason = True, courses[index]['name']
+                results[index] = (is_success, reason, batch_ms + latency_ms)
+
+        return results
+
+
+    def hedge_report(self):
+        """
+        Summarises hedging for this session: how many registrations were sent
+        in hedging mode, how many needed a hedge, how often the hedge answered
+        first, and roughly how much waiting those wins saved (the primary's
+        finish time, or now if it is still stuck, minus the hedge's).
+        """
+        now = time.perf_counter()
+        with self._hedge_lock:
+            events = [dict(event) for event in self._hedge_events]
+            calls = self._hedge_calls
+        wins = [event for event in events if event["winner"] == "hedge"]
+        saved_s = sum(max((event["primary_done"] or now) - event["hedge_done"], 0.0) for event in wins)
+        return {
+            "requests": calls,
+            "hedged": len(events),
+            "hedge_wins": len(wins),
+            "saved_ms": round(saved_s * 1000),
+        }
+
+
+    def warm_up(self, connections=None):
+        """
+        Resolves the registrar host and opens `connections` keep-alive TLS
+        connections in the session pool, so the first real request at trigger
+        time reuses a hot socket. Returns timing stats, including an estimate
+        of the DNS + TCP + TLS time that later requests no longer pay.
+        """
+        connections = connections or self.POOL_SIZE
+        host = urlparse(self.BASE_URL).hostname
+        print(f"--- Warming up {connections} connection(s) to {host} ---")
+
+        dns_started = time.perf_counter()
+        try:
+            socket.getaddrinfo(host, 443, proto=socket.IPPROTO_TCP)
+        except socket.gaierror as e:
+            print(f"⚠️ DNS resolution failed during warm-up: {e}")
+        dns_ms = (time.perf_counter() - dns_started) * 1000
+
+        # First round opens fresh sockets (handshakes included), the second
+        # round reuses them; the difference is what the warm-up saves.
+        cold_ms = self.__ping_connections(connections)
+        warm_ms = self.__ping_connections(connections)
+
+        stats = {
+            "connections": connections,
+            "dns_ms": round(dns_ms, 1),
+            "cold_request_ms": round(cold_ms, 1) if cold_ms is not None else None,
+            "warm_request_ms": round(warm_ms, 1) if warm_ms is not None else None,
+            "handshake_saved_ms": None,
+        }
+        if cold_ms is not None and warm_ms is not None:
+            stats["handshake_saved_ms"] = round(max(cold_ms - warm_ms, 0.0) + dns_ms, 1)
+            print(f"✅ Warm-up done. Estimated handshake time saved: {stats['handshake_saved_ms']} ms")
+        else:
+            print("⚠️ Warm-up could not reach the registrar; the first request will pay the handshake.")
+        return stats
+
+
+    def keep_warm_until(self, target_timestamp, interval=2.0):
+        """
+        Sleeps until `target_timestamp` (epoch seconds), pinging every pooled
+        connection each `interval` seconds so the server does not close them
+        for being idle.
+        """
+        next_ping = time.time() + interval
+        while True:
+            now = time.time()
+            remaining = target_timestamp - now
+            if remaining <= 0:
+                return
+            if now >= next_ping:
+                # Skip a ping that would still be in flight at trigger time.
+                if remaining > interval / 2:
+                    self.__ping_connections(self.POOL_SIZE)
+                next_ping = time.time() + interval
+                continue
+            time.sleep(min(remaining, next_ping - now, 0.5))
 
 
     def is_session_valid(self):
@@ -198,7 +428,7 @@ class RegistrarAPI:
         print("--- Validating session with the server ---")
         try:
             # Access a page that is only available when logged in.
-            response = self.session.get(self.REG_PAGE_URL, verify=False, allow_redirects=True)
+            response = self.session.get(self.REG_PAGE_URL, verify=False, allow_redirects=True, timeout=self.PAGE_TIMEOUT)
             response.raise_for_status()
             
             # A valid session should show a "Log out" link. An invalid one might redirect
@@ -219,34 +449,265 @@ class RegistrarAPI:
         """Private method to scrape the form_build_id from the login page."""
         print("Fetching login page for form_build_id...")
         try:
-            req = self.session.get(self.LOGIN_URL, verify=False)
-            req.raise_for_status()
-            soup = BeautifulSoup(req.text, 'html.parser')
-            tag = soup.find('input', {'name': 'form_build_id'})
-            if not tag:
+            form_id = self.__fetch_page_value(self.LOGIN_URL, scan_form_build_id, extract_form_build_id)
+            if not form_id:
                 print("❌ Could not find form_build_id on the login page.")
                 return None
-            form_id = tag['value']
             print(f"✅ Found form_build_id: {form_id[:15]}...")
             return form_id
         except (requests.exceptions.RequestException, AttributeError) as e:
             print(f"❌ Failed to get form_build_id: {e}")
             return None
             
-    def __get_csrf_token_from_page(self):
+    def __get_csrf_token_from_page(self, timeout=None):
         """Private method to scrape the CSRF token from the main registration page."""
         print("\n--- Fetching CSRF Token for Registration ---")
         try:
-            req = self.session.get(self.MAIN_PAGE_URL, verify=False)
-            req.raise_for_status()
-            soup = BeautifulSoup(req.text, 'html.parser')
-            tag = soup.find('meta', {'name': 'csrf-token'})
-            if not tag:
+            token = self.__fetch_page_value(self.MAIN_PAGE_URL, scan_csrf_token, extract_csrf_token, timeout)
+            if not token:
                 print("❌ Could not find the 'csrf-token' meta tag.")
                 return None
-            token = tag['content']
             print(f"✅ Found CSRF Token: {token[:10]}...")
             return token
         except (requests.exceptions.RequestException, AttributeError) as e:
             print(f"❌ Failed to get or parse the CSRF token: {e}")
             return None
+
+    def __fetch_page_value(self, url, scanner, extractor, timeout=None):
+        """
+        Private method to GET `url` and pull one value out of it within
+        `timeout` seconds (default PAGE_TIMEOUT).
+        In streaming mode the body is read chunk by chunk and `scanner` (a
+        fast-path extractor that tolerates partial HTML) is tried after each
+        chunk; the response is closed as soon as it hits, so the tail of the
+        page is never downloaded. The early close discards that socket, which
+        is why the pool keeps several warm connections. If the scanner never
+        hits, `extractor` gets the complete page.
+        """
+        timeout = timeout or self.PAGE_TIMEOUT
+        # requests' timeout bounds each socket read, not the whole body, so the
+        # body is read in chunks and a page still trickling in is cut off.
+        give_up_at = time.perf_counter() + timeout
+
+        def chunks(req):
+            for chunk in req.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+                if time.perf_counter() > give_up_at:
+                    raise requests.exceptions.ReadTimeout(f"{url} not read within {timeout:.1f}s")
+                yield chunk
+
+        if not self.stream_pages:
+            with self.session.get(url, verify=False, stream=True, timeout=timeout) as req:
+                req.raise_for_status()
+                body = b"".join(chunks(req))
+            self.last_fetch_stats = None
+            return extractor(body.decode(req.encoding or "utf-8", errors="replace"))
+
+        req = self.session.get(url, verify=False, stream=True, timeout=timeout, headers={"Accept-Encoding": "gzip, deflate"})
+        try:
+            req.raise_for_status()
+            decoder = codecs.getincrementaldecoder(req.encoding or "utf-8")(errors="replace")
+            html = ""
+            value = None
+            read_to_end = False
+            for chunk in chunks(req):
+                html += decoder.decode(chunk)
+                value = scanner(html)
+                if value is not None:
+                    break
+            else:
+                read_to_end = True
+                html += decoder.decode(b"", final=True)
+                value = extractor(html)
+
+            page_bytes = req.headers.get("Content-Length")
+            self.last_fetch_stats = {
+                "streamed": True,
+                "early_exit": not read_to_end,
+                "bytes_read": req.raw.tell(),
+                "page_bytes": int(page_bytes) if page_bytes else None,
+                "encoding": req.headers.get("Content-Encoding", "identity"),
+            }
+            print(
+                f"   Read {self.last_fetch_stats['bytes_read']} of "
+                f"{self.last_fetch_stats['page_bytes'] or '?'} bytes ({self.last_fetch_stats['encoding']})."
+            )
+            return value
+        finally:
+            req.close()
+
+    def __ping_connections(self, connections):
+        """
+        Private method to send `connections` simultaneous HEAD requests so each
+        one occupies its own pooled socket. Returns the mean latency in ms, or
+        None if every ping failed.
+        """
+        def ping(_):
+            started = time.perf_counter()
+            try:
+                self.session.head(self.PING_URL, verify=False, timeout=5)
+            except requests.exceptions.RequestException:
+                return None
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            latencies = [ms for ms in executor.map(ping, range(connections)) if ms is not None]
+        if not latencies:
+            return None
+        return sum(latencies) / len(latencies)
+
+    def __set_registration_headers(self, csrf_token):
+        """Private method to attach the CSRF token and referer used by the JSON API."""
+        self.session.headers.update({
+            "x-csrf-token": csrf_token,
+            "Referer": f"{self.REG_PAGE_URL}/selected",
+        })
+
+    def __build_sections_string(self, course_data):
+        """Private method to encode a course's components the way registerSections expects."""
+        component_parts = [
+            f"instance_{course_data['instance_id']}_component_{comp['component_id']}_section_{comp['section_id']}"
+            for comp in course_data['components']
+        ]
+        return "-".join(component_parts)
+
+    def __request_registration(self, sections_string, user_id, timeout):
+        """Private method to call registerSections and return the decoded JSON reply."""
+        register_params = {
+            "_dc": int(time.time() * 1000),
+            "method": "registerSections",
+            "sections": sections_string,
+            "userid": user_id
+        }
+        started = time.perf_counter()
+        try:
+            r = self.session.get(self.API_URL, params=register_params, verify=False, timeout=timeout)
+        finally:
+            with RegistrarAPI._latency_lock:
+                RegistrarAPI._latency_samples.append(time.perf_counter() - started)
+        r.raise_for_status()
+        return r.json()
+
+    def __register_one(self, course_data, user_id, timeout):
+        """Private method to register one course, hedged if the mode is on."""
+        if self.hedge_requests:
+            return self.__submit_hedged(course_data, user_id, timeout)
+        return self.__submit_registration(course_data, user_id, timeout)
+
+    def __hedge_delay(self):
+        """Private method returning how long to wait before sending a hedge, in seconds."""
+        with RegistrarAPI._latency_lock:
+            samples = sorted(RegistrarAPI._latency_samples)
+        if len(samples) < self.HEDGE_MIN_SAMPLES:
+            return self.HEDGE_DEFAULT_DELAY
+        index = min(int(len(samples) * self.HEDGE_PERCENTILE / 100), len(samples) - 1)
+        return samples[index]
+
+    def __submit_hedged(self, course_data, user_id, timeout):
+        """
+        Private method to send a registration, and a duplicate on a second
+        connection if the first is slower than the hedge delay. Whichever
+        answers first with a success wins. Because both copies may reach the
+        registrar, an "already registered" reply counts as success. Neither
+        copy is waited for beyond `timeout` seconds from the first send.
+        """
+        course_name = course_data['name']
+        give_up_at = time.perf_counter() + timeout
+
+        def attempt():
+            remaining = max(give_up_at - time.perf_counter(), self.MIN_REGISTER_TIMEOUT)
+            is_success, reason = self.__submit_registration(course_data, user_id, remaining)
+            if not is_success and already_registered(reason):
+                is_success, reason = True, course_name
+            return is_success, reason, time.perf_counter()
+
+        with self._hedge_lock:
+            self._hedge_calls += 1
+
+        delay = self.__hedge_delay()
+        # Not used as a context manager: a stalled loser must not block the winner.
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(attempt)
+            done, _ = wait([primary], timeout=min(delay, timeout))
+            if done:
+                is_success, reason, _ = primary.result()
+                return is_success, reason
+            if delay >= timeout:
+                return False, TransportFailure(f"Timed out after {timeout:.1f}s.", retryable=True)
+
+            print(f"   ⏱️ No answer for '{course_name}' after {delay * 1000:.0f} ms, sending a hedged request...")
+            event = {"course": course_name, "winner": None, "primary_done": None, "hedge_done": None}
+            with self._hedge_lock:
+                self._hedge_events.append(event)
+            primary.add_done_callback(lambda future: event.update(primary_done=future.result()[2]))
+            hedge = executor.submit(attempt)
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, timeout=max(give_up_at - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    return False, TransportFailure(f"Timed out after {timeout:.1f}s.", retryable=True)
+                for future in sorted(done, key=lambda f: f.result()[2]):
+                    is_success, reason, finished_at = future.result()
+                    if future is hedge:
+                        event["hedge_done"] = finished_at
+                    if is_success:
+                        event["winner"] = "hedge" if future is hedge else "primary"
+                        return is_success, reason
+
+            # Both copies failed; report the primary's reason.
+            event["winner"] = "primary"
+            is_success, reason, _ = primary.result()
+            return is_success, reason
+        finally:
+            executor.shutdown(wait=False)
+
+    def __submit_registration(self, course_data, user_id, timeout):
+        """Private method to send one registerSections request and parse the reply."""
+        sections_string = self.__build_sections_string(course_data)
+        course_name = course_data['name']
+        
+        print(f"📤 Registering '{course_data['name']}'...")
+        print(f"   Submitting sections: {sections_string}")
+        
+        try:
+            # --- Parse the response ---
+            response_data = self.__request_registration(sections_string, user_id, timeout)
+            message = response_data.get("message","")
+            if response_data.get("success") is True or "Registration Successful" in message:
+                print(f"   ✅ SUCCESS: Successfully registered '{course_name}'.")
+                return True, course_name
+            else:
+                # Extract the error message if available
+                error_message = response_data.get("message", "No reason provided.")
+                print(f"   ❌ FAILED: Could not register '{course_name}'. Reason: {error_message}")
+                return False, error_message   
+        except requests.exceptions.RequestException as e:
+            print(f"   ❌ An error occurred while registering '{course_name}': {e}")
+            return False, TransportFailure.from_exception(e)
+
+    def __split_batch_response(self, courses, response_data):
+        """
+        Private method to map a batched registerSections reply back onto the
+        individual courses. Returns a list of (is_success, reason) where
+        is_success is None when the reply says nothing about that course.
+        """
+        message = response_data.get("message", "") or ""
+        if response_data.get("success") is True:
+            return [(True, course['name']) for course in courses]
+
+        # Multi-course replies list one line per course (Drupal joins them with <br>).
+        lines = [line.strip() for line in message.replace("<br />", "\n").replace("<br>", "\n").splitlines() if line.strip()]
+        outcomes = []
+        for course in courses:
+            mentions = [
+                line for line in lines
+                if course['name'] in line or f"instance_{course['instance_id']}_" in line
+            ]
+            if not mentions:
+                outcomes.append((None, message or "No reason provided."))
+            elif any("Registration Successful" in line for line in mentions):
+                outcomes.append((True, course['name']))
+            else:
+                outcomes.append((False, " ".join(mentions)))
+        return outcomes
@@ -1,17 +1,46 @@
 from playwright.sync_api import sync_playwright, TimeoutError, Page, Browser
+import re
+import time
 import warnings
+from .browser_pool import CHROMIUM_ARGS
 
 # Suppress warnings
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 
+# Requests the scraper never needs: images, fonts, media and analytics.
+# Matched by URL (the browser applies the pattern itself, so requests that
+# are let through never make a round trip to Python). Stylesheets are only
+# blocked on request: ExtJS computes layout and visibility from its CSS.
+BLOCKED_RESOURCES = (
+    r"\.(png|jpe?g|gif|webp|svg|ico|bmp|woff2?|ttf|otf|eot|mp4|webm|mp3|wav|ogg)(\?|#|$)"
+    r"|google-analytics\.com|googletagmanager\.com|mc\.yandex\.ru|connect\.facebook\.net|hotjar\.com"
+)
+BLOCKED_STYLESHEETS = r"\.css(\?|#|$)"
+
+# Upper bounds for the event-driven waits (ms).
+LOGIN_TIMEOUT_MS = 15000
+SEARCH_TIMEOUT_MS = 10000
+# An added course's row shows SELECTED COURSE; wait for that, but never
+# longer than the fixed pause the add used to take.
+ADD_CONFIRM_TIMEOUT_MS = 500
+ADD_CONFIRM_POLL_SECONDS = 0.05
+TABLE_TIMEOUT_MS = 10000
+SECTIONS_TIMEOUT_MS = 5000
+
 class ScraperAPI:
     """
     Handles all browser-based interactions with the registrar website for the purpose of
     scraping course IDs. It encapsulates a Playwright browser instance.
     """
     
-    def __init__(self, headless=False, mode='test'):
-        """Initializes the Playwright instance and launches the browser."""
+    def __init__(self, headless=False, mode='test', context=None, block_resources=True, block_stylesheets=False):
+        """
+        Opens a page in `context` (a BrowserContext, e.g. from the worker's
+        BrowserPool, which keeps owning it). Without one, starts Playwright
+        and launches a browser of its own, closed again by close().
+        `block_resources` aborts images, fonts, media and analytics (plus
+        stylesheets with `block_stylesheets`) for every page of the context.
+        """
 
         # Determine URL based on mode
         if mode == 'real':
@@ -26,14 +55,31 @@ class ScraperAPI:
         self.COURSE_REG_URL = self.REG_PAGE_URL
         self.SCHEDULE_TABLE_URL = f"{self.BASE_URL}/my-registrar/course-registration/selected"
 
-        self._playwright = sync_playwright().start()
-        self._browser = self._playwright.chromium.launch(
-                headless=headless,
-                args=["--no-sandbox","--disable-setuid-sandbox"]
-                )
+        # Seconds spent in each phase (login, add, scrape) of this scraper.
+        self.timings = {}
+
+        if context is not None:
+            self._playwright = None
+            self._browser = None
+            self._page = context.new_page()
+            print(f"✅ ScraperAPI initialized in {mode} mode on a pooled browser.")
+        else:
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(
+                    headless=headless,
+                    args=CHROMIUM_ARGS
+                    )
+
+            self._page = self._browser.new_page()
+            print(f"✅ ScraperAPI initialized in {mode} mode, browser launched.")
+
+        if block_resources:
+            pattern = BLOCKED_RESOURCES + ("|" + BLOCKED_STYLESHEETS if block_stylesheets else "")
+            # On the context, so the extra tabs of _run_in_tabs are covered too.
+            self._page.context.route(re.compile(pattern, re.IGNORECASE), lambda route: route.abort())
 
-        self._page = self._browser.new_page()
-        print(f"✅ ScraperAPI initialized in {mode} mode, browser launched.")
+    def _timed(self, phase, started):
+        self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
 
 
     def login(self, credentials: dict):
@@ -42,8 +88,9 @@ class ScraperAPI:
         This is the first step before any scraping can occur.
         """
         print("--- Logging In ---")
+        started = time.perf_counter()
         try:
-            self._page.goto(self.LOGIN_URL)
+            self._page.goto(self.LOGIN_URL, wait_until="commit")
             self._page.wait_for_selector('input[name="name"]')
             self._page.fill('input[name="name"]', credentials.get('username'))
             self._page.fill('input[name="pass"]', credentials.get('password'))
@@ -52,8 +99,11 @@ class ScraperAPI:
             
             print("Waiting for 'Course registration' link to appear...")
             # Wait for navigation and click the main registration link
-            self._page.locator("a:text('Course registration')").click(timeout=15000)
-            self._page.wait_for_load_state('networkidle')
+            self._page.locator("a:text('Course registration')").click(timeout=LOGIN_TIMEOUT_MS)
+            # The session is established once the registration page starts
+            # loading; every later step navigates on its own, so there is no
+            # need to wait for the network to go idle here.
+            self._page.wait_for_url(f"{self.REG_PAGE_URL}**", wait_until="commit", timeout=LOGIN_TIMEOUT_MS)
             print("✅ Clicked 'Course registration' link.")
             return True
         except TimeoutError:
@@ -62,95 +112,214 @@ class ScraperAPI:
         except Exception as e:
             print(f"❌ An unexpected error occurred during login: {e}")
             return False
+        finally:
+            self._timed("login", started)
+
+    def _run_in_tabs(self, jobs, parallelism):
+        """
+        Runs `jobs` (callables page -> step generator) on up to `parallelism`
+        tabs of the logged-in context, a new job starting on whichever tab
+        frees up first.
 
-    def add_courses_to_schedule(self, course_names: list):
+        Playwright's sync API is single-threaded, so the tabs take turns: a
+        job yields right after starting something slow (a navigation, a
+        search) and the next tab gets to issue its own command while the
+        browser works on both. A job may yield a time.monotonic() deadline
+        to be resumed no earlier than that. With parallelism=1 this is the
+        plain sequential walk on self._page.
+        """
+        if not jobs:
+            return
+        parallelism = max(1, min(parallelism, len(jobs)))
+        extra_pages = [self._page.context.new_page() for _ in range(parallelism - 1)]
+        pending = list(jobs)
+        running = []  # [resume_at, order, page, steps]
+        order = 0
+
+        try:
+            for page in [self._page] + extra_pages:
+                running.append([0.0, order, page, pending.pop(0)(page)])
+                order += 1
+
+            while running:
+                running.sort(key=lambda entry: (entry[0], entry[1]))
+                entry = running[0]
+                delay = entry[0] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    resume_at = next(entry[3])
+                    entry[0] = resume_at if resume_at is not None else time.monotonic()
+                    entry[1] = order
+                except StopIteration:
+                    running.pop(0)
+                    if pending:
+                        running.append([0.0, order, entry[2], pending.pop(0)(entry[2])])
+                order += 1
+        finally:
+            for page in extra_pages:
+                page.close()
+
+    def add_courses_to_schedule(self, course_names: list, parallelism: int = 1):
         """
         Searches for each course by its code and adds it to the 'Selected Courses'
-        table, making it available for ID scraping.
+        table, making it available for ID scraping. With parallelism > 1,
+        that many tabs (never more than there are courses) search and add
+        courses at the same time.
         """
-        print("\n--- Adding Courses to Schedule Table ---")
-        for course_code in course_names:
-            print(f"Processing '{course_code}'...")
-            try:
-                self._page.goto(self.COURSE_REG_URL)
-                self._page.wait_for_selector('input[id="titleText-inputEl"]')
-                self._page.fill('input[id="titleText-inputEl"]', course_code)
-                self._page.click('span[id="show_courses_button-btnIconEl"]')
-                
-                course_row_selector = f"//tr[contains(., '{course_code}')]"
-                self._page.wait_for_selector(course_row_selector, timeout=10000)
-                print(f"  -> Search results for '{course_code}' loaded.")
+        if not course_names:
+            print("\nNo courses to add to the schedule table.")
+            return
+        tabs = max(1, min(parallelism, len(course_names)))
+        print(f"\n--- Adding Courses to Schedule Table ({tabs} tab(s)) ---")
+        started = time.perf_counter()
+        self._run_in_tabs(
+            [lambda page, code=course_code: self._add_course_steps(page, code) for course_code in course_names],
+            tabs,
+        )
+        self._timed("add", started)
 
-                if self._page.locator("//*[text()='SELECTED COURSE']").is_visible():
-                    print(f"  -> INFO: '{course_code}' is already in the schedule table. Skipping.")
-                    continue
+    def _add_course_steps(self, page, course_code):
+        print(f"Processing '{course_code}'...")
+        try:
+            page.goto(self.COURSE_REG_URL, wait_until="commit")
+            yield
+            page.wait_for_selector('input[id="titleText-inputEl"]')
+            page.fill('input[id="titleText-inputEl"]', course_code)
+            page.click('span[id="show_courses_button-btnIconEl"]')
+            yield
 
-                self._page.locator("//*[text()='OPEN']").click()
-                
-                add_button = self._page.locator("//a[@class='green-button' and contains(text(), 'Add to Selected Courses')]")
-                add_button.click()
-                print(f"  -> ✅ Clicked 'Add' for '{course_code}'.")
-                self._page.wait_for_timeout(500) # Brief pause to ensure action completes
+            course_row_selector = f"//tr[contains(., '{course_code}')]"
+            page.wait_for_selector(course_row_selector, timeout=SEARCH_TIMEOUT_MS)
+            print(f"  -> Search results for '{course_code}' loaded.")
 
-            except TimeoutError:
-                print(f"  -> ⚠️  Could not add '{course_code}'. It might not be 'OPEN', or is already selected/registered.")
-            except Exception as e:
-                print(f"  -> ❌ An unexpected error occurred while adding '{course_code}': {e}")
+            selected = page.locator("//*[text()='SELECTED COURSE']")
+            if selected.is_visible():
+                print(f"  -> INFO: '{course_code}' is already in the schedule table. Skipping.")
+                return
+
+            page.locator("//*[text()='OPEN']").click()
+
+            add_button = page.locator("//a[@class='green-button' and contains(text(), 'Add to Selected Courses')]")
+            add_button.click()
+            # Done once the row turns into SELECTED COURSE, at most the old
+            # fixed pause later. Other tabs keep going between checks.
+            give_up_at = time.monotonic() + ADD_CONFIRM_TIMEOUT_MS / 1000
+            while not selected.is_visible():
+                if time.monotonic() >= give_up_at:
+                    print(f"  -> ⚠️  '{course_code}' not shown as selected after {ADD_CONFIRM_TIMEOUT_MS} ms; continuing.")
+                    break
+                yield time.monotonic() + ADD_CONFIRM_POLL_SECONDS
+            print(f"  -> ✅ Clicked 'Add' for '{course_code}'.")
 
-    def scrape_all_course_ids(self, desired_schedule: dict) -> dict:
+        except TimeoutError:
+            print(f"  -> ⚠️  Could not add '{course_code}'. It might not be 'OPEN', or is already selected/registered.")
+        except Exception as e:
+            print(f"  -> ❌ An unexpected error occurred while adding '{course_code}': {e}")
+
+    def scrape_all_course_ids(self, desired_schedule: dict, parallelism: int = 1) -> dict:
         """
         Navigates to the 'Selected Courses' table and scrapes the instance, component,
-        and section IDs for each course listed.
+        and section IDs for each course listed. With parallelism > 1 the courses
+        are split between that many tabs (never more than there are courses),
+        each loading the table once.
         """
-        print("\n--- Navigating to Schedule Table to Scrape IDs ---")
-        self._page.goto(self.SCHEDULE_TABLE_URL)
-        self._page.wait_for_load_state('networkidle')
-        
+        course_codes = list(desired_schedule.keys())
+        if not course_codes:
+            print("\nNo courses to scrape IDs for.")
+            return {}
+        tabs = max(1, min(parallelism, len(course_codes)))
+        print(f"\n--- Navigating to Schedule Table to Scrape IDs ({tabs} tab(s)) ---")
+        started = time.perf_counter()
+        groups = [course_codes[i::tabs] for i in range(tabs)]
+
         scraped_course_map = {}
-        for course_code in desired_schedule.keys():
+        self._run_in_tabs(
+            [lambda page, group=group: self._scrape_steps(page, group, scraped_course_map) for group in groups],
+            len(groups),
+        )
+        self._timed("scrape", started)
+        # Same order as the schedule, whichever tab finished first.
+        return {code: scraped_course_map[code] for code in course_codes if code in scraped_course_map}
+
+    def _scrape_steps(self, page, course_codes, scraped_course_map):
+        try:
+            page.goto(self.SCHEDULE_TABLE_URL, wait_until="commit")
+            yield
+            # Each course waits for its own button (see _scrape_course) instead of networkidle.
+            page.wait_for_load_state('domcontentloaded')
+        except Exception as e:
+            print(f"  -> ❌ Could not load the schedule table for {', '.join(course_codes)}: {e}")
+            return
+
+        for course_code in course_codes:
+            course = self._scrape_course(page, course_code)
+            if course is not None:
+                scraped_course_map[course_code] = course
+            yield
+
+    def _scrape_course(self, page, course_code):
+        """Opens one course's section panel on `page` and parses it; None if that failed."""
+        try:
+            print(f"Scraping details for '{course_code}'...")
+            course_button_selector = f"//span[contains(text(), '{course_code.upper()} |')]"
+            course_button = page.locator(course_button_selector)
+
             try:
-                print(f"Scraping details for '{course_code}'...")
-                course_button_selector = f"//span[contains(text(), '{course_code.upper()} |')]"
-                course_button = self._page.locator(course_button_selector)
-
-                if not course_button.is_visible():
-                    print(f"  -> ⚠️  Could not find '{course_code}' in the schedule table. Was it added correctly?")
-                    continue
-                course_button.click()
-                
-                section_panel_selector = "div#instanceSectionsPanel"
-                self._page.wait_for_selector(section_panel_selector, state="visible", timeout=5000)
-                
-                scraped_course_map[course_code] = {"components": {}}
-                
-                inputs = self._page.locator(f'{section_panel_selector} input').all()
-                for inp in inputs:
-                    full_id = inp.get_attribute('id')
-                    if not full_id or 'instance' not in full_id: continue
-
-                    parts = full_id.split('_')
-                    instance_id = parts[1]
-                    comp_id = parts[3]
-                    sec_num = parts[5]
-                    comp_type_raw = inp.get_attribute('name')
-
-                    # Normalize component type (e.g., 'Lab', 'Lecture')
-                    comp_type_normalized = 'Lab' if 'Lab' in comp_type_raw else comp_type_raw
-                    
-                    scraped_course_map[course_code]['instance_id'] = instance_id
-                    if comp_type_normalized not in scraped_course_map[course_code]['components']:
-                        scraped_course_map[course_code]['components'][comp_type_normalized] = {
-                            "component_id": comp_id,
-                            "available_sections": []
-                        }
-                    scraped_course_map[course_code]['components'][comp_type_normalized]['available_sections'].append(sec_num)
-                print(f"  -> ✅ Scraped {len(inputs)} sections for '{course_code}'.")
+                course_button.wait_for(state="visible", timeout=TABLE_TIMEOUT_MS)
             except TimeoutError:
-                print(f"  -> ❌ Timed out waiting for section details for '{course_code}'.")
-            except Exception as e:
-                print(f"  -> ❌ An unexpected error occurred scraping '{course_code}': {e}")
-                
-        return scraped_course_map
+                print(f"  -> ⚠️  Could not find '{course_code}' in the schedule table. Was it added correctly?")
+                return None
+
+            section_panel_selector = "div#instanceSectionsPanel"
+            # The panel is reused between courses: wait until it shows inputs
+            # other than the previous course's, not merely until it is visible.
+            previous = page.locator(f'{section_panel_selector} input').evaluate_all(
+                "inputs => inputs.map(input => input.id).join(',')"
+            )
+            course_button.click()
+            page.wait_for_function(
+                """([panel, previous]) => {
+                    const el = document.querySelector(panel);
+                    if (!el || el.offsetParent === null) return false;
+                    const ids = Array.from(el.querySelectorAll('input'), input => input.id).join(',');
+                    return ids !== '' && ids !== previous;
+                }""",
+                arg=[section_panel_selector, previous],
+                timeout=SECTIONS_TIMEOUT_MS,
+            )
+
+            course = {"components": {}}
+
+            # One round trip for every (id, name) pair instead of two per input.
+            inputs = page.locator(f'{section_panel_selector} input').evaluate_all(
+                "inputs => inputs.map(input => [input.id, input.getAttribute('name')])"
+            )
+            for full_id, comp_type_raw in inputs:
+                if not full_id or 'instance' not in full_id: continue
+
+                parts = full_id.split('_')
+                instance_id = parts[1]
+                comp_id = parts[3]
+                sec_num = parts[5]
+
+                # Normalize component type (e.g., 'Lab', 'Lecture')
+                comp_type_normalized = 'Lab' if 'Lab' in comp_type_raw else comp_type_raw
+
+                course['instance_id'] = instance_id
+                if comp_type_normalized not in course['components']:
+                    course['components'][comp_type_normalized] = {
+                        "component_id": comp_id,
+                        "available_sections": []
+                    }
+                course['components'][comp_type_normalized]['available_sections'].append(sec_num)
+            print(f"  -> ✅ Scraped {len(inputs)} sections for '{course_code}'.")
+            return course
+        except TimeoutError:
+            print(f"  -> ❌ Timed out waiting for section details for '{course_code}'.")
+        except Exception as e:
+            print(f"  -> ❌ An unexpected error occurred scraping '{course_code}': {e}")
+        return None
 
 
     def validate_and_build_course_list(self, desired_schedule: dict, scraped_course_map: dict) -> dict:
@@ -220,7 +389,9 @@ class ScraperAPI:
 
     
     def close(self):
-        """Closes the browser and stops the Playwright instance."""
+        """Closes the browser and stops the Playwright instance (only if this object launched them)."""
+        if self._browser is None:
+            return
         print("\n--- Closing Browser ---")
         self._browser.close()
         self._playwright.stop()
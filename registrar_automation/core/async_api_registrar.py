@@ -0,0 +1,297 @@
+import asyncio
+import aiohttp
+import time
+import json
+import os
+from .html_extract import extract_csrf_token, extract_form_build_id, extract_drupal_settings
+from .api_registrar import RETRYABLE_STATUS_CODES, TransportFailure
+
+# Upper bound on open sockets for the whole process, shared by every student
+# session. The per-host cap keeps one mode (real/test) from starving the other.
+POOL_LIMIT = int(os.getenv('REGISTRAR_POOL_LIMIT', '200'))
+POOL_LIMIT_PER_HOST = int(os.getenv('REGISTRAR_POOL_LIMIT_PER_HOST', '100'))
+KEEPALIVE_TIMEOUT = 30
+# Every request is bounded (aiohttp's default is 300 s): a hung registrar must
+# not hold a session, or the web request waiting on it, for minutes.
+REQUEST_TIMEOUT = float(os.getenv('REGISTRAR_REQUEST_TIMEOUT', '15'))
+CONNECT_TIMEOUT = 5
+
+_shared_connector = None
+_shared_connector_loop = None
+
+
+def get_shared_connector():
+    """
+    Returns the process-wide connection pool for the running event loop.
+    Sessions borrow it without owning it, so keep-alive sockets survive
+    individual student sessions.
+    """
+    global _shared_connector, _shared_connector_loop
+    loop = asyncio.get_running_loop()
+    if _shared_connector is None or _shared_connector.closed or _shared_connector_loop is not loop:
+        _shared_connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+            ssl=False,
+        )
+        _shared_connector_loop = loop
+    return _shared_connector
+
+
+async def close_shared_connector():
+    """Closes the process-wide connection pool. Call once on shutdown."""
+    global _shared_connector, _shared_connector_loop
+    if _shared_connector is not None and not _shared_connector.closed:
+        await _shared_connector.close()
+    _shared_connector = None
+    _shared_connector_loop = None
+
+
+class AsyncRegistrarAPI:
+    """
+    asyncio counterpart of RegistrarAPI. Each instance holds one student's
+    cookies, while the sockets come from the shared pool above, so a single
+    process can drive hundreds of sessions concurrently.
+    """
+
+    # Seconds before an unanswered registerSections call gives up (as in RegistrarAPI).
+    REGISTER_TIMEOUT = 8
+
+    def __init__(self, session_cookies=None, mode='test'):
+
+        # Determine URL based on mode
+        if mode == 'real':
+            self.BASE_URL = "https://registrar.nu.edu.kz"
+        else:
+            self.BASE_URL = "https://testregistrar.nu.edu.kz"
+
+        self.LOGIN_URL = f"{self.BASE_URL}/user/login"
+        self.REG_PAGE_URL = f"{self.BASE_URL}/my-registrar/course-registration"
+        self.API_URL = f"{self.REG_PAGE_URL}/json"
+        self.GRADES_PAGE_URL = f"{self.BASE_URL}/my-registrar/check-grades"
+        self.MAIN_PAGE_URL = f"{self.BASE_URL}/my-registrar"
+
+        self._initial_cookies = session_cookies or {}
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # --- Public Methods ---
+
+    async def validate_login(self, username, password):
+        """
+        Validates credentials by attempting to log in, like
+        RegistrarAPI.validate_login: True once a session is established,
+        without fetching the CSRF token (registration may still be closed).
+        """
+        print(f"--- Validating Credentials Only (User: {username}) ---")
+        form_build_id = await self.__get_login_form_build_id()
+        if not form_build_id:
+            return False
+
+        login_payload = {
+            "name": username, "pass": password, "form_build_id": form_build_id,
+            "form_id": "user_login", "op": "Log in"
+        }
+
+        try:
+            async with self.__get_session().post(self.LOGIN_URL, data=login_payload) as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            if "user/logout" in text:
+                print("✅ Credentials valid (Login successful).")
+                return True
+            print("❌ Login failed (Invalid credentials).")
+            return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"❌ Validation error: {e}")
+            return False
+
+    async def login(self, username, password):
+        """
+        Performs the full login sequence.
+        Returns a tuple of (session_cookies, csrf_token) on success.
+        """
+        print("--- Starting Login Process (async) ---")
+        form_build_id = await self.__get_login_form_build_id()
+        if not form_build_id:
+            return None, None
+
+        print("Submitting credentials...")
+        login_payload = {
+            "name": username, "pass": password, "form_build_id": form_build_id,
+            "form_id": "user_login", "op": "Log in"
+        }
+
+        try:
+            async with self.__get_session().post(self.LOGIN_URL, data=login_payload) as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            if "user/logout" not in text:
+                print("❌ Login failed. Please double-check your credentials.")
+                return None, None
+            print("✅ Login successful.")
+
+            csrf_token = await self.__get_csrf_token_from_page()
+            if not csrf_token:
+                return None, None
+
+            return self.get_cookies(), csrf_token
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"❌ An error occurred during login request: {e}")
+            return None, None
+
+    async def fetch_csrf_token(self):
+        """
+        Public wrapper to explicitly fetch the CSRF token.
+        """
+        return await self.__get_csrf_token_from_page()
+
+    async def get_student_id(self):
+        """
+        Scrapes the student ID from the 'Check Grades' page.
+        """
+        print("--- Fetching Student ID ---")
+        try:
+            async with self.__get_session().get(self.GRADES_PAGE_URL) as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            data = extract_drupal_settings(text)
+            if data is None:
+                print("❌ Could not find the settings script tag on the grades page.")
+                return None
+
+            student_id = data['checkGrades']['studentDetails']['midterm']['STUDENTID']
+
+            if student_id:
+                print(f"✅ Found Student ID: {student_id}")
+                return student_id
+            else:
+                print("❌ Student ID not found in the page data.")
+                return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, KeyError, IndexError) as e:
+            print(f"❌ Failed to get or parse student ID: {e}")
+            return None
+
+    async def register_course(self, course_data, user_id, csrf_token, timeout=None):
+        """
+        Registers a single course, waiting at most `timeout` seconds (default
+        REGISTER_TIMEOUT). Returns (is_success, course_name_or_reason) exactly
+        like RegistrarAPI.register_course.
+        """
+        headers = {
+            "x-csrf-token": csrf_token,
+            "Referer": f"{self.REG_PAGE_URL}/selected",
+        }
+
+        component_parts = [
+            f"instance_{course_data['instance_id']}_component_{comp['component_id']}_section_{comp['section_id']}"
+            for comp in course_data['components']
+        ]
+        sections_string = "-".join(component_parts)
+
+        register_params = {
+            "_dc": str(int(time.time() * 1000)),
+            "method": "registerSections",
+            "sections": sections_string,
+            "userid": str(user_id)
+        }
+
+        course_name = course_data['name']
+
+        print(f"📤 Registering '{course_name}'...")
+        print(f"   Submitting sections: {sections_string}")
+
+        try:
+            request_timeout = aiohttp.ClientTimeout(total=timeout or self.REGISTER_TIMEOUT)
+            async with self.__get_session().get(self.API_URL, params=register_params, headers=headers, timeout=request_timeout) as resp:
+                resp.raise_for_status()
+                response_data = await resp.json(content_type=None)
+
+            message = response_data.get("message", "")
+            if response_data.get("success") is True or "Registration Successful" in message:
+                print(f"   ✅ SUCCESS: Successfully registered '{course_name}'.")
+                return True, course_name
+            else:
+                error_message = response_data.get("message", "No reason provided.")
+                print(f"   ❌ FAILED: Could not register '{course_name}'. Reason: {error_message}")
+                return False, error_message
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            print(f"   ❌ An error occurred while registering '{course_name}': {e}")
+            if isinstance(e, aiohttp.ClientResponseError):
+                retryable = e.status in RETRYABLE_STATUS_CODES
+            else:
+                # Timeouts, connection errors and replies that are not JSON.
+                retryable = isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError, json.JSONDecodeError))
+            return False, TransportFailure(str(e) or type(e).__name__, retryable)
+
+    def get_cookies(self):
+        """Returns the session cookies as a plain dict (same shape as RegistrarAPI.login)."""
+        if self._session is None:
+            return dict(self._initial_cookies)
+        return {cookie.key: cookie.value for cookie in self._session.cookie_jar}
+
+    async def close(self):
+        """Closes this student's session. The shared connection pool stays open."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # --- Private Methods ---
+
+    def __get_session(self):
+        """Private method to lazily create the session on the shared connector."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=get_shared_connector(),
+                connector_owner=False,
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=CONNECT_TIMEOUT),
+                headers={
+                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
+                },
+            )
+            if self._initial_cookies:
+                self._session.cookie_jar.update_cookies(self._initial_cookies)
+        return self._session
+
+    async def __get_login_form_build_id(self):
+        """Private method to scrape the form_build_id from the login page."""
+        print("Fetching login page for form_build_id...")
+        try:
+            async with self.__get_session().get(self.LOGIN_URL) as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            form_id = extract_form_build_id(text)
+            if not form_id:
+                print("❌ Could not find form_build_id on the login page.")
+                return None
+            print(f"✅ Found form_build_id: {form_id[:15]}...")
+            return form_id
+        except (aiohttp.ClientError, asyncio.TimeoutError, AttributeError) as e:
+            print(f"❌ Failed to get form_build_id: {e}")
+            return None
+
+    async def __get_csrf_token_from_page(self):
+        """Private method to scrape the CSRF token from the main registration page."""
+        print("\n--- Fetching CSRF Token for Registration ---")
+        try:
+            async with self.__get_session().get(self.MAIN_PAGE_URL) as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            token = extract_csrf_token(text)
+            if not token:
+                print("❌ Could not find the 'csrf-token' meta tag.")
+                return None
+            print(f"✅ Found CSRF Token: {token[:10]}...")
+            return token
+        except (aiohttp.ClientError, asyncio.TimeoutError, AttributeError) as e:
+            print(f"❌ Failed to get or parse the CSRF token: {e}")
+            return None
@@ -0,0 +1,174 @@
+# core/browser_pool.py
+
+import os
+import time
+from contextlib import contextmanager
+
+from playwright.sync_api import sync_playwright
+
+# One Chromium per worker process, shared by every scraping task it runs.
+#
+# Launching Playwright and Chromium takes seconds; a BrowserContext takes
+# milliseconds and is just as isolated (own cookies, storage and cache), so
+# each task gets a fresh context from a long-lived browser. The browser is
+# relaunched after BROWSER_MAX_TASKS tasks, when the browser processes use
+# more than BROWSER_MAX_RSS_MB, or when it has crashed, which bounds
+# whatever Chromium leaks. Celery prefork children each get their own pool
+# (the Playwright connection cannot cross a fork); it is started on first
+# use and closed on worker_process_shutdown (see core/scrape_tasks.py).
+
+BROWSER_MAX_TASKS = int(os.getenv('BROWSER_MAX_TASKS', '50'))
+BROWSER_MAX_RSS_MB = float(os.getenv('BROWSER_MAX_RSS_MB', '1024'))
+CHROMIUM_ARGS = ["--no-sandbox", "--disable-setuid-sandbox"]
+
+_pool = None
+
+
+def _descendants_rss_mb(root_pid):
+    """Resident memory (MB) of every process below `root_pid`, or None where /proc is unavailable."""
+    try:
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; fields resume after ')'.
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return None
+
+    total_kb = 0
+    stack = list(children.get(root_pid, []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class BrowserPool:
+    """
+    Hands out fresh BrowserContexts from a browser that outlives the task.
+    Not thread-safe: Playwright's sync API belongs to the thread that started it.
+    """
+
+    def __init__(self, headless=True, max_tasks=BROWSER_MAX_TASKS, max_rss_mb=BROWSER_MAX_RSS_MB):
+        self.headless = headless
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self._playwright = None
+        self._browser = None
+        self._browser_tasks = 0
+        self.pid = os.getpid()
+        self.stats = {
+            "launches": 0, "launch_seconds": 0.0, "recycles": 0,
+            "cold_tasks": 0, "cold_seconds": 0.0, "warm_tasks": 0, "warm_seconds": 0.0,
+        }
+
+    def _launch(self):
+        started = time.perf_counter()
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=self.headless, args=CHROMIUM_ARGS)
+        self._browser_tasks = 0
+        self.stats["launches"] += 1
+        self.stats["launch_seconds"] += time.perf_counter() - started
+        print(f"✅ [BrowserPool] Chromium launched in {time.perf_counter() - started:.2f}s.")
+
+    def _close_browser(self, reason):
+        if self._browser is None:
+            return
+        print(f"♻️ [BrowserPool] Closing Chromium after {self._browser_tasks} task(s): {reason}.")
+        try:
+            self._browser.close()
+        except Exception as e:
+            print(f"⚠️ [BrowserPool] Chromium did not close cleanly: {e}")
+        self._browser = None
+
+    def _recycle_reason(self):
+        if self._browser_tasks >= self.max_tasks:
+            return f"{self._browser_tasks} tasks"
+        rss = _descendants_rss_mb(os.getpid())
+        if rss is not None and rss > self.max_rss_mb:
+            return f"{rss:.0f} MB resident"
+        return None
+
+    @contextmanager
+    def context(self, **context_options):
+        """
+        Yields a new BrowserContext (options go to browser.new_context) and
+        closes it afterwards. Launches Chromium first if there is none or the
+        previous one died; such a task counts as cold in the stats.
+        """
+        started = time.perf_counter()
+        cold = self._browser is None or not self._browser.is_connected()
+        if cold:
+            self._browser = None
+            self._launch()
+
+        context = self._browser.new_context(**context_options)
+        try:
+            yield context
+        finally:
+            try:
+                context.close()
+            except Exception as e:
+                # A task interrupted mid-call (e.g. by its soft time limit)
+                # can leave the browser wedged; start over with a new one.
+                self._close_browser(f"context did not close ({e})")
+            self._browser_tasks += 1
+
+            kind = "cold" if cold else "warm"
+            self.stats[f"{kind}_tasks"] += 1
+            self.stats[f"{kind}_seconds"] += time.perf_counter() - started
+
+            reason = self._recycle_reason() if self._browser is not None else None
+            if reason:
+                self.stats["recycles"] += 1
+                self._close_browser(reason)
+
+    def report(self):
+        """Launch count and average cold (browser launched) vs warm task time, in seconds."""
+        stats = self.stats
+        return {
+            "launches": stats["launches"],
+            "recycles": stats["recycles"],
+            "avg_launch_s": stats["launch_seconds"] / stats["launches"] if stats["launches"] else None,
+            "cold_tasks": stats["cold_tasks"],
+            "avg_cold_task_s": stats["cold_seconds"] / stats["cold_tasks"] if stats["cold_tasks"] else None,
+            "warm_tasks": stats["warm_tasks"],
+            "avg_warm_task_s": stats["warm_seconds"] / stats["warm_tasks"] if stats["warm_tasks"] else None,
+            "browser_rss_mb": _descendants_rss_mb(os.getpid()),
+        }
+
+    def close(self):
+        self._close_browser("shutting down")
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+
+def get_browser_pool():
+    """This process's pool, created on first use (so after any fork)."""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = BrowserPool()
+    return _pool
+
+
+def close_browser_pool():
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.close()
+    _pool = None
@@ -11,16 +11,46 @@ from celery import Celery
 
 redis_url = os.getenv('CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
 
+# Which tasks this process loads when it runs as a worker:
+#   'registration' - pre_login/run_registration only, tuned for latency, no Playwright
+#   'scraper'      - the browser-based tasks only
+#   'all'          - everything (default; also drains messages left on the old 'celery' queue)
+WORKER_PROFILE = os.getenv('CELERY_WORKER_PROFILE', 'all')
+
+PROFILE_MODULES = {
+    'registration': ['core.tasks'],
+    'scraper': ['core.scrape_tasks'],
+    'all': ['core.tasks', 'core.scrape_tasks'],
+}
+
+REGISTRATION_QUEUE = 'registration_queue'
+SCRAPER_QUEUE = 'scraper_queue'
+
+# On Redis, priorities are separate lists polled in order, lowest number first.
+# A run_registration at T-0 must never wait behind a pre_login (T-12).
+PRIORITY_REGISTRATION = 0
+PRIORITY_PRE_LOGIN = 3
+
+TASK_ROUTES = {
+        'tasks.run_registration': {'queue': REGISTRATION_QUEUE, 'priority': PRIORITY_REGISTRATION},
+        'tasks.pre_login': {'queue': REGISTRATION_QUEUE, 'priority': PRIORITY_PRE_LOGIN},
+        'tasks.update_course_ids': {'queue': SCRAPER_QUEUE}
+        }
+
+BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': [PRIORITY_REGISTRATION, PRIORITY_PRE_LOGIN, 6, 9],
+    'queue_order_strategy': 'priority',
+}
+
 celery_app = Celery(
     'tasks',
     broker=redis_url,
     backend=redis_url,
-    include=['core.tasks']  # Point to the module where tasks are defined
+    include=PROFILE_MODULES.get(WORKER_PROFILE, PROFILE_MODULES['all'])  # Modules where tasks are defined
 )
 
-celery_app.conf.task_routes = {
-        'tasks.update_course_ids': {'queue': 'scraper_queue'}
-        }
+celery_app.conf.task_routes = TASK_ROUTES
+celery_app.conf.broker_transport_options = BROKER_TRANSPORT_OPTIONS
 
 # Optional configuration
 celery_app.conf.update(
@@ -31,5 +61,16 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
+if WORKER_PROFILE == 'registration':
+    celery_app.conf.update(
+        # Reserve nothing: a prefetched T-0 job would wait behind the task
+        # this process is already running.
+        worker_prefetch_multiplier=1,
+        # Ack on receipt. A redelivered registration is dropped by its
+        # dispatch token anyway, and late acks only delay the next fetch.
+        task_acks_late=False,
+        worker_disable_rate_limits=True,
+    )
+
 if __name__ == '__main__':
     celery_app.start()
@@ -0,0 +1,93 @@
+# core/clock_calibration.py
+
+import time
+import statistics
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Offsets follow ntplib's convention: offset = server clock - local clock, so
+# server_now = time.time() + offset and a server instant T happens locally at
+# T - offset.
+
+DEFAULT_SAMPLES = 10
+
+
+def calibrate_server_clock(url, samples=DEFAULT_SAMPLES, session=None, timeout=5):
+    """
+    Estimates the offset of the server's clock from the `Date` headers of
+    `samples` HEAD requests to `url`.
+
+    A Date header only has one-second resolution, but it still bounds the
+    offset: the server stamped it at some moment between our send (t0) and
+    receive (t1), and its clock then read somewhere in [D, D + 1). So
+        D - t1 <= offset < D + 1 - t0.
+    Requests are spread evenly over one second (or sent back to back when the
+    round trip is longer), so they land at different phases of the server's
+    second and their bounds cut the interval from different sides;
+    intersecting them gives the estimate and its error bar.
+
+    Returns a dict with 'offset' and 'error' (seconds, the estimate is
+    offset ± error), 'samples' and 'rtt_ms' (median round trip), or None if
+    no usable response came back.
+    """
+    session = session or requests.Session()
+    bounds = []
+    rtts = []
+
+    # The first request pays for the connection set-up; it would only widen the bounds.
+    try:
+        session.head(url, verify=False, timeout=timeout)
+    except requests.exceptions.RequestException:
+        pass
+
+    started = time.time()
+    for index in range(samples):
+        delay = started + index / samples - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        t0 = time.time()
+        try:
+            response = session.head(url, verify=False, timeout=timeout, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ [ClockCalibration] Sample {index + 1} failed: {e}")
+            continue
+        t1 = time.time()
+
+        date_header = response.headers.get("Date")
+        if not date_header:
+            continue
+        try:
+            server_second = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            continue
+
+        bounds.append((server_second - t1, server_second + 1 - t0))
+        rtts.append(t1 - t0)
+
+    if not bounds:
+        print("⚠️ [ClockCalibration] No usable Date headers; cannot calibrate.")
+        return None
+
+    low = max(lower for lower, _ in bounds)
+    high = min(upper for _, upper in bounds)
+    median_rtt = statistics.median(rtts)
+
+    if low <= high:
+        offset = (low + high) / 2
+        error = (high - low) / 2
+    else:
+        # Inconsistent samples (e.g. a request queued inside the server): fall
+        # back to the median of per-sample midpoints with a pessimistic bar.
+        offset = statistics.median((lower + upper) / 2 for lower, upper in bounds)
+        error = 0.5 + median_rtt / 2
+
+    result = {
+        "offset": offset,
+        "error": error,
+        "samples": len(bounds),
+        "rtt_ms": round(median_rtt * 1000, 1),
+    }
+    print(f"✅ [ClockCalibration] Server clock offset {offset:+.4f}s ± {error:.4f}s from {len(bounds)} samples.")
+    return result
+
@@ -0,0 +1,224 @@
+# core/dispatch_metrics.py
+
+import os
+import time
+import argparse
+
+from .redis_client import get_redis
+
+# How late scheduled jobs actually run.
+#
+# For every job the scheduler dispatches we keep four timestamps, in
+# dispatch:timing:{token}:
+#   scheduled  - the job's fire time from the schedule index
+#   dispatched - when a scheduler claimed it
+#   published  - when its Celery message reached the broker
+#   started    - when a worker began running it
+# Each stage's lag behind `scheduled` goes into fixed-bucket histograms:
+#   metrics:lag:{second}         - hash per scheduled second, field "{kind}:{stage}:{le}" -> count
+#   metrics:lag:minute:{minute}  - the same per scheduled minute (keyed by its first second),
+#                                  so long windows are read 60x cheaper
+#   metrics:lag:total            - the same, never bucketed by time (for /metrics)
+# Timestamps come from different hosts, so cross-host stages (started) are
+# only as good as their NTP sync.
+
+redis_client = get_redis()
+
+TIMING_KEY = "dispatch:timing:{}"
+LAG_KEY = "metrics:lag:{}"
+LAG_MINUTE_KEY = "metrics:lag:minute:{}"
+LAG_TOTAL_KEY = "metrics:lag:total"
+
+STAGES = ("dispatched", "published", "started")
+# Upper bounds of the histogram buckets, in milliseconds.
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+METRICS_TTL = int(os.getenv('DISPATCH_METRICS_TTL', str(2 * 24 * 3600)))
+
+# lag_report() reads one hash per bucket: per second up to SECOND_REPORT_WINDOW,
+# per minute beyond that, and never more than MAX_REPORT_WINDOW (1440 reads).
+SECOND_REPORT_WINDOW = 600
+MAX_REPORT_WINDOW = 24 * 3600
+
+
+def _bucket(lag_ms):
+    for bound in LAG_BUCKETS_MS:
+        if lag_ms <= bound:
+            return "inf" if bound == float("inf") else str(bound)
+
+
+def _record_lags(pipe, samples):
+    """Adds (kind, stage, scheduled, at) samples to the histograms, one HINCRBY per distinct bucket."""
+    per_second = {}
+    per_minute = {}
+    for kind, stage, scheduled, at in samples:
+        field = f"{kind}:{stage}:{_bucket(max((at - scheduled) * 1000, 0))}"
+        second = int(scheduled)
+        per_second[(second, field)] = per_second.get((second, field), 0) + 1
+        per_minute[(second - second % 60, field)] = per_minute.get((second - second % 60, field), 0) + 1
+
+    for (second, field), count in per_second.items():
+        pipe.hincrby(LAG_KEY.format(second), field, count)
+    for (minute, field), count in per_minute.items():
+        pipe.hincrby(LAG_MINUTE_KEY.format(minute), field, count)
+        pipe.hincrby(LAG_TOTAL_KEY, field, count)
+    for second in {second for second, _ in per_second}:
+        pipe.expire(LAG_KEY.format(second), METRICS_TTL)
+    for minute in {minute for minute, _ in per_minute}:
+        pipe.expire(LAG_MINUTE_KEY.format(minute), METRICS_TTL)
+
+
+def record_dispatches(pipe, jobs, dispatched, published):
+    """
+    Queues the scheduler-side timestamps of a dispatched batch of
+    (token, kind, scheduled) on `pipe` (the scheduler's bookkeeping
+    pipeline, so this costs no extra round trip).
+    """
+    samples = []
+    for token, kind, scheduled in jobs:
+        pipe.hset(TIMING_KEY.format(token), mapping={
+            "kind": kind, "scheduled": scheduled, "dispatched": dispatched, "published": published
+        })
+        pipe.expire(TIMING_KEY.format(token), METRICS_TTL)
+        samples.append((kind, "dispatched", scheduled, dispatched))
+        samples.append((kind, "published", scheduled, published))
+    _record_lags(pipe, samples)
+
+
+def record_worker_start(client, token, started=None):
+    """
+    Called by a worker when it starts a scheduled task. Adds the start lag
+    to the histograms and returns the job's timing record, or None if the
+    task was not dispatched by the scheduler (or its record expired).
+    """
+    if not token:
+        return None
+    started = started or time.time()
+    timing = client.hgetall(TIMING_KEY.format(token))
+    if not timing:
+        return None
+
+    pipe = client.pipeline(transaction=False)
+    pipe.hset(TIMING_KEY.format(token), "started", started)
+    _record_lags(pipe, [(timing["kind"], "started", float(timing["scheduled"]), started)])
+    pipe.execute()
+    timing["started"] = started
+    return timing
+
+
+def _percentile(counts, q):
+    """
+    Estimates the q-th percentile (0..1) in ms from {bucket upper bound: count},
+    interpolating linearly inside the bucket like Prometheus does.
+    """
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    lower = 0.0
+    for bound in LAG_BUCKETS_MS:
+        count = counts.get(bound, 0)
+        if count and seen + count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound
+    return lower
+
+
+def _parse_histograms(fields):
+    """{"kind:stage:le": count} -> {(kind, stage): {le: count}}"""
+    histograms = {}
+    for field, count in fields.items():
+        kind, stage, bound = field.rsplit(":", 2)
+        bound = float("inf") if bound == "inf" else float(bound)
+        histograms.setdefault((kind, stage), {})[bound] = int(count)
+    return histograms
+
+
+def lag_report(client=None, start=None, end=None, kind=None):
+    """
+    Lag summary for jobs scheduled in [start, end] (epoch seconds, default:
+    the last hour), per second for windows up to SECOND_REPORT_WINDOW and per
+    minute for longer ones. Returns a list of dicts with second (start of the
+    bucket), width (its length in seconds), kind, stage, count and
+    p50/p95/p99 in milliseconds, oldest first. Raises ValueError for a window
+    wider than MAX_REPORT_WINDOW.
+    """
+    client = client or redis_client
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 3600
+    if end - start > MAX_REPORT_WINDOW:
+        raise ValueError(f"Window is longer than {MAX_REPORT_WINDOW} seconds.")
+
+    if end - start <= SECOND_REPORT_WINDOW:
+        width, key = 1, LAG_KEY
+    else:
+        width, key = 60, LAG_MINUTE_KEY
+    seconds = range(int(start) - int(start) % width, int(end) + 1, width)
+    pipe = client.pipeline(transaction=False)
+    for second in seconds:
+        pipe.hgetall(key.format(second))
+
+    rows = []
+    for second, fields in zip(seconds, pipe.execute()):
+        histograms = sorted(_parse_histograms(fields).items(), key=lambda item: (item[0][0], STAGES.index(item[0][1])))
+        for (job_kind, stage), counts in histograms:
+            if kind and job_kind != kind:
+                continue
+            rows.append({
+                "second": second,
+                "width": width,
+                "kind": job_kind,
+                "stage": stage,
+                "count": sum(counts.values()),
+                "p50": _percentile(counts, 0.50),
+                "p95": _percentile(counts, 0.95),
+                "p99": _percentile(counts, 0.99),
+            })
+    return rows
+
+
+def prometheus_text(client=None):
+    """All-time lag histograms in the Prometheus text exposition format."""
+    client = client or redis_client
+    lines = [
+        "# HELP scheduler_dispatch_lag_ms How far behind its scheduled time a job reached each stage.",
+        "# TYPE scheduler_dispatch_lag_ms histogram",
+    ]
+    for (kind, stage), counts in sorted(_parse_histograms(client.hgetall(LAG_TOTAL_KEY)).items()):
+        cumulative = 0
+        for bound in LAG_BUCKETS_MS:
+            cumulative += counts.get(bound, 0)
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f'scheduler_dispatch_lag_ms_bucket{{kind="{kind}",stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'scheduler_dispatch_lag_ms_count{{kind="{kind}",stage="{stage}"}} {cumulative}')
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch lag of scheduled jobs (ms), per second or per minute.")
+    parser.add_argument("--last", type=int, default=3600,
+                        help=f"seconds of history to show (per minute above {SECOND_REPORT_WINDOW}, "
+                             f"at most {MAX_REPORT_WINDOW})")
+    parser.add_argument("--kind", choices=("pre_login", "registration"))
+    args = parser.parse_args()
+    if args.last > MAX_REPORT_WINDOW:
+        parser.error(f"--last is limited to {MAX_REPORT_WINDOW} seconds")
+
+    now = time.time()
+    rows = lag_report(start=now - args.last, end=now, kind=args.kind)
+    if not rows:
+        print(f"No dispatches recorded in the last {args.last}s.")
+        return
+
+    print(f"{'scheduled':<21}{'kind':<14}{'stage':<12}{'jobs':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for row in rows:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["second"]))
+        print(f"{stamp:<21}{row['kind']:<14}{row['stage']:<12}{row['count']:>6}"
+              f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
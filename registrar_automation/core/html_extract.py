@@ -0,0 +1,95 @@
+# core/html_extract.py
+
+import re
+import json
+
+# Fast-path extractors for the handful of values we read from registrar pages.
+# Each one scans the raw HTML for a known marker and only falls back to a full
+# BeautifulSoup parse when the scan misses (e.g. the markup changed).
+
+_ATTR_PATTERNS = {
+    name: re.compile(rf'(?<![\w-]){name}\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+    for name in ("content", "value")
+}
+_CSRF_MARKER = re.compile(r'name\s*=\s*["\']csrf-token["\']', re.IGNORECASE)
+_FORM_BUILD_ID_MARKER = re.compile(r'name\s*=\s*["\']form_build_id["\']', re.IGNORECASE)
+_DRUPAL_SETTINGS_PREFIX = 'jQuery.extend(Drupal.settings, '
+
+
+def scan_csrf_token(html):
+    """
+    Fast path only: returns the csrf-token meta content, or None if the tag is
+    not (yet) in `html`. Safe to call on a partially downloaded page.
+    """
+    return _scan_tag_attribute(html, _CSRF_MARKER, "content")
+
+
+def scan_form_build_id(html):
+    """Fast path only: returns the form_build_id input value, or None. Safe on partial pages."""
+    return _scan_tag_attribute(html, _FORM_BUILD_ID_MARKER, "value")
+
+
+def extract_csrf_token(html):
+    """Returns the content of <meta name="csrf-token">, or None."""
+    value = scan_csrf_token(html)
+    if value is not None:
+        return value
+
+    soup = _full_parse(html)
+    tag = soup.find('meta', {'name': 'csrf-token'})
+    return tag.get('content') if tag else None
+
+
+def extract_form_build_id(html):
+    """Returns the value of <input name="form_build_id">, or None."""
+    value = scan_form_build_id(html)
+    if value is not None:
+        return value
+
+    soup = _full_parse(html)
+    tag = soup.find('input', {'name': 'form_build_id'})
+    return tag.get('value') if tag else None
+
+
+def extract_drupal_settings(html):
+    """
+    Returns the object passed to jQuery.extend(Drupal.settings, ...) as a dict,
+    or None if the page has no settings script.
+    Raises json.JSONDecodeError if the blob is present but malformed.
+    """
+    start = html.find(_DRUPAL_SETTINGS_PREFIX)
+    if start != -1:
+        start += len(_DRUPAL_SETTINGS_PREFIX)
+        script_end = html.find('</script>', start)
+        end = html.rfind(');', start, script_end if script_end != -1 else len(html))
+        if end != -1:
+            return json.loads(html[start:end])
+
+    soup = _full_parse(html)
+    script_tag = soup.find('script', string=lambda text: text and 'Drupal.settings' in text)
+    if not script_tag or _DRUPAL_SETTINGS_PREFIX not in script_tag.string:
+        return None
+    json_string = script_tag.string.split(_DRUPAL_SETTINGS_PREFIX, 1)[1].rsplit(');', 1)[0]
+    return json.loads(json_string)
+
+
+def _scan_tag_attribute(html, marker, attribute):
+    """
+    Finds the tag containing `marker` and returns its `attribute` value,
+    without parsing the rest of the document.
+    """
+    match = marker.search(html)
+    if not match:
+        return None
+    tag_start = html.rfind('<', 0, match.start())
+    tag_end = html.find('>', match.end())
+    if tag_start == -1 or tag_end == -1:
+        return None
+    attr_match = _ATTR_PATTERNS[attribute].search(html, tag_start, tag_end)
+    return attr_match.group(2) if attr_match else None
+
+
+def _full_parse(html):
+    """Slow path: a complete BeautifulSoup parse, imported only when needed."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
@@ -0,0 +1,32 @@
+# core/notification_outbox.py
+
+import os
+import time
+
+# Outbox for Telegram notifications.
+#
+# Producers (Celery tasks, the web API) append messages to a Redis stream
+# with one XADD and move on; nothing on their path talks to Telegram.
+# The sender service (`python -m core.notification_sender`) drains the
+# stream through a consumer group, so a message stays pending until it is
+# delivered or given up on, and survives a sender restart:
+#   notifications:outbox  - stream of {chat_id, text, parse_mode, enqueued_at}
+#   notifications:dead    - messages that could not be delivered, with the reason
+
+OUTBOX_STREAM = "notifications:outbox"
+DEAD_LETTER_STREAM = "notifications:dead"
+OUTBOX_GROUP = "senders"
+
+# Approximate cap on the stream length; trimmed entries are long delivered.
+OUTBOX_MAXLEN = int(os.getenv('NOTIFICATION_OUTBOX_MAXLEN', '100000'))
+
+
+def enqueue_notification(client, chat_id, text, parse_mode="Markdown"):
+    """
+    Appends one message to the outbox and returns its stream id. `client`
+    may be a pipeline or an asyncio client (then the result is awaited).
+    """
+    fields = {"chat_id": chat_id, "text": text, "enqueued_at": time.time()}
+    if parse_mode:
+        fields["parse_mode"] = parse_mode
+    return client.xadd(OUTBOX_STREAM, fields, maxlen=OUTBOX_MAXLEN, approximate=True)
@@ -0,0 +1,378 @@
+# core/notification_sender.py
+
+import os
+import time
+import asyncio
+
+import aiohttp
+import redis
+
+from .redis_client import get_async_redis, REDIS_HOST
+from .notification_outbox import OUTBOX_STREAM, DEAD_LETTER_STREAM, OUTBOX_GROUP
+
+# Delivers the notification outbox (see core/notification_outbox.py) to Telegram.
+#
+# One asyncio process: a reader task pulls new stream entries into per-chat
+# queues, and a dispatcher sends them over one pooled HTTP session while
+# staying under Telegram's limits (about 30 messages/s per bot, 1/s per chat).
+# Messages that pile up for a chat while it waits for its next slot are
+# coalesced into a single message. Failures are retried with exponential
+# backoff (429s wait for Telegram's retry_after); undeliverable messages go
+# to the dead-letter stream. An entry is acknowledged only after that, so a
+# restarted sender picks up whatever the previous run had not finished.
+# Per-chat limits are tracked in memory: run one sender per deployment.
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+CONSUMER_NAME = os.getenv('NOTIFIER_CONSUMER', 'notifier')
+
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1.0'))
+MAX_CONNECTIONS = int(os.getenv('TELEGRAM_MAX_CONNECTIONS', '16'))
+MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+REQUEST_TIMEOUT = 10
+
+# Telegram rejects longer texts.
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = "\n\n"
+
+READ_BATCH = 500
+READ_BLOCK_MS = 5000
+# Backoff between failed outbox reads.
+READ_RETRY_BASE_DELAY = 1.0
+READ_RETRY_MAX_DELAY = 30.0
+# Every RECLAIM_INTERVAL seconds, entries left unacknowledged for
+# RECLAIM_IDLE_MS (a failed XACK, a crashed sender) are taken back with XAUTOCLAIM.
+RECLAIM_INTERVAL = 10.0
+RECLAIM_IDLE_MS = 30000
+# The reader pauses while this many messages wait in memory.
+MAX_BUFFERED = 10000
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until the next event is allowed (0 if now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class ChatQueue:
+    def __init__(self):
+        self.messages = []
+        self.ready_at = 0.0
+        self.busy = False
+
+
+class NotificationSender:
+    def __init__(self, client=None, api_url=None, token=None, consumer=CONSUMER_NAME,
+                 global_rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL, max_connections=MAX_CONNECTIONS):
+        self.client = client or get_async_redis()
+        self.url = f"{api_url or TELEGRAM_API_URL}/bot{token or BOT_TOKEN}/sendMessage"
+        self.consumer = consumer
+        # No burst allowance: Telegram counts over any one-second window.
+        self.bucket = TokenBucket(global_rate, burst=1)
+        self.chat_interval = chat_interval
+        self.max_connections = max_connections
+
+        self.chats = {}
+        self.buffered = 0
+        # Stream ids held in memory, so a reclaim does not queue them twice.
+        self.buffered_ids = set()
+        # Delivered messages whose XACK failed: acknowledged, not re-sent, when reclaimed.
+        self.delivered_unacked = set()
+        self.in_flight = set()
+        self.session = None
+        self.wake = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.stats = {"delivered": 0, "requests": 0, "retries": 0, "rate_limited": 0, "dead": 0, "max_lag": 0.0}
+
+    async def ensure_group(self):
+        try:
+            await self.client.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _buffer(self, entries):
+        entries = [(entry_id, fields) for entry_id, fields in entries if entry_id not in self.buffered_ids]
+        for entry_id, fields in entries:
+            self.buffered_ids.add(entry_id)
+            chat = self.chats.get(fields["chat_id"])
+            if chat is None:
+                chat = self.chats[fields["chat_id"]] = ChatQueue()
+            chat.messages.append({
+                "id": entry_id,
+                "chat_id": fields["chat_id"],
+                "text": fields.get("text", ""),
+                "parse_mode": fields.get("parse_mode"),
+                "enqueued_at": float(fields.get("enqueued_at", time.time())),
+                "attempts": 0,
+            })
+            self.buffered += 1
+        if entries:
+            self.wake.set()
+
+    async def _read(self, stream_id, block=None):
+        response = await self.client.xreadgroup(
+            OUTBOX_GROUP, self.consumer, {OUTBOX_STREAM: stream_id}, count=READ_BATCH, block=block
+        )
+        return response[0][1] if response else []
+
+    async def _reclaim(self):
+        """
+        Takes over entries nobody acknowledged for RECLAIM_IDLE_MS and queues
+        them again; ones already delivered are only acknowledged.
+        """
+        start_id = "0-0"
+        while True:
+            response = await self.client.xautoclaim(
+                OUTBOX_STREAM, OUTBOX_GROUP, self.consumer, RECLAIM_IDLE_MS, start_id=start_id, count=READ_BATCH
+            )
+            start_id, entries = response[0], response[1]
+            # Entries deleted from the stream meanwhile come back empty.
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            delivered = [entry_id for entry_id, _ in entries if entry_id in self.delivered_unacked]
+            if delivered:
+                await self.client.xack(OUTBOX_STREAM, OUTBOX_GROUP, *delivered)
+                self.delivered_unacked.difference_update(delivered)
+            fresh = [(entry_id, fields) for entry_id, fields in entries if entry_id not in self.buffered_ids and entry_id not in delivered]
+            if fresh:
+                print(f"♻️ [Notifier] Reclaimed {len(fresh)} unacknowledged message(s).")
+                self._buffer(fresh)
+            if start_id in ("0-0", b"0-0"):
+                return
+
+    async def read_loop(self):
+        # Entries this consumer read but never acknowledged (previous run)
+        # come first; ">" then reads new ones.
+        last_id = "0"
+        recreate_group = False
+        delay = READ_RETRY_BASE_DELAY
+        next_reclaim = time.monotonic() + RECLAIM_INTERVAL
+        while not self.stopping.is_set():
+            if last_id == ">" and self.buffered >= MAX_BUFFERED:
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                if recreate_group:
+                    await self.ensure_group()
+                    recreate_group = False
+                if last_id == ">" and time.monotonic() >= next_reclaim:
+                    await self._reclaim()
+                    next_reclaim = time.monotonic() + RECLAIM_INTERVAL
+                if last_id == ">":
+                    self._buffer(await self._read(">", block=READ_BLOCK_MS))
+                else:
+                    entries = await self._read(last_id)
+                    self._buffer(entries)
+                    last_id = entries[-1][0] if entries else ">"
+                delay = READ_RETRY_BASE_DELAY
+            except redis.RedisError as e:
+                if "NOGROUP" in str(e):
+                    # The stream or its group is gone (e.g. after a FLUSHDB): recreate it.
+                    recreate_group = True
+                    last_id = "0"
+                print(f"⚠️ [Notifier] Reading the outbox failed: {e}. Retrying in {delay:.0f}s.")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, READ_RETRY_MAX_DELAY)
+
+    def _coalesce(self, chat):
+        """Takes the longest run of queued messages that fits in one Telegram message."""
+        first = chat.messages[0]
+        batch = [first]
+        length = len(first["text"])
+        for message in chat.messages[1:]:
+            length += len(COALESCE_SEPARATOR) + len(message["text"])
+            if message["parse_mode"] != first["parse_mode"] or length > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(message)
+        del chat.messages[:len(batch)]
+        return batch
+
+    def _dispatch_ready(self):
+        """Starts a send for every chat whose turn it is. Returns seconds until the next one is due."""
+        now = time.monotonic()
+        next_due = None
+        for chat_id, chat in list(self.chats.items()):
+            if chat.busy:
+                continue
+            if not chat.messages:
+                # Forget idle chats only once their slot has passed, so a
+                # message arriving right after a send still waits for it.
+                if chat.ready_at <= now:
+                    del self.chats[chat_id]
+                continue
+            if chat.ready_at > now:
+                next_due = min(next_due or chat.ready_at, chat.ready_at)
+                continue
+            if len(self.in_flight) >= self.max_connections:
+                break
+            wait = self.bucket.delay()
+            if wait > 0:
+                next_due = min(next_due or now + wait, now + wait)
+                break
+
+            self.bucket.take()
+            chat.busy = True
+            # Round robin: this chat goes to the back of the line.
+            self.chats[chat_id] = self.chats.pop(chat_id)
+            task = asyncio.create_task(self._send(chat_id, chat, self._coalesce(chat)))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+        return None if next_due is None else max(next_due - now, 0.0)
+
+    async def dispatch_loop(self):
+        while not (self.stopping.is_set() and not self.in_flight):
+            self.wake.clear()
+            timeout = None if self.stopping.is_set() else self._dispatch_ready()
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout if timeout is not None else 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _post(self, batch):
+        text = COALESCE_SEPARATOR.join(message["text"] for message in batch)
+        if len(text) > MAX_MESSAGE_LENGTH:
+            print(f"⚠️ [Notifier] Message {batch[0]['id']} is {len(text)} chars; truncating.")
+            text = text[:MAX_MESSAGE_LENGTH - 1] + "…"
+        payload = {"chat_id": batch[0]["chat_id"], "text": text}
+        if batch[0]["parse_mode"]:
+            payload["parse_mode"] = batch[0]["parse_mode"]
+
+        self.stats["requests"] += 1
+        async with self.session.post(self.url, json=payload) as response:
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = {}
+            return response.status, body
+
+    async def _send(self, chat_id, chat, batch):
+        retry_in = None
+        try:
+            status, body = await self._post(batch)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, body = None, {"description": str(e)}
+
+        try:
+            if status == 200 and body.get("ok", True):
+                await self._finish(batch)
+                self.stats["delivered"] += len(batch)
+                now = time.time()
+                self.stats["max_lag"] = max(self.stats["max_lag"], *(now - m["enqueued_at"] for m in batch))
+            elif status == 429:
+                # Telegram says exactly how long to back off; not the message's fault.
+                self.stats["rate_limited"] += 1
+                retry_in = float(body.get("parameters", {}).get("retry_after", self.chat_interval))
+                chat.messages[:0] = batch
+            elif status == 400 and batch[0]["parse_mode"] and "parse entities" in body.get("description", ""):
+                # Reasons and course names can break Markdown; deliver them as plain text.
+                for message in batch:
+                    message["parse_mode"] = None
+                chat.messages[:0] = batch
+                retry_in = 0.0
+            elif status in (400, 403, 404):
+                # Bad chat id, bot blocked by the user, ...: retrying will not help.
+                await self._finish(batch, reason=f"{status}: {body.get('description', '')}")
+            else:
+                retry_in = await self._retry(batch, chat, f"{status}: {body.get('description', '')}")
+        except redis.RedisError as e:
+            print(f"❌ [Notifier] Could not acknowledge {len(batch)} message(s) for chat {chat_id}: {e}. They will be reclaimed.")
+        finally:
+            chat.ready_at = time.monotonic() + max(self.chat_interval, retry_in or 0.0)
+            chat.busy = False
+            self.wake.set()
+
+    async def _retry(self, batch, chat, reason):
+        attempts = max(message["attempts"] for message in batch) + 1
+        if attempts >= MAX_ATTEMPTS:
+            await self._finish(batch, reason=reason)
+            return None
+        for message in batch:
+            message["attempts"] = attempts
+        chat.messages[:0] = batch
+        self.stats["retries"] += 1
+        print(f"⚠️ [Notifier] Send to chat {batch[0]['chat_id']} failed ({reason}); attempt {attempts}/{MAX_ATTEMPTS}.")
+        return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+    async def _finish(self, batch, reason=None):
+        """Acknowledges delivered messages, or dead-letters them with `reason`."""
+        pipe = self.client.pipeline(transaction=False)
+        if reason:
+            print(f"❌ [Notifier] Giving up on {len(batch)} message(s) for chat {batch[0]['chat_id']}: {reason}")
+            self.stats["dead"] += len(batch)
+            for message in batch:
+                pipe.xadd(DEAD_LETTER_STREAM, {
+                    "chat_id": message["chat_id"], "text": message["text"], "reason": reason, "failed_at": time.time(),
+                })
+        ids = [message["id"] for message in batch]
+        pipe.xack(OUTBOX_STREAM, OUTBOX_GROUP, *ids)
+        try:
+            await pipe.execute()
+        except redis.RedisError:
+            # The entries stay pending in the group and come back through
+            # _reclaim(); a delivered message is then only acknowledged.
+            if not reason:
+                self.delivered_unacked.update(ids)
+            raise
+        finally:
+            # Either way the batch has left memory.
+            self.buffered -= len(batch)
+            self.buffered_ids.difference_update(ids)
+
+    async def run(self):
+        await self.ensure_group()
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as session:
+            self.session = session
+            reader = asyncio.create_task(self.read_loop())
+            reader.add_done_callback(self._reader_done)
+            try:
+                await self.dispatch_loop()
+            finally:
+                reader.cancel()
+            if reader.done() and not reader.cancelled() and reader.exception():
+                # Exit non-zero so the container is restarted.
+                raise reader.exception()
+
+    def _reader_done(self, task):
+        """Without its reader the sender would idle forever; stop it instead."""
+        if not task.cancelled() and task.exception():
+            print(f"❌ [Notifier] Outbox reader died: {task.exception()!r}. Shutting down.")
+            self.stop()
+
+    def stop(self):
+        """Stops reading; run() returns once in-flight sends have finished."""
+        self.stopping.set()
+        self.wake.set()
+
+
+def main():
+    if not BOT_TOKEN:
+        print("❌ BOT_TOKEN is not set; the notification sender cannot start.")
+        raise SystemExit(1)
+    print(f"✅ Notification sender started. Draining {OUTBOX_STREAM} from Redis at {REDIS_HOST}.")
+    asyncio.run(NotificationSender().run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# core/redis_client.py
+
+import os
+import time
+import threading
+
+import redis
+import redis.asyncio
+from packaging.version import parse
+
+# The one place that knows how to reach Redis.
+#
+# get_redis() and get_async_redis() hand out process-wide clients over shared
+# connection pools, so every module in a process reuses the same sockets
+# instead of building its own StrictRedis with its own host default. Pools
+# are re-created after fork (redis-py checks the pid), which keeps Celery's
+# prefork children safe. Both clients time every command (pipelines count
+# as one PIPELINE command) into per-process counters, see command_stats().
+
+REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
+REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
+REDIS_DB = int(os.getenv('REDIS_DB', '0'))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '64'))
+
+_stats = {}
+_stats_lock = threading.Lock()
+_capabilities = {}
+
+_sync_client = None
+_async_client = None
+_clients_lock = threading.Lock()
+
+
+def _record(command, seconds):
+    with _stats_lock:
+        entry = _stats.get(command)
+        if entry is None:
+            _stats[command] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def command_stats(reset=False):
+    """
+    Per-command latency seen by this process since start (or the last reset):
+    {command: {"count", "total_ms", "avg_ms", "max_ms"}}.
+    """
+    with _stats_lock:
+        snapshot = {
+            command: {
+                "count": count,
+                "total_ms": total * 1000,
+                "avg_ms": total / count * 1000,
+                "max_ms": worst * 1000,
+            }
+            for command, (count, total, worst) in _stats.items()
+        }
+        if reset:
+            _stats.clear()
+    return snapshot
+
+
+def command_stats_text():
+    """This process's command counters in the Prometheus text format."""
+    lines = [
+        "# HELP redis_command_seconds Latency of Redis commands sent by this process (pipelines as PIPELINE).",
+        "# TYPE redis_command_seconds summary",
+    ]
+    for command, entry in sorted(command_stats().items()):
+        lines.append(f'redis_command_seconds_count{{command="{command}"}} {entry["count"]}')
+        lines.append(f'redis_command_seconds_sum{{command="{command}"}} {entry["total_ms"] / 1000:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+class _TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            _record("PIPELINE", time.perf_counter() - started)
+
+
+class TimedRedis(redis.StrictRedis):
+    """StrictRedis that records the latency of every command it sends."""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            _record(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _TimedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            _record("PIPELINE", time.perf_counter() - started)
+
+
+class TimedAsyncRedis(redis.asyncio.StrictRedis):
+    """asyncio client that records the latency of every command it sends."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _record(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _pool_kwargs():
+    return {
+        "host": REDIS_HOST,
+        "port": REDIS_PORT,
+        "db": REDIS_DB,
+        "decode_responses": True,
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "health_check_interval": 30,
+    }
+
+
+def get_redis():
+    """Process-wide synchronous client (thread-safe; shares one connection pool)."""
+    global _sync_client
+    if _sync_client is None:
+        with _clients_lock:
+            if _sync_client is None:
+                # Blocking pool: threads wait for a free connection instead of
+                # failing when REDIS_MAX_CONNECTIONS are busy.
+                pool = redis.BlockingConnectionPool(timeout=5, **_pool_kwargs())
+                _sync_client = TimedRedis(connection_pool=pool)
+    return _sync_client
+
+
+def get_async_redis():
+    """
+    Process-wide asyncio client. Its connections belong to the event loop
+    that first uses them, which is fine for the single-loop web API and bot.
+    """
+    global _async_client
+    if _async_client is None:
+        pool = redis.asyncio.BlockingConnectionPool(timeout=5, **_pool_kwargs())
+        _async_client = TimedAsyncRedis(connection_pool=pool)
+    return _async_client
+
+
+def server_capabilities(client=None):
+    """
+    What the Redis server behind `client` supports, detected once per server
+    with a single INFO and cached for the life of the process:
+        {"version", "hset_multiple"}
+    `client` may be a pipeline or an asyncio client; asyncio clients are
+    probed through get_redis(), which points at the same server.
+    """
+    client = client or get_redis()
+    kwargs = client.connection_pool.connection_kwargs
+    server = (kwargs.get("host"), kwargs.get("port"), kwargs.get("path"))
+
+    capabilities = _capabilities.get(server)
+    if capabilities is None:
+        probe = client
+        if isinstance(client, redis.asyncio.StrictRedis):
+            probe = get_redis()
+        elif isinstance(client, redis.client.Pipeline):
+            # INFO on a pipeline would only be queued.
+            probe = redis.StrictRedis(connection_pool=client.connection_pool)
+        version = probe.info("server").get("redis_version", "0.0.0")
+        capabilities = {
+            "version": version,
+            # HSET with several field/value pairs arrived in Redis 4.0.
+            "hset_multiple": parse(version) >= parse("4.0.0"),
+        }
+        _capabilities[server] = capabilities
+    return capabilities
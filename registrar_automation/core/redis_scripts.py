@@ -0,0 +1,100 @@
+# core/redis_scripts.py
+
+import json
+
+import redis.asyncio
+
+from .schedule_store import SCHEDULE_PLANS_KEY, SCHEDULE_CHANNEL, JOB_KINDS, index_key, shard_of, job_member
+
+# Server-side scripts for the read-modify-write paths that run by the
+# thousand when registration opens. Each one is a single atomic round trip
+# instead of several commands another client could interleave with.
+#
+# The wrappers take a sync or asyncio client (or a pipeline) and return the
+# script call, so asyncio callers await the result:
+#   left = await debit_attempt(async_client, chat_id, DEFAULT_ATTEMPTS)
+
+USER_KEY = "user:{}"
+JOB_INDEX_KEY = "job_index:{}"
+
+# Takes one attempt from the user, creating the counter with ARGV[1]
+# attempts on first use. Returns the attempts left, or -1 (and takes
+# nothing) if there were none.
+_DEBIT_ATTEMPT_SCRIPT = """
+redis.call('HSETNX', KEYS[1], 'attempts_left', ARGV[1])
+if tonumber(redis.call('HGET', KEYS[1], 'attempts_left')) < 1 then
+    return -1
+end
+return redis.call('HINCRBY', KEYS[1], 'attempts_left', -1)
+"""
+
+# Merges the JSON object ARGV[2] into the job_index entry ARGV[1].
+# Returns 0 if the job is gone (and does not recreate it).
+# cjson writes empty arrays back as {} and numbers with 14 significant
+# digits, which is fine for the dashboard entry (ints, strings, non-empty
+# course lists).
+_UPDATE_JOB_FIELDS_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then
+    return 0
+end
+local entry = cjson.decode(raw)
+for field, value in pairs(cjson.decode(ARGV[2])) do
+    entry[field] = value
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(entry))
+return 1
+"""
+
+# Cancels job ARGV[1] of a user: drops its dashboard entry, its schedule
+# members (ARGV[3..]) and plan, announces it on channel ARGV[2] and refunds
+# the attempt. Returns nil if the job was not there (already cancelled or
+# never created), so a double cancel cannot refund twice; otherwise
+# {schedule members removed, attempts left}.
+#   KEYS: job_index, user, schedule index shard, schedule plans
+_CANCEL_JOB_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return nil
+end
+local removed = redis.call('ZREM', KEYS[3], unpack(ARGV, 3))
+redis.call('HDEL', KEYS[4], ARGV[1])
+redis.call('PUBLISH', ARGV[2], ARGV[1])
+return {removed, redis.call('HINCRBY', KEYS[2], 'attempts_left', 1)}
+"""
+
+_registered = {}
+
+
+def _script(client, source):
+    """One Script object per script and client flavour; redis-py falls back from EVALSHA to EVAL on its own."""
+    key = (isinstance(client, redis.asyncio.StrictRedis), source)
+    script = _registered.get(key)
+    if script is None:
+        script = _registered[key] = client.register_script(source)
+    return script
+
+
+def debit_attempt(client, chat_id, default_attempts):
+    """Takes one attempt; returns the attempts left, or -1 if there were none."""
+    return _script(client, _DEBIT_ATTEMPT_SCRIPT)(
+        keys=[USER_KEY.format(chat_id)], args=[default_attempts], client=client
+    )
+
+
+def update_job_fields(client, chat_id, job_id, fields):
+    """Merges `fields` into the job's dashboard entry. Returns 1, or 0 if the job does not exist."""
+    return _script(client, _UPDATE_JOB_FIELDS_SCRIPT)(
+        keys=[JOB_INDEX_KEY.format(chat_id)], args=[job_id, json.dumps(fields)], client=client
+    )
+
+
+def cancel_user_job(client, chat_id, job_id):
+    """
+    Atomically cancels a user's job and refunds the attempt. Returns
+    [schedule members removed, attempts left], or None if the job was not found.
+    """
+    return _script(client, _CANCEL_JOB_SCRIPT)(
+        keys=[JOB_INDEX_KEY.format(chat_id), USER_KEY.format(chat_id), index_key(shard_of(job_id)), SCHEDULE_PLANS_KEY],
+        args=[job_id, SCHEDULE_CHANNEL, *[job_member(job_id, kind) for kind in JOB_KINDS]],
+        client=client,
+    )
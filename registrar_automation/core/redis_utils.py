@@ -1,6 +1,6 @@
 # core/redis_utils.py
 
-from packaging.version import parse
+from .redis_client import server_capabilities
 
 def hset_compat(redis_client, key, mapping):
     """
@@ -9,13 +9,13 @@ def hset_compat(redis_client, key, mapping):
 
     - For Redis >= 4.0.0, it uses HSET with multiple field/value pairs.
     - For Redis < 4.0.0, it falls back to the deprecated HMSET command.
-    """
-    # Get the server's Redis version
-    redis_version = redis_client.info().get('redis_version', '0.0.0')
 
-    # Use the modern HSET command if the version is 4.0.0 or newer
-    if parse(redis_version) >= parse("4.0.0"):
-        redis_client.hset(key, mapping=mapping)
+    The server version is looked up once per server and cached (see
+    core/redis_client.py), not with an INFO round trip on every call.
+    Returns the command's result, so with an asyncio client it is awaited.
+    """
+    if server_capabilities(redis_client)["hset_multiple"]:
+        return redis_client.hset(key, mapping=mapping)
     else:
         # Fall back to the older HMSET for compatibility
-        redis_client.hmset(key, mapping)
+        return redis_client.hmset(key, mapping)
@@ -0,0 +1,252 @@
+# core/schedule_store.py
+
+import os
+import json
+import zlib
+
+# Scheduled jobs are split into SCHEDULE_SHARDS shards by job_id so several
+# scheduler instances can dispatch in parallel (see scheduler/leases.py).
+# Per shard:
+#   schedule:index:{shard}  - sorted set, member "{job_id}:{kind}", score = fire time (epoch s)
+# Shared:
+#   schedule:plans          - hash, job_id -> job plan JSON (shared by both kinds)
+# Dispatch is one atomic claim of everything due, cancel is a ZREM + HDEL.
+# Every change is announced on the schedule:changed channel so the scheduler
+# can sleep until the next fire time and still pick up new jobs at once.
+#
+# Claimed jobs are parked in schedule:inflight:{shard} (zset, member -> fire
+# time) and schedule:inflight_plans:{shard} (hash, member -> plan) until the
+# scheduler has published them and acks. Whoever owns the shard next
+# re-publishes them; the member doubles as the dispatch token (Celery task
+# ID) and workers drop a token they have already seen, so nothing fires twice.
+# The older layout (one list per second, "schedule:{ts}:{kind}") is migrated
+# by migrate_legacy_schedule().
+
+SCHEDULE_SHARDS = int(os.getenv('SCHEDULE_SHARDS', '8'))
+
+SCHEDULE_INDEX_KEY = "schedule:index"
+SCHEDULE_PLANS_KEY = "schedule:plans"
+SCHEDULE_CHANNEL = "schedule:changed"
+INFLIGHT_KEY = "schedule:inflight"
+INFLIGHT_PLANS_KEY = "schedule:inflight_plans"
+JOB_KINDS = ("pre_login", "registration")
+
+# How long a worker remembers a dispatch token it has already run.
+DISPATCH_TOKEN_TTL = 24 * 3600
+
+# Claims due jobs from several shards in one call. KEYS[1] is the plans
+# hash, then three keys per shard: index, inflight, inflight plans. A shard
+# whose earliest member is due after ARGV[1] costs one ZRANGE and is left
+# alone; from the others it pops up to ARGV[2] members due at or before
+# ARGV[1], parks them in the inflight keys and appends them to the flat
+# result [member, score, plan, ...]. Registration always fires after
+# pre_login, so the plan is dropped from the hash together with the
+# registration member.
+_CLAIM_DUE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local claimed = {}
+for k = 2, #KEYS, 3 do
+    local index, inflight, inflight_plans = KEYS[k], KEYS[k + 1], KEYS[k + 2]
+    local first = redis.call('ZRANGE', index, 0, 0, 'WITHSCORES')
+    if #first > 0 and tonumber(first[2]) <= now then
+        local due = redis.call('ZRANGEBYSCORE', index, '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]))
+        local members = {}
+        for i = 1, #due, 2 do
+            members[#members + 1] = due[i]
+        end
+        redis.call('ZREM', index, unpack(members))
+
+        for i = 1, #due, 2 do
+            local member = due[i]
+            local job_id = string.match(member, '^(.*):[^:]+$')
+            local plan = redis.call('HGET', KEYS[1], job_id)
+            if plan then
+                redis.call('ZADD', inflight, due[i + 1], member)
+                redis.call('HSET', inflight_plans, member, plan)
+                claimed[#claimed + 1] = member
+                claimed[#claimed + 1] = due[i + 1]
+                claimed[#claimed + 1] = plan
+            end
+            if string.sub(member, -13) == ':registration' then
+                redis.call('HDEL', KEYS[1], job_id)
+            end
+        end
+    end
+end
+return claimed
+"""
+
+
+_claim_due = None
+
+
+def shard_of(job_id):
+    """Shard a job belongs to. Stable across processes and restarts."""
+    return zlib.crc32(job_id.encode()) % SCHEDULE_SHARDS
+
+
+def index_key(shard):
+    return f"{SCHEDULE_INDEX_KEY}:{shard}"
+
+
+def inflight_key(shard):
+    return f"{INFLIGHT_KEY}:{shard}"
+
+
+def inflight_plans_key(shard):
+    return f"{INFLIGHT_PLANS_KEY}:{shard}"
+
+
+def all_shards():
+    return range(SCHEDULE_SHARDS)
+
+
+def job_member(job_id, kind):
+    """Index member for one kind of a job."""
+    return f"{job_id}:{kind}"
+
+
+def token_shard(token):
+    """Shard of a dispatch token / index member."""
+    return shard_of(token.rsplit(":", 1)[0])
+
+
+def schedule_job(client, job_id, plan_json, fire_times):
+    """
+    Adds a job plan and its fire times ({kind: epoch seconds}) to the index.
+    `client` may be a pipeline, so it can join the caller's transaction.
+    """
+    client.hset(SCHEDULE_PLANS_KEY, job_id, plan_json)
+    client.zadd(index_key(shard_of(job_id)), {job_member(job_id, kind): ts for kind, ts in fire_times.items()})
+    client.publish(SCHEDULE_CHANNEL, job_id)
+
+
+def queue_cancel_job(pipe, job_id):
+    """
+    Queues the cancellation of `job_id` on `pipe` (sync or asyncio) as three
+    commands; the first result is how many kinds were still pending.
+    """
+    pipe.zrem(index_key(shard_of(job_id)), *[job_member(job_id, kind) for kind in JOB_KINDS])
+    pipe.hdel(SCHEDULE_PLANS_KEY, job_id)
+    pipe.publish(SCHEDULE_CHANNEL, job_id)
+
+
+def cancel_job(client, job_id):
+    """Removes every scheduled kind of `job_id`. Returns how many were still pending."""
+    pipe = client.pipeline()
+    queue_cancel_job(pipe, job_id)
+    removed, _, _ = pipe.execute()
+    return removed
+
+
+def next_due_time(client, shards=None):
+    """
+    Fire time of the earliest job scheduled in `shards` (default: all), or
+    None if nothing is scheduled there.
+    """
+    pipe = client.pipeline(transaction=False)
+    for shard in all_shards() if shards is None else shards:
+        pipe.zrange(index_key(shard), 0, 0, withscores=True)
+    firsts = [first[0][1] for first in pipe.execute() if first]
+    return min(firsts) if firsts else None
+
+
+def _parse_claimed(entries):
+    claimed = []
+    for member, score, plan_json in entries:
+        kind = member.rsplit(":", 1)[1]
+        claimed.append((member, kind, float(score), json.loads(plan_json)))
+    return claimed
+
+
+def claim_due_jobs(client, now, shards=None, limit=1000):
+    """
+    Atomically moves up to `limit` jobs per shard due at or before `now` from
+    the index to the inflight keys and returns them, oldest first within a
+    shard, as a list of (token, kind, fire_time, plan_dict). `shards`
+    defaults to all of them; they are all claimed by one script call, which
+    skips a shard whose earliest job is not due yet before touching it.
+    Call ack_jobs() once the jobs are sent.
+    """
+    global _claim_due
+    if _claim_due is None:
+        _claim_due = client.register_script(_CLAIM_DUE_SCRIPT)
+
+    keys = [SCHEDULE_PLANS_KEY]
+    for shard in all_shards() if shards is None else shards:
+        keys += [index_key(shard), inflight_key(shard), inflight_plans_key(shard)]
+    if len(keys) == 1:
+        return []
+
+    raw = _claim_due(keys=keys, args=[now, limit], client=client)
+    return _parse_claimed(zip(raw[0::3], raw[1::3], raw[2::3]))
+
+
+def ack_jobs(client, tokens):
+    """
+    Forgets claimed jobs once they have been published. `client` may be a
+    pipeline, so the ack can share a round trip with other bookkeeping.
+    """
+    by_shard = {}
+    for token in tokens:
+        by_shard.setdefault(token_shard(token), []).append(token)
+    for shard, shard_tokens in by_shard.items():
+        client.zrem(inflight_key(shard), *shard_tokens)
+        client.hdel(inflight_plans_key(shard), *shard_tokens)
+
+
+def pending_inflight_jobs(client, shards=None):
+    """
+    Returns jobs in `shards` (default: all) that were claimed but never acked
+    (their scheduler died or lost the shard mid-dispatch), in the same shape
+    as claim_due_jobs(). They stay inflight until acked.
+    """
+    shards = list(all_shards() if shards is None else shards)
+    pipe = client.pipeline(transaction=False)
+    for shard in shards:
+        pipe.zrange(inflight_key(shard), 0, -1, withscores=True)
+        pipe.hgetall(inflight_plans_key(shard))
+    results = pipe.execute()
+
+    entries = []
+    for entries_in_shard, plans in zip(results[0::2], results[1::2]):
+        entries.extend((member, score, plans[member]) for member, score in entries_in_shard if member in plans)
+    return _parse_claimed(entries)
+
+
+def claim_dispatch_token(client, token):
+    """
+    Called by a worker before running a scheduled task. Returns False if this
+    token was already claimed, i.e. the message is a redelivery. Tasks sent
+    without a token (not through the scheduler) always run.
+    """
+    if not token:
+        return True
+    return bool(client.set(f"dispatch:{token}", 1, nx=True, ex=DISPATCH_TOKEN_TTL))
+
+
+def migrate_legacy_schedule(client):
+    """
+    Moves jobs from the per-second list keys ("schedule:{ts}:{kind}") into
+    the sharded index. Safe to run repeatedly. Returns the number of jobs
+    moved.
+    """
+    moved = 0
+    for kind in JOB_KINDS:
+        for key in client.scan_iter(match=f"schedule:*:{kind}", count=500):
+            try:
+                fire_time = int(key.split(":")[1])
+            except (IndexError, ValueError):
+                continue
+
+            pipe = client.pipeline()
+            for plan_json in client.lrange(key, 0, -1):
+                try:
+                    job_id = json.loads(plan_json)["job_id"]
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                schedule_job(pipe, job_id, plan_json, {kind: fire_time})
+                moved += 1
+            pipe.delete(key)
+            pipe.execute()
+    return moved
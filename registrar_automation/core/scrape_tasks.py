@@ -0,0 +1,76 @@
+# core/scrape_tasks.py
+
+import os
+import time
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+from celery.exceptions import SoftTimeLimitExceeded
+from .celery_app import celery_app
+from .api_scraper import ScraperAPI
+from .browser_pool import get_browser_pool, close_browser_pool
+
+# Browser-based tasks. Kept apart from core/tasks.py so registration workers
+# never import Playwright; only workers with the 'scraper' profile load this.
+
+# Initialize standard Celery logger
+logger = get_task_logger(__name__)
+
+# Tabs used to search/add and scrape courses at the same time (1 = one by one).
+SCRAPER_PARALLELISM = int(os.getenv('SCRAPER_PARALLELISM', '4'))
+# Abort images/fonts/media/analytics; stylesheets only if the pages still work without them.
+SCRAPER_BLOCK_RESOURCES = os.getenv('SCRAPER_BLOCK_RESOURCES', '1') == '1'
+SCRAPER_BLOCK_STYLESHEETS = os.getenv('SCRAPER_BLOCK_STYLESHEETS', '0') == '1'
+
+
+@worker_process_shutdown.connect
+def shutdown_browser_pool(**kwargs):
+    close_browser_pool()
+
+
+@celery_app.task(name='tasks.update_course_ids', soft_time_limit=50, time_limit=60)
+def update_course_ids(credentials, desired_schedule, course_names):
+    """
+    Celery task to scrape and validate course IDs using Playwright.
+    Runs in a fresh context of this worker's shared browser (see core/browser_pool.py).
+    """
+    username = credentials.get('username')
+    logger.info(f"🛠️ [update_ids] Starting course ID scraping for user: {username}")
+
+    pool = get_browser_pool()
+    started = time.perf_counter()
+    scraper = None
+    try:
+        with pool.context() as context:
+            scraper = ScraperAPI(
+                mode='test', context=context,
+                block_resources=SCRAPER_BLOCK_RESOURCES, block_stylesheets=SCRAPER_BLOCK_STYLESHEETS,
+            )
+
+            if not scraper.login(credentials):
+                logger.error(f"❌ [update_ids] Login failed for {username}")
+                return {"valid_courses": [], "errors": ["Login failed during scraping."]}
+
+            scraper.add_courses_to_schedule(course_names, parallelism=SCRAPER_PARALLELISM)
+            scraped_course_map = scraper.scrape_all_course_ids(desired_schedule, parallelism=SCRAPER_PARALLELISM)
+
+            if not scraped_course_map:
+                logger.error(f"❌ [update_ids] No data was scraped for {username}.")
+                return {"valid_courses": [], "errors": ["No data scraped from schedule table."]}
+
+            final_course_list = scraper.validate_and_build_course_list(desired_schedule, scraped_course_map)
+            return final_course_list
+
+    except SoftTimeLimitExceeded:
+        logger.error(f"❌ [update_ids] SOFT TIME LIMIT EXCEEDED for user {username}. Aborting task.")
+        return None
+    except Exception as e:
+        logger.error(f"❌ [update_ids] An exception occurred during scraping for {username}: {e}", exc_info=True)
+        return None
+    finally:
+        report = pool.report()
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in (scraper.timings if scraper else {}).items())
+        logger.info(
+            f"🧭 [update_ids] Took {time.perf_counter() - started:.2f}s ({phases or 'no phases'}). Browser pool: "
+            f"{report['launches']} launch(es), cold avg {report['avg_cold_task_s'] or 0:.2f}s "
+            f"over {report['cold_tasks']}, warm avg {report['avg_warm_task_s'] or 0:.2f}s over {report['warm_tasks']}."
+        )
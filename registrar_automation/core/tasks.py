@@ -1,47 +1,87 @@
+import os
+import time
 import json
+import random
 import redis
 import warnings
-import requests
 from celery.utils.log import get_task_logger
 from .celery_app import celery_app
-from celery.exceptions import SoftTimeLimitExceeded
-from .api_registrar import RegistrarAPI
-from .api_scraper import ScraperAPI
+from .api_registrar import RegistrarAPI, already_registered, classify_registration_result
+from .timing import sleep_until
+from .clock_calibration import calibrate_server_clock
+from .time_sync import get_time_offset
+from .schedule_store import claim_dispatch_token
+from .dispatch_metrics import record_worker_start
+from .redis_client import get_redis
+from .notification_outbox import enqueue_notification
+from .redis_scripts import update_job_fields as merge_job_fields
 
 # Suppress warnings for requests
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 
 # Connect to Redis
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+redis_client = get_redis()
 
 # Initialize standard Celery logger
 logger = get_task_logger(__name__)
 
+# How run_registration submits courses: 'batch' sends every course in one
+# registerSections call, 'concurrent' fires one request per course at once,
+# 'sequential' keeps the original one-by-one loop.
+REGISTRATION_STRATEGY = os.getenv('REGISTRATION_STRATEGY', 'concurrent')
+
+# Send a duplicate registerSections request when the first one stalls.
+REGISTRATION_HEDGING = os.getenv('REGISTRATION_HEDGING', '0') == '1'
+
+# Hard time limit of run_registration, in seconds.
+RUN_REGISTRATION_TIME_LIMIT = 25
+# CSRF polling around the trigger: start at CSRF_POLL_INTERVAL and stretch up to
+# CSRF_POLL_MAX_INTERVAL while the registrar answers slowly.
+CSRF_POLL_INTERVAL = float(os.getenv('CSRF_POLL_INTERVAL', '0.2'))
+CSRF_POLL_MAX_INTERVAL = float(os.getenv('CSRF_POLL_MAX_INTERVAL', '2.0'))
+# A fresh registrar clock calibration from pre_login only replaces the offset
+# used at job creation when it is at least this precise (seconds)...
+MAX_CALIBRATION_ERROR = 0.25
+# ...and moves the trigger by no more than this (seconds).
+MAX_TRIGGER_CORRECTION = 5.0
+# Keep-alive pings stop this long before the trigger; the rest is a precise wait.
+PRECISION_WINDOW_SECONDS = 0.5
+# Retries of transient registration failures: jittered exponential backoff,
+# stopping REPORT_RESERVE_SECONDS before the time limit.
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '0.3'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '2.0'))
+REPORT_RESERVE_SECONDS = 2
+# Part of the time limit kept back for the registration calls and the report:
+# CSRF polling stops early enough for one full registerSections round.
+REGISTRATION_RESERVE_SECONDS = RegistrarAPI.REGISTER_TIMEOUT + REPORT_RESERVE_SECONDS
+
 def notify_user(chat_id, text):
     """
-    Delegates notification to the Web API.
+    Queues a Telegram message in the notification outbox (one XADD); the
+    notification sender delivers it, so the task never waits on Telegram.
     """
-    url = "http://127.0.0.1:8000/notifications/send"
-    payload = {"chat_id": chat_id, "text": text}
-    
     try:
-        response = requests.post(url, json=payload, timeout=5)
-        response.raise_for_status()
-    except Exception as e:
-        logger.error(f"⚠️ Failed to request notification via Web API: {e}")
+        enqueue_notification(redis_client, chat_id, text)
+    except redis.RedisError as e:
+        logger.error(f"⚠️ Failed to queue notification for chat {chat_id}: {e}")
 
 
 @celery_app.task(name='tasks.pre_login', time_limit=15)
-def pre_login(job_id, username, password, mode):
+def pre_login(job_id, username, password, mode, dispatch_token=None):
     """
     Pre-authenticates the user.
     Saves Cookies and Student ID to Redis.
     INTENTIONALLY IGNORES missing CSRF token (assumes site is locked).
     """
+    if not claim_dispatch_token(redis_client, dispatch_token):
+        logger.warning(f"⚠️ [pre_login:{job_id}] Dispatch {dispatch_token} already handled. Dropping duplicate.")
+        return
+    log_start_lag(f"pre_login:{job_id}", dispatch_token)
+
     logger.info(f"🚀 [pre_login:{job_id}] Starting pre-authentication for: {username}")
 
     try:
-        api = RegistrarAPI(mode=mode)
+        api = RegistrarAPI(mode=mode, stream_pages=True)
         
         # We expect login to succeed (return cookies) but token might be None
         cookies, csrf_token = api.login(username, password)
@@ -53,12 +93,21 @@ def pre_login(job_id, username, password, mode):
                 logger.error(f"❌ [pre_login:{job_id}] Login succeeded but could not fetch student ID.")
                 return 
 
+            # Measure the registrar's clock on the live session so the worker can
+            # correct the trigger for drift since the job was created.
+            try:
+                clock = calibrate_server_clock(api.PING_URL, session=api.session)
+            except Exception as e:
+                logger.warning(f"⚠️ [pre_login:{job_id}] Clock calibration failed: {e}")
+                clock = None
+
             # Save the session (Cookies + ID)
             # We don't care about the token here, run_registration will fetch a fresh one.
             session_data = {
                 "cookies": cookies,
                 "student_id": student_id,
-                "csrf_token": csrf_token # Saved just in case, but likely None or ignored
+                "csrf_token": csrf_token, # Saved just in case, but likely None or ignored
+                "clock": clock
             }
             
             redis_key = f"session:{job_id}" 
@@ -74,16 +123,25 @@ def pre_login(job_id, username, password, mode):
         return
 
 
-@celery_app.task(name='tasks.run_registration', time_limit=25)
-def run_registration(job_id, chat_id, username, password, courses_to_register, mode):
+@celery_app.task(name='tasks.run_registration', time_limit=RUN_REGISTRATION_TIME_LIMIT)
+def run_registration(job_id, chat_id, username, password, courses_to_register, mode, trigger_timestamp=None, open_timestamp=None, trigger_at=None, clock_offset=None, clock_offset_source=None, dispatch_token=None):
     """
     Executes the registration.
     STRATEGY:
     1. Load Session (Cookies + ID).
-    2. FORCE FETCH FRESH CSRF TOKEN (Assume none exists).
-    3. Register.
+    2. Warm up connections and wait for the exact trigger instant (if dispatched early).
+    3. FORCE FETCH FRESH CSRF TOKEN (Assume none exists).
+    4. Register.
     """
+    if not claim_dispatch_token(redis_client, dispatch_token):
+        logger.warning(f"⚠️ [run_registration:{job_id}] Dispatch {dispatch_token} already handled. Dropping duplicate.")
+        return {"status": "duplicate", "dispatch_token": dispatch_token}
+    dispatch_timing = log_start_lag(f"run_registration:{job_id}", dispatch_token)
+
     logger.info(f"🎯 [run_registration:{job_id}] Waking up for registration!")
+    task_started = time.time()
+    token_deadline = task_started + RUN_REGISTRATION_TIME_LIMIT - REGISTRATION_RESERVE_SECONDS
+    retry_deadline = task_started + RUN_REGISTRATION_TIME_LIMIT - REPORT_RESERVE_SECONDS
  
     user_key = f"user:{chat_id}"
     api = None
@@ -99,9 +157,10 @@ def run_registration(job_id, chat_id, username, password, courses_to_register, m
             session_data = json.loads(session_json)
             saved_cookies = session_data.get('cookies')
             student_id = session_data.get('student_id')
+            trigger_at = corrected_trigger(job_id, mode, trigger_at, clock_offset, clock_offset_source, session_data.get('clock'))
             
             if saved_cookies and student_id:
-                api = RegistrarAPI(session_cookies=saved_cookies, mode=mode)
+                api = RegistrarAPI(session_cookies=saved_cookies, mode=mode, stream_pages=True, hedge_requests=REGISTRATION_HEDGING)
                 logger.info(f"✅ [run_registration:{job_id}] Restored session for Student {student_id}.")
             else:
                 logger.warning(f"⚠️ [run_registration:{job_id}] Incomplete session data in Redis.")
@@ -114,18 +173,36 @@ def run_registration(job_id, chat_id, username, password, courses_to_register, m
     # --- PHASE 2: EMERGENCY FALLBACK (If Pre-Login Failed) ---
     if not api:
         logger.info(f"🔄 [run_registration:{job_id}] Performing emergency manual login...")
-        api = RegistrarAPI(mode=mode)
+        api = RegistrarAPI(mode=mode, stream_pages=True, hedge_requests=REGISTRATION_HEDGING)
         cookies, _ = api.login(username, password) # We ignore the token from login, we'll fetch fresh anyway
         if not cookies:
              return fail_job(job_id, chat_id, "Login failed during registration task.")
         student_id = api.get_student_id()
 
+    # --- PHASE 2.5: WARM-UP ---
+    # The scheduler hands us the job a few seconds early; open and keep the
+    # TLS connections hot so the T-0 requests skip DNS/TCP/TLS entirely.
+    # trigger_at is the exact (sub-second) instant; older plans only carry the whole second.
+    warmup_stats = None
+    fire_offset_ms = None
+    target = trigger_at or trigger_timestamp
+    if target and target > time.time():
+        try:
+            warmup_stats = api.warm_up()
+            api.keep_warm_until(target - PRECISION_WINDOW_SECONDS)
+        except Exception as e:
+            logger.warning(f"⚠️ [run_registration:{job_id}] Warm-up failed, continuing cold: {e}")
+        fire_offset_ms = round(sleep_until(target) * 1000, 2)
+        logger.info(f"⏱️ [run_registration:{job_id}] Fired {fire_offset_ms:+.2f} ms from target. Warm-up stats: {warmup_stats}")
+        update_job_fields(chat_id, job_id, {"fire_offset_ms": fire_offset_ms})
+
     # --- PHASE 3: FETCH FRESH CSRF TOKEN (CRITICAL) ---
     # We assume the token in Redis (if any) is stale or non-existent.
-    # We fetch it NOW, from the live page.
+    # We poll the live page until it appears (the page may still be locked
+    # for a moment after the trigger) or the time budget runs out.
     try:
-        logger.info(f"🔎 [run_registration:{job_id}] Fetching FRESH CSRF token from live site...")
-        csrf_token = api.fetch_csrf_token()
+        logger.info(f"🔎 [run_registration:{job_id}] Polling live site for a FRESH CSRF token...")
+        csrf_token = acquire_csrf_token(api, job_id, token_deadline, open_timestamp or trigger_timestamp)
         
         if not csrf_token:
             return fail_job(job_id, chat_id, "Registration page is still locked (No CSRF token found).")
@@ -142,20 +219,21 @@ def run_registration(job_id, chat_id, username, password, courses_to_register, m
     succeeded_courses = []
     failed_courses = []
 
-    for course in courses_to_register:
+    results, attempts = register_with_retries(api, job_id, courses_to_register, student_id, csrf_token, retry_deadline)
+
+    for course, (is_success, reason), course_attempts in zip(courses_to_register, results, attempts):
         # Prepare display name
         comps_str = ", ".join([f"{c.get('type','?')} {c['section_id']}" for c in course.get('components', [])])
         course_display = f"{course['name']} ({comps_str})"
 
-        is_success, reason = api.register_course(course, student_id, csrf_token)
-        
         if is_success:
-            succeeded_courses.append(course_display)
+            succeeded_courses.append({"name": course_display, "attempts": course_attempts})
         else:
-            failed_courses.append({"name": course_display, "reason": reason})
+            failed_courses.append({"name": course_display, "reason": reason, "attempts": course_attempts})
 
     # --- PHASE 5: REPORTING & CLEANUP ---
-    send_report(chat_id, mode, succeeded_courses, failed_courses)
+    hedge_stats = api.hedge_report() if api.hedge_requests else None
+    send_report(chat_id, mode, succeeded_courses, failed_courses, warmup_stats, hedge_stats)
     
     execution_status = "completed" if (succeeded_courses or failed_courses) else "failed"
     update_job_status(chat_id, job_id, execution_status)
@@ -166,48 +244,182 @@ def run_registration(job_id, chat_id, username, password, courses_to_register, m
     return {
         "succeeded": succeeded_courses,
         "failed": failed_courses,
-        "mode": mode
+        "mode": mode,
+        "fire_offset_ms": fire_offset_ms,
+        "dispatch_timing": dispatch_timing,
+        "warmup": warmup_stats,
+        "hedging": hedge_stats
     }
 
 
-@celery_app.task(name='tasks.update_course_ids', soft_time_limit=50, time_limit=60)
-def update_course_ids(credentials, desired_schedule, course_names):
+# --- Helper Functions ---
+
+def log_start_lag(label, dispatch_token):
     """
-    Celery task to scrape and validate course IDs using Playwright.
+    Records when the worker picked the task up (see core/dispatch_metrics.py)
+    and logs how far behind schedule each stage was. Never fails the task.
     """
-    username = credentials.get('username')
-    logger.info(f"🛠️ [update_ids] Starting course ID scraping for user: {username}")
-    
-    scraper = ScraperAPI(headless=True, mode='test')
-    
     try:
-        final_course_list = []
+        timing = record_worker_start(redis_client, dispatch_token)
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ [{label}] Could not record start lag: {e}")
+        return None
+    if timing:
+        scheduled = float(timing["scheduled"])
+        logger.info(
+            f"⏱️ [{label}] Lag behind schedule: dispatched {(float(timing['dispatched']) - scheduled) * 1000:.1f} ms, "
+            f"published {(float(timing['published']) - scheduled) * 1000:.1f} ms, "
+            f"started {(timing['started'] - scheduled) * 1000:.1f} ms."
+        )
+    return timing
 
-        if not scraper.login(credentials):
-            logger.error(f"❌ [update_ids] Login failed for {username}")
-            return {"valid_courses": [], "errors": ["Login failed during scraping."]}
-            
-        scraper.add_courses_to_schedule(course_names)
-        scraped_course_map = scraper.scrape_all_course_ids(desired_schedule)
 
-        if not scraped_course_map:
-            logger.error(f"❌ [update_ids] No data was scraped for {username}.")
-            return {"valid_courses": [], "errors": ["No data scraped from schedule table."]}
+def corrected_trigger(job_id, mode, trigger_at, planned_offset, planned_source, clock):
+    """
+    Shifts `trigger_at` by the difference between the clock offset used at
+    job creation (read from `planned_source`) and a newer reading of the same
+    clock: the registrar measurement pre_login just made, or, failing that,
+    the offset published by the time sync service. A reading of another
+    clock is not a correction (it would only add the skew between the two
+    clocks), nor are measurements that are too uncertain or stale, or
+    corrections that are implausibly large.
+    """
+    if trigger_at is None or planned_offset is None or planned_source in (None, "none"):
+        return trigger_at
+    measured = planned_source == f"registrar:{mode}" and clock and clock.get("error") is not None
+    if not measured or clock["error"] > MAX_CALIBRATION_ERROR:
+        # No usable fresh measurement of that clock; fall back to the time sync service.
+        published = get_time_offset(mode, client=redis_client)
+        if published["stale"] or published["source"] != planned_source:
+            logger.info(
+                f"🕰️ [run_registration:{job_id}] No fresh '{planned_source}' offset "
+                f"(got '{published['source']}'); keeping the planned trigger."
+            )
+            return trigger_at
+        clock = {"offset": published["offset"], "error": published["error"] or 0.0}
+
+    correction = planned_offset - clock["offset"]
+    if abs(correction) > MAX_TRIGGER_CORRECTION:
+        logger.warning(f"⚠️ [run_registration:{job_id}] Ignoring implausible clock correction of {correction:+.3f}s.")
+        return trigger_at
+
+    logger.info(f"🕰️ [run_registration:{job_id}] Clock correction from '{planned_source}' {correction:+.3f}s (±{clock['error']:.3f}s).")
+    return trigger_at + correction
+
+
+def submit_courses(api, courses, student_id, csrf_token, strategy, timeout=None):
+    """
+    Submits `courses` using the given REGISTRATION_STRATEGY, waiting at most
+    `timeout` seconds for each request (the whole round, except 'sequential').
+    Returns a list of (is_success, reason, latency_ms) in the order of `courses`.
+    """
+    if strategy == 'batch':
+        return api.register_courses_batch(courses, student_id, csrf_token, timeout)
+    if strategy == 'concurrent':
+        return api.register_courses_concurrently(courses, student_id, csrf_token, timeout)
+
+    results = []
+    for course in courses:
+        started = time.perf_counter()
+        is_success, reason = api.register_course(course, student_id, csrf_token, timeout)
+        results.append((is_success, reason, (time.perf_counter() - started) * 1000))
+    return results
 
-        final_course_list = scraper.validate_and_build_course_list(desired_schedule, scraped_course_map)
-        return final_course_list
 
-    except SoftTimeLimitExceeded:
-        logger.error(f"❌ [update_ids] SOFT TIME LIMIT EXCEEDED for user {username}. Aborting task.")
-        return None
-    except Exception as e:
-        logger.error(f"❌ [update_ids] An exception occurred during scraping for {username}: {e}", exc_info=True)
-        return None
-    finally:
-        scraper.close()
+def register_with_retries(api, job_id, courses, student_id, csrf_token, deadline):
+    """
+    Registers `courses`, then keeps re-submitting only the ones whose failure
+    classify_registration_result() calls retryable, with jittered exponential
+    backoff, until nothing is retryable or `deadline` (epoch seconds) is near.
+    No request is allowed to outlive `deadline`, and a retry only starts if
+    its backoff plus a full REGISTER_TIMEOUT still fit before it. On a retry,
+    "already registered" means an earlier try got through and counts as success.
+    Returns (results, attempts): results[i] is the final (is_success, reason)
+    of courses[i], attempts[i] lists {attempt, outcome, latency_ms} per try.
+    """
+    results = [(False, "Not attempted.")] * len(courses)
+    attempts = [[] for _ in courses]
+    pending = list(range(len(courses)))
+    strategy = REGISTRATION_STRATEGY
+    attempt = 0
+
+    while pending:
+        attempt += 1
+        timeout = min(RegistrarAPI.REGISTER_TIMEOUT, max(deadline - time.time(), RegistrarAPI.MIN_REGISTER_TIMEOUT))
+        round_results = submit_courses(api, [courses[i] for i in pending], student_id, csrf_token, strategy, timeout)
+
+        retryable = []
+        for index, (is_success, reason, latency_ms) in zip(pending, round_results):
+            # A retried request may have reached the registrar the first time.
+            if not is_success and attempt > 1 and already_registered(reason):
+                is_success, reason = True, courses[index]['name']
+            outcome = classify_registration_result(is_success, reason)
+            results[index] = (is_success, reason)
+            attempts[index].append({"attempt": attempt, "outcome": outcome, "latency_ms": round(latency_ms)})
+            if outcome == "retryable":
+                retryable.append(index)
+
+        if not retryable:
+            break
+
+        backoff = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+        backoff = random.uniform(backoff / 2, backoff)
+        if time.time() + backoff + RegistrarAPI.REGISTER_TIMEOUT > deadline:
+            logger.warning(f"⌛ [run_registration:{job_id}] No time left to retry {len(retryable)} course(s).")
+            break
+
+        logger.info(f"🔁 [run_registration:{job_id}] Retrying {len(retryable)} course(s) in {backoff:.2f}s (attempt {attempt + 1}).")
+        time.sleep(backoff)
+        pending = retryable
+        # Retries cover a handful of courses; send them individually.
+        if strategy == 'batch':
+            strategy = 'concurrent'
+
+    return results, attempts
+
+
+def format_attempts(attempts):
+    """Renders per-attempt timings for the report, e.g. '503 ms retryable → 120 ms'."""
+    if len(attempts) == 1:
+        return f"{attempts[0]['latency_ms']} ms"
+    return " → ".join(f"{a['latency_ms']} ms {a['outcome']}" for a in attempts)
+
+
+def acquire_csrf_token(api, job_id, deadline, open_timestamp=None):
+    """
+    Polls the registration page until a CSRF token shows up or `deadline`
+    (epoch seconds) would be passed. The interval starts at CSRF_POLL_INTERVAL
+    and grows while the registrar answers slower than we poll, so we do not
+    pile requests onto an overloaded server. Each fetch is cut off at `deadline`.
+    Returns the token, or None if it never appeared.
+    """
+    interval = CSRF_POLL_INTERVAL
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.perf_counter()
+        # A request still hanging at the deadline would eat the registration's reserve.
+        csrf_token = api.fetch_csrf_token(timeout=max(0.5, deadline - time.time()))
+        latency = time.perf_counter() - started
+
+        if csrf_token:
+            if open_timestamp:
+                logger.info(
+                    f"🔓 [run_registration:{job_id}] Token appeared {time.time() - open_timestamp:+.3f}s "
+                    f"after the official open time (attempt {attempt})."
+                )
+            return csrf_token
+
+        if latency > interval:
+            interval = min(interval * 1.5, CSRF_POLL_MAX_INTERVAL)
+        else:
+            interval = CSRF_POLL_INTERVAL
 
+        if time.time() + interval >= deadline:
+            logger.warning(f"⌛ [run_registration:{job_id}] Gave up polling for a CSRF token after {attempt} attempts.")
+            return None
+        time.sleep(interval)
 
-# --- Helper Functions ---
 
 def fail_job(job_id, chat_id, reason):
     logger.error(f"❌ [run_registration:{job_id}] FAILED: {reason}")
@@ -216,29 +428,43 @@ def fail_job(job_id, chat_id, reason):
     return {"status": "error", "message": reason}
 
 
-def send_report(chat_id, mode, succeeded, failed):
+def send_report(chat_id, mode, succeeded, failed, warmup_stats=None, hedge_stats=None):
     report_text = f"🏁 **Registration Report**\nMode: {mode.upper()}\n\n"
     if succeeded:
-        report_text += "✅ **Successfully Registered:**\n" + "\n".join([f"- {c}" for c in succeeded]) + "\n\n"
+        report_text += "✅ **Successfully Registered:**\n" + "\n".join([f"- {c['name']} ({format_attempts(c['attempts'])})" for c in succeeded]) + "\n\n"
     if failed:
         report_text += "❌ **Failed:**\n"
         for fail in failed:
-            report_text += f"- {fail['name']}: {fail['reason']}\n"
+            report_text += f"- {fail['name']}: {fail['reason']} ({format_attempts(fail['attempts'])})\n"
     
     if not succeeded and not failed:
         report_text += "⚠️ No courses were processed."
+
+    if warmup_stats and warmup_stats.get("handshake_saved_ms") is not None:
+        report_text += f"\n🔥 Warm connections saved ~{warmup_stats['handshake_saved_ms']} ms of DNS/TLS handshake."
+
+    if hedge_stats and hedge_stats["hedged"]:
+        report_text += (
+            f"\n🪁 Hedged {hedge_stats['hedged']}/{hedge_stats['requests']} request(s); "
+            f"the hedge won {hedge_stats['hedge_wins']} time(s), saving ~{hedge_stats['saved_ms']} ms."
+        )
     
     notify_user(chat_id, report_text)
 
 
 def update_job_status(chat_id, job_id, status):
+    if update_job_fields(chat_id, job_id, {"status": status}):
+        logger.info(f"📝 Job {job_id} status updated to: {status}")
+
+
+def update_job_fields(chat_id, job_id, fields):
+    """
+    Merges `fields` into the job's dashboard entry (one atomic script call,
+    so concurrent updates cannot overwrite each other). Returns True if the
+    job exists.
+    """
     try:
-        job_index_key = f"job_index:{chat_id}"
-        job_data_json = redis_client.hget(job_index_key, job_id)
-        if job_data_json:
-            job_entry = json.loads(job_data_json)
-            job_entry['status'] = status
-            redis_client.hset(job_index_key, job_id, json.dumps(job_entry))
-            logger.info(f"📝 Job {job_id} status updated to: {status}")
+        return bool(merge_job_fields(redis_client, chat_id, job_id, fields))
     except Exception as e:
-        logger.error(f"⚠️ Failed to update Redis status: {e}")
+        logger.error(f"⚠️ Failed to update Redis job entry: {e}")
+    return False
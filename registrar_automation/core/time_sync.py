@@ -0,0 +1,170 @@
+# core/time_sync.py
+
+import os
+import json
+import time
+import warnings
+import statistics
+
+import redis
+
+from .clock_calibration import calibrate_server_clock
+from .redis_client import get_redis, get_async_redis, REDIS_HOST
+
+# Suppress warnings for requests
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+
+# Background clock-offset service.
+#
+# One process (`python -m core.time_sync`) periodically measures the local
+# clock against several NTP servers and against the registrar itself, and
+# publishes the filtered offsets in a Redis hash. The web API, scheduler and
+# workers read them with a single HGET instead of touching the network.
+#
+# Offsets follow ntplib's convention: offset = reference time - local time.
+
+redis_client = get_redis()
+
+TIME_OFFSETS_KEY = "clock:offsets"
+
+NTP_SERVERS = [s.strip() for s in os.getenv('NTP_SERVERS', 'pool.ntp.org,time.google.com,time.cloudflare.com').split(',') if s.strip()]
+REGISTRAR_PING_URLS = {
+    "real": "https://registrar.nu.edu.kz/robots.txt",
+    "test": "https://testregistrar.nu.edu.kz/robots.txt",
+}
+SYNC_INTERVAL = float(os.getenv('TIME_SYNC_INTERVAL', '60'))
+# Published offsets older than this are reported as stale.
+MAX_OFFSET_AGE = 5 * SYNC_INTERVAL
+# Registrar calibrations less certain than this are not published.
+MAX_CALIBRATION_ERROR = 0.5
+
+
+def get_time_offset(mode=None, client=None):
+    """
+    Returns the best published offset as a dict:
+        {"offset", "error", "source", "updated_at", "age", "stale"}
+    The registrar's own clock (for `mode`) is preferred over NTP, but a fresh
+    source always beats a stale one; stale data is only returned when nothing
+    fresher exists. Never does network I/O beyond one Redis round trip;
+    returns a zero offset marked stale when nothing has been published yet
+    or Redis is unreachable.
+    """
+    client = client or redis_client
+    fields = _offset_fields(mode)
+    try:
+        values = client.hmget(TIME_OFFSETS_KEY, fields)
+    except redis.RedisError as e:
+        print(f"⚠️ [TimeSync] Could not read published offsets: {e}")
+        values = []
+    return _best_offset(fields, values)
+
+
+async def get_time_offset_async(mode=None, client=None):
+    """
+    get_time_offset() for asyncio callers such as the web API, so reading the
+    offset never blocks the event loop. `client` defaults to the shared
+    asyncio Redis client.
+    """
+    client = client or get_async_redis()
+    fields = _offset_fields(mode)
+    try:
+        values = await client.hmget(TIME_OFFSETS_KEY, fields)
+    except redis.RedisError as e:
+        print(f"⚠️ [TimeSync] Could not read published offsets: {e}")
+        values = []
+    return _best_offset(fields, values)
+
+
+def _offset_fields(mode):
+    """Hash fields to read, most preferred first."""
+    return [f"registrar:{mode}", "ntp"] if mode else ["ntp"]
+
+
+def _best_offset(fields, values):
+    """Picks the first fresh entry in preference order, else the first stale one."""
+    now = time.time()
+    entries = []
+    for field, raw in zip(fields, values):
+        if not raw:
+            continue
+        entry = json.loads(raw)
+        entry["source"] = field
+        entry["age"] = now - entry["updated_at"]
+        entry["stale"] = entry["age"] > MAX_OFFSET_AGE
+        if not entry["stale"]:
+            return entry
+        entries.append(entry)
+
+    if entries:
+        return entries[0]
+    return {"offset": 0.0, "error": None, "source": "none", "updated_at": None, "age": None, "stale": True}
+
+
+def measure_ntp_offset():
+    """
+    Queries every server in NTP_SERVERS and returns the median offset after
+    dropping outliers, or None if no server answered.
+    """
+    # Imported here: readers of get_time_offset() (web API, workers) never query NTP.
+    import ntplib
+
+    ntp_client = ntplib.NTPClient()
+    offsets = []
+    for server in NTP_SERVERS:
+        try:
+            offsets.append(ntp_client.request(server, version=3, port=123, timeout=2).offset)
+        except Exception as e:
+            print(f"⚠️ [TimeSync] NTP server {server} failed: {e}")
+
+    if not offsets:
+        return None
+
+    median = statistics.median(offsets)
+    # Median absolute deviation filter; a lone server that is way off is ignored.
+    spread = statistics.median(abs(o - median) for o in offsets) or 0.001
+    kept = [o for o in offsets if abs(o - median) <= 3 * spread]
+    return {
+        "offset": statistics.median(kept),
+        "error": max(kept) - min(kept) if len(kept) > 1 else None,
+        "sources": len(kept),
+    }
+
+
+def publish_offset(field, measurement, client=None):
+    """Stores one measurement under `field` in the shared offsets hash."""
+    client = client or redis_client
+    entry = dict(measurement, updated_at=time.time())
+    client.hset(TIME_OFFSETS_KEY, field, json.dumps(entry))
+
+
+def sync_once():
+    """Measures every source once and publishes whatever succeeded."""
+    ntp = measure_ntp_offset()
+    if ntp:
+        publish_offset("ntp", ntp)
+        print(f"✅ [TimeSync] NTP offset {ntp['offset']:+.4f}s from {ntp['sources']} server(s).")
+
+    for mode, url in REGISTRAR_PING_URLS.items():
+        try:
+            clock = calibrate_server_clock(url)
+        except Exception as e:
+            print(f"⚠️ [TimeSync] Registrar ({mode}) calibration failed: {e}")
+            continue
+        if clock and clock["error"] <= MAX_CALIBRATION_ERROR:
+            publish_offset(f"registrar:{mode}", clock)
+
+
+def run_time_sync():
+    """Main loop of the offset service."""
+    print(f"✅ Time sync service started. Publishing to Redis at {REDIS_HOST} every {SYNC_INTERVAL:.0f}s.")
+    while True:
+        started = time.time()
+        try:
+            sync_once()
+        except Exception as e:
+            print(f"❌ [TimeSync] Sync round failed: {e}")
+        time.sleep(max(SYNC_INTERVAL - (time.time() - started), 1.0))
+
+
+if __name__ == "__main__":
+    run_time_sync()
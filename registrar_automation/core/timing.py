@@ -0,0 +1,25 @@
+# core/timing.py
+
+import time
+
+# How close to the target we stop sleeping and start spinning. time.sleep()
+# routinely overshoots by a millisecond or more under load, so the last stretch
+# is covered by a busy-wait on the wall clock.
+SPIN_WINDOW = 0.015
+
+
+def sleep_until(target_timestamp, spin_window=SPIN_WINDOW):
+    """
+    Blocks until the wall clock reaches `target_timestamp` (epoch seconds):
+    a coarse sleep to `spin_window` before the target, then a busy-wait.
+    Returns the actual-minus-target offset in seconds (positive = late).
+    """
+    while True:
+        remaining = target_timestamp - time.time()
+        if remaining <= spin_window:
+            break
+        time.sleep(remaining - spin_window)
+
+    while time.time() < target_timestamp:
+        pass
+    return time.time() - target_timestamp
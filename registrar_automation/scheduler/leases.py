@@ -0,0 +1,169 @@
+# scheduler/leases.py
+
+import os
+import math
+import uuid
+import socket
+import threading
+
+import redis
+
+from core.schedule_store import SCHEDULE_SHARDS, SCHEDULE_CHANNEL
+
+# Shard ownership for running several scheduler instances at once.
+#
+# Each shard of the schedule index is owned through a lease key
+# (schedule:lease:{shard} = instance id, PX = SCHEDULER_LEASE_MS). Owners renew
+# their leases every quarter of the lease; when an instance dies its leases
+# expire and the others pick the shards up on their next renewal round, so a
+# shard is orphaned for at most one lease plus one round.
+#
+# Live instances heartbeat into schedule:schedulers (zset, score = Redis
+# time in ms) and each takes at most ceil(shards / live instances), so a new
+# instance gets its share as the others shed extra shards. One instance also
+# holds schedule:leader and does the one-off housekeeping (migrating old
+# schedule layouts).
+
+LEASE_MS = int(os.getenv('SCHEDULER_LEASE_MS', '600'))
+
+LEASE_KEY = "schedule:lease:{}"
+LEADER_KEY = "schedule:leader"
+MEMBERS_KEY = "schedule:schedulers"
+
+# Extends a lease only if we still own it.
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Drops a lease only if we still own it.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ShardLeaseManager:
+    """
+    Keeps this instance's shard leases (and possibly the leader lease) alive
+    from a background thread. `owned` is the set of shards this instance may
+    claim jobs from; `on_change` is called with (acquired, lost) sets from
+    the lease thread whenever it changes.
+    """
+
+    def __init__(self, client, shards=SCHEDULE_SHARDS, lease_ms=LEASE_MS, instance_id=None, on_change=None):
+        self.client = client
+        self.shards = shards
+        self.lease_ms = lease_ms
+        self.renew_interval = lease_ms / 4 / 1000
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.on_change = on_change
+
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+        self._owned = frozenset()
+        self._is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def owned(self):
+        return self._owned
+
+    @property
+    def is_leader(self):
+        return self._is_leader
+
+    def refresh(self):
+        """
+        One renewal round: heartbeat, renew what we own, then acquire or shed
+        shards to reach our fair share. Returns (acquired, lost).
+        """
+        seconds, micros = self.client.time()
+        now_ms = seconds * 1000 + micros // 1000
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(MEMBERS_KEY, {self.instance_id: now_ms})
+        pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now_ms - self.lease_ms)
+        pipe.zcard(MEMBERS_KEY)
+        pipe.mget([LEASE_KEY.format(shard) for shard in range(self.shards)])
+        owned = sorted(self._owned)
+        for shard in owned:
+            self._renew(keys=[LEASE_KEY.format(shard)], args=[self.instance_id, self.lease_ms], client=pipe)
+        if self._is_leader:
+            self._renew(keys=[LEADER_KEY], args=[self.instance_id, self.lease_ms], client=pipe)
+        else:
+            pipe.set(LEADER_KEY, self.instance_id, nx=True, px=self.lease_ms)
+        results = pipe.execute()
+
+        live, holders, renewed = results[2], results[3], results[4:4 + len(owned)]
+        self._is_leader = bool(results[-1])
+
+        still_owned = {shard for shard, ok in zip(owned, renewed) if ok}
+        lost = set(owned) - still_owned
+        target = math.ceil(self.shards / max(live, 1))
+
+        acquired = set()
+        if len(still_owned) > target:
+            # Shed the extras so a newly started instance gets its share.
+            extras = sorted(still_owned)[target:]
+            pipe = self.client.pipeline(transaction=False)
+            for shard in extras:
+                self._release(keys=[LEASE_KEY.format(shard)], args=[self.instance_id], client=pipe)
+            pipe.execute()
+            still_owned -= set(extras)
+            lost |= set(extras)
+        else:
+            free = [shard for shard, holder in enumerate(holders) if holder is None]
+            wanted = free[:target - len(still_owned)]
+            if wanted:
+                pipe = self.client.pipeline(transaction=False)
+                for shard in wanted:
+                    pipe.set(LEASE_KEY.format(shard), self.instance_id, nx=True, px=self.lease_ms)
+                acquired = {shard for shard, ok in zip(wanted, pipe.execute()) if ok}
+                still_owned |= acquired
+
+        self._owned = frozenset(still_owned)
+        if (acquired or lost) and self.on_change:
+            self.on_change(acquired, lost)
+        return acquired, lost
+
+    def start(self):
+        """Takes the first leases synchronously, then keeps renewing them in the background."""
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="shard-leases", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.renew_interval):
+            try:
+                self.refresh()
+            except redis.RedisError as e:
+                # Without Redis we cannot prove ownership; stop dispatching.
+                print(f"⚠️ [Leases] Renewal failed ({e}); giving up all shards.")
+                lost, self._owned, self._is_leader = set(self._owned), frozenset(), False
+                if lost and self.on_change:
+                    self.on_change(set(), lost)
+
+    def stop(self):
+        """Stops renewing and hands every lease back immediately."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        pipe = self.client.pipeline(transaction=False)
+        for shard in self._owned:
+            self._release(keys=[LEASE_KEY.format(shard)], args=[self.instance_id], client=pipe)
+        self._release(keys=[LEADER_KEY], args=[self.instance_id], client=pipe)
+        pipe.zrem(MEMBERS_KEY, self.instance_id)
+        pipe.execute()
+        self._owned = frozenset()
+        self._is_leader = False
+
+
+def wake_schedulers(client):
+    """Nudges every scheduler's main loop, e.g. after shards changed hands."""
+    client.publish(SCHEDULE_CHANNEL, "leases")
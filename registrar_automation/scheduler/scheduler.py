@@ -2,93 +2,229 @@
 
 import time
 import redis
-import json
 from celery import Celery
 import os
+from core.schedule_store import (
+    claim_due_jobs, ack_jobs, pending_inflight_jobs, migrate_legacy_schedule, next_due_time, SCHEDULE_CHANNEL
+)
+from core.dispatch_metrics import record_dispatches
+from core.celery_app import TASK_ROUTES, BROKER_TRANSPORT_OPTIONS
+from core.redis_client import get_redis, REDIS_HOST
+from scheduler.leases import ShardLeaseManager, wake_schedulers
 
 
-REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
-
 # Configure a Celery app instance just for sending tasks
 celery_app = Celery(
     'scheduler_tasks',
-    broker='redis://{REDIS_HOST}:6379/0'
+    broker=os.getenv('CELERY_BROKER_URL', f'redis://{REDIS_HOST}:6379/0')
 )
+# Same queues and priorities as the workers expect.
+celery_app.conf.task_routes = TASK_ROUTES
+celery_app.conf.broker_transport_options = BROKER_TRANSPORT_OPTIONS
 
 # Connect to Redis to check for scheduled jobs
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+redis_client = get_redis()
+
+# Jobs that are this much overdue (e.g. after a long outage) are dropped
+# instead of fired; a registration minutes late is worse than none.
+CATCH_UP_SECONDS = 60
+
+# Upper bound on one sleep. Wake-ups normally come from the next fire time or
+# a schedule:changed message; this only limits the damage of a missed one.
+MAX_IDLE_SECONDS = 30
+
+TASK_ID_FIELDS = {"pre_login": "pre_login_task_id", "registration": "registration_task_id"}
+
+
+def task_message(kind, token, job_data):
+    """Task name, args and kwargs for one claimed job."""
+    if kind == "pre_login":
+        return 'tasks.pre_login', [
+            job_data['job_id'],
+            job_data['username'],
+            job_data['password'],
+            job_data['mode']
+        ], {'dispatch_token': token}
+
+    # Registration jobs are dispatched early so the worker can
+    # warm up its connections; it waits for this instant itself.
+    return 'tasks.run_registration', [
+        job_data['job_id'],
+        job_data['chat_id'],
+        job_data['username'],
+        job_data['password'],
+        job_data['courses'],
+        job_data['mode']
+    ], {
+        'trigger_timestamp': job_data.get('trigger_timestamp'),
+        'open_timestamp': job_data.get('open_timestamp'),
+        'trigger_at': job_data.get('trigger_at'),
+        'clock_offset': job_data.get('clock_offset'),
+        'clock_offset_source': job_data.get('clock_offset_source'),
+        'dispatch_token': token
+    }
+
+
+def dispatch_jobs(jobs, app=None, client=None, claimed_at=None):
+    """
+    Publishes Celery tasks for claimed jobs ((token, kind, fire_time, plan)
+    tuples) through one broker connection and producer, then records the task
+    IDs, the dispatch timings and acks the jobs in one more round trip. The
+    dispatch token is used as the task ID, so a re-publish after a crash is
+    recognisable.
+    """
+    app = app or celery_app
+    client = client or redis_client
+    if not jobs:
+        return
+    claimed_at = claimed_at or time.time()
+
+    with app.producer_or_acquire() as producer:
+        for token, kind, _, job_data in jobs:
+            name, args, kwargs = task_message(kind, token, job_data)
+            # The args carry the user's password; keep it out of logs and
+            # monitoring. No declare/retry: the queue exists once a worker
+            # has started, and a job whose publish fails stays inflight.
+            app.send_task(
+                name, args=args, kwargs=kwargs, task_id=token, producer=producer,
+                argsrepr=f"('{job_data['job_id']}', ...)", kwargsrepr='{...}',
+                declare=[], retry=False
+            )
+    published_at = time.time()
+
+    pipe = client.pipeline(transaction=False)
+    for token, kind, _, job_data in jobs:
+        pipe.hset(f"user:{job_data['chat_id']}", TASK_ID_FIELDS[kind], token)
+    record_dispatches(pipe, [(token, kind, fire_time) for token, kind, fire_time, _ in jobs], claimed_at, published_at)
+    ack_jobs(pipe, [token for token, _, _, _ in jobs])
+    pipe.execute()
+
+    lags = sorted((published_at - fire_time) * 1000 for _, _, fire_time, _ in jobs)
+    print(f"📤 Dispatched {len(jobs)} job(s); publish lag p50 {lags[len(lags) // 2]:.1f} ms, max {lags[-1]:.1f} ms.")
+
+
+def warm_up_producer(app):
+    """
+    Connects to the broker and builds Celery's routing tables up front, so
+    the first due job does not pay ~100 ms of set-up.
+    """
+    with app.producer_or_acquire() as producer:
+        producer.connection.ensure_connection(max_retries=3)
+    app.amqp.router
+
 
-def run_scheduler():
+def process_claimed(claimed, now, app=None, client=None):
+    """Dispatches claimed jobs, dropping (and acking) the ones too far overdue."""
+    client = client or redis_client
+    due = []
+    dropped = []
+    for job in claimed:
+        token, kind, fire_time, job_data = job
+        if fire_time < now - CATCH_UP_SECONDS:
+            print(f"⚠️ Dropping {kind} job {job_data.get('job_id')}: {now - fire_time:.0f}s overdue.")
+            dropped.append(token)
+        else:
+            due.append(job)
+
+    dispatch_jobs(due, app=app, client=client, claimed_at=now)
+    if dropped:
+        ack_jobs(client, dropped)
+
+
+def subscribe_to_changes(client=None):
+    """Opens a pub/sub connection listening for schedule changes."""
+    pubsub = (client or redis_client).pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(SCHEDULE_CHANNEL)
+    return pubsub
+
+
+def wait_for_next_job(pubsub, shards, max_wait=MAX_IDLE_SECONDS, client=None):
+    """
+    Sleeps until the earliest fire time in `shards`, until the schedule
+    changes, or for `max_wait` seconds, whichever comes first. Returns the
+    (possibly re-opened) pub/sub.
+    """
+    client = client or redis_client
+    next_due = next_due_time(client, shards) if shards else None
+    now = time.time()
+    deadline = now + max_wait if next_due is None else min(next_due, now + max_wait)
+
+    try:
+        # get_message() also returns early (with None) for subscribe
+        # confirmations, so keep waiting until the deadline or a real message.
+        while (timeout := deadline - time.time()) > 0:
+            if pubsub.get_message(timeout=timeout) is not None:
+                # Drain the burst (e.g. several jobs created at once) before re-reading the index.
+                while pubsub.get_message(timeout=0) is not None:
+                    pass
+                break
+    except redis.ConnectionError as e:
+        print(f"⚠️ Lost the schedule:changed subscription ({e}); reconnecting.")
+        time.sleep(1)
+        pubsub = subscribe_to_changes(client)
+    return pubsub
+
+
+def run_scheduler(app=None, client=None, lease_ms=None):
     """
-    The main loop for the scheduler. It runs once per second, checks for jobs,
-    and creates Celery tasks for any jobs it finds.
+    The main loop for one scheduler instance. Any number of instances can run
+    against the same Redis: each claims jobs only from the shards it holds a
+    lease on (see scheduler/leases.py). It atomically claims all due jobs from
+    those shards, creates Celery tasks for them, then sleeps until the next
+    fire time or a schedule:changed message.
     """
+    app = app or celery_app
+    client = client or redis_client
     print(f"✅ Scheduler started. Connecting to Redis at {REDIS_HOST}")
-    
-    # On startup, set the last checked time to a minute ago to catch up on missed jobs
-    last_checked_timestamp = int(time.time()) - 60
-
-    while True:
-        current_timestamp = int(time.time())
-        
-        # Only run the main logic if the second has changed
-        if current_timestamp > last_checked_timestamp:
-            
-            # --- CATCH-UP LOGIC ---
-            # Check for all jobs from the last time we checked up to now
-            for ts in range(last_checked_timestamp + 1, current_timestamp + 1):
-                
-                # Check for pre-login jobs
-                pre_login_key = f"schedule:{ts}:pre_login"
-                pre_login_jobs = redis_client.lrange(pre_login_key, 0, -1)
-                if pre_login_jobs:
-                    print(f"Found {len(pre_login_jobs)} pre-login job(s) for timestamp {ts}")
-                    for job_json in pre_login_jobs:
-                        job_data = json.loads(job_json)
-                        # Send the pre_login task to the Celery workers
-                        task = celery_app.send_task(
-                                'tasks.pre_login',
-                                args=[
-                                    job_data['job_id'],   # Added
-                                    job_data['username'],
-                                    job_data['password'],
-                                    job_data['mode']      # Added
-                                    ]
-                                )                       
-                         # Save the task ID to the redis data base
-                        redis_client.hset(f"user:{job_data['chat_id']}", "pre_login_task_id", task.id)
-
-                    # Atomically delete the key so jobs aren't run twice
-                    redis_client.delete(pre_login_key)
-
-                # Check for main registration jobs
-                reg_key = f"schedule:{ts}:registration"
-                reg_jobs = redis_client.lrange(reg_key, 0, -1)
-                if reg_jobs:
-                    print(f"Found {len(reg_jobs)} registration job(s) for timestamp {ts}")
-                    for job_json in reg_jobs:
-                        job_data = json.loads(job_json)
-                        # Send the run_registration task to the Celery workers
-                        task = celery_app.send_task(
-                                'tasks.run_registration',
-                                args=[
-                                    job_data['job_id'],
-                                    job_data['chat_id'],
-                                    job_data['username'],
-                                    job_data['password'],
-                                    job_data['courses'],
-                                    job_data['mode']
-                                    ]
-                                )
-                        redis_client.hset(f"user:{job_data['chat_id']}", "registration_task_id", task.id)
-                    # Atomically delete the key
-                    redis_client.delete(reg_key)
-
-            # Update the last checked timestamp
-            last_checked_timestamp = current_timestamp
-        
-        # Sleep for a short interval to prevent high CPU usage
-        time.sleep(0.1)
+
+    warm_up_producer(app)
+
+    # Subscribe before the first claim so no change between the two is missed.
+    pubsub = subscribe_to_changes(client)
+
+    # Shards picked up from another instance may hold jobs it claimed but
+    # never acked. Re-publishing is safe: workers drop tokens they have already run.
+    adopted = set()
+
+    def on_leases_changed(acquired, lost):
+        if acquired:
+            adopted.update(acquired)
+        print(f"🔀 [Scheduler] Shards now {sorted(leases.owned)} (+{sorted(acquired)} -{sorted(lost)}).")
+        wake_schedulers(client)
+
+    lease_args = {"lease_ms": lease_ms} if lease_ms else {}
+    leases = ShardLeaseManager(client, on_change=on_leases_changed, **lease_args)
+    leases.start()
+    migrated = False
+
+    try:
+        while True:
+            if leases.is_leader and not migrated:
+                moved = migrate_legacy_schedule(client)
+                if moved:
+                    print(f"Migrated {moved} job(s) from older schedule layouts.")
+                migrated = True
+
+            shards = leases.owned
+            now = time.time()
+
+            if adopted:
+                taking_over = adopted & shards
+                adopted.clear()
+                orphaned = pending_inflight_jobs(client, taking_over) if taking_over else []
+                if orphaned:
+                    print(f"⚠️ Re-dispatching {len(orphaned)} job(s) left inflight in shards {sorted(taking_over)}.")
+                    process_claimed(orphaned, now, app=app, client=client)
+
+            claimed = claim_due_jobs(client, now, shards) if shards else []
+            if claimed:
+                print(f"Found {len(claimed)} due job(s) at {now:.3f}")
+                process_claimed(claimed, now, app=app, client=client)
+
+            # Standbys (no shards) still wake up when leases change hands.
+            pubsub = wait_for_next_job(pubsub, shards, client=client)
+    finally:
+        leases.stop()
 
 if __name__ == "__main__":
     run_scheduler()
@@ -0,0 +1,33 @@
+# web/api/metrics.py
+
+import time
+import logging
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from core.dispatch_metrics import lag_report, prometheus_text, MAX_REPORT_WINDOW
+from core.redis_client import command_stats_text
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("", response_class=PlainTextResponse)
+def metrics():
+    """Dispatch-lag histograms and the API's Redis latency in the Prometheus text format."""
+    return prometheus_text() + command_stats_text()
+
+
+@router.get("/dispatch-lag")
+def dispatch_lag(start: Optional[float] = None, end: Optional[float] = None, kind: Optional[str] = None):
+    """
+    p50/p95/p99 lag (ms) of each dispatch stage for jobs scheduled between
+    `start` and `end` (epoch seconds, default: the last hour), per second for
+    windows up to 10 minutes and per minute for longer ones.
+    """
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 3600
+    if end < start or end - start > MAX_REPORT_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Window must be between 0 and {MAX_REPORT_WINDOW} seconds.")
+
+    return {"start": start, "end": end, "buckets": lag_report(start=start, end=end, kind=kind)}
@@ -4,47 +4,44 @@ import redis
 import json
 import uuid
 import logging
-import os
 
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from web.time_utils import get_ntp_time_offset
+from web.time_utils import get_time_offset_async
 from celery.result import AsyncResult
-from core.redis_utils import hset_compat
+from core.schedule_store import schedule_job
+from core.redis_scripts import debit_attempt, cancel_user_job
+from core.redis_client import get_async_redis
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/registration", tags=["Registration"])
 
-REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1') 
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+# Асинхронный клиент: эндпоинты не блокируют event loop на запросах к Redis.
+redis_client = get_async_redis()
 
 DEFAULT_ATTEMPTS = 100
 
+# Registration fires this long after the official open time.
+TRIGGER_DELAY_SECONDS = 1
+
+# The registration task is dispatched this many seconds before the trigger so
+# the worker can resolve DNS and open TLS connections ahead of time.
+WARMUP_LEAD_SECONDS = 5
+
 async def check_user_attempts(chat_id: int):
     """
     Проверяет, есть ли у пользователя попытки. 
     Если нет, вызывает исключение.
     Если да, атомарно уменьшает счетчик на 1.
     """
-    user_key = f"user:{chat_id}"
     try:
-
-        if not redis_client.hexists(user_key, "attempts_left"):
-            logger.info(f"User {chat_id} not found in Redis. Initializing with {DEFAULT_ATTEMPTS} attempts.")
-            # We use hset directly here since we are setting a single field, 
-            # but you can use hset_compat if you want to be safe with older Redis versions.
-            redis_client.hset(user_key, "attempts_left", DEFAULT_ATTEMPTS)
-
-
-
-        # HINCRBY - атомарная операция
-        new_attempts = redis_client.hincrby(user_key, "attempts_left", -1)
+        # Lua-скрипт: инициализация нового пользователя, проверка и списание
+        # попытки - атомарно, за один round trip.
+        new_attempts = await debit_attempt(redis_client, chat_id, DEFAULT_ATTEMPTS)
         
         if new_attempts < 0:
-            # Если попыток стало < 0, отменяем операцию
-            redis_client.hincrby(user_key, "attempts_left", 1)
             logger.warning(f"Chat_id {chat_id} has no registration attempts left.")
             raise HTTPException(status_code=403, detail="No registration attempts left.")
         
@@ -84,24 +81,28 @@ async def create_registration_job(job: NewRegistrationJob, attempts_left: int =
     создает job_id, сохраняет его в job_index и ставит в очередь шедулера.
     """
     
+    # Registration opens by the registrar's clock, so that is the clock we
+    # schedule against (time_offset = registrar time - local time).
     try:
-        time_offset = get_ntp_time_offset()
+        time_offset, time_offset_source = await get_time_offset_async(job.mode)
     except Exception as e:
-        logger.error(f"NTP Time offset failed: {e}. Defaulting to 0.0")
-        time_offset = 0.0
+        logger.error(f"Time offset failed: {e}. Defaulting to 0.0")
+        time_offset, time_offset_source = 0.0, "none"
 
-    ntp_now = datetime.fromtimestamp(datetime.now().timestamp() - time_offset)
+    ntp_now = datetime.fromtimestamp(datetime.now().timestamp() + time_offset)
 
     if job.target_time_str == "NOW":
         # IMMEDIATE EXECUTION FOR TESTING
 
 
         target_dt = ntp_now + timedelta(seconds=60)
-        # We strictly respect your rule: pre_login is 12 seconds before trigger.
-        pre_login_dt = target_dt - timedelta(seconds=12)
         
-        trigger_timestamp = int(target_dt.timestamp())
-        pre_login_timestamp = int(pre_login_dt.timestamp())
+        # target_dt is on the registrar's clock; the timestamps are local.
+        open_timestamp = target_dt.timestamp() - time_offset
+        trigger_at = open_timestamp
+        trigger_timestamp = int(trigger_at)
+        # We strictly respect your rule: pre_login is 12 seconds before trigger.
+        pre_login_timestamp = trigger_timestamp - 12
         
         # Override the string for the dashboard response
         job.target_time_str = target_dt.strftime("%Y-%m-%d %H:%M:%S")
@@ -122,9 +123,14 @@ async def create_registration_job(job: NewRegistrationJob, attempts_left: int =
             raise HTTPException(status_code=400, detail="Registration time must be at least 20 seconds in the future.")
 
         # Вычисление временных меток для "Timed Strike"
-        trigger_timestamp = int(int(target_dt.timestamp()) + 1 - time_offset)
+        open_timestamp = target_dt.timestamp() - time_offset
+        # The scheduler works in whole seconds; the worker waits for the exact trigger_at.
+        trigger_at = open_timestamp + TRIGGER_DELAY_SECONDS
+        trigger_timestamp = int(trigger_at)
         pre_login_timestamp = trigger_timestamp - 12 # За 12 секунд
     
+    dispatch_timestamp = trigger_timestamp - WARMUP_LEAD_SECONDS
+
     job_id = str(uuid.uuid4()) # Уникальный ID для этого задания
 
     # 1. "План Задания" для шедулера
@@ -134,7 +140,13 @@ async def create_registration_job(job: NewRegistrationJob, attempts_left: int =
         "username": job.username,
         "password": job.password,
         "courses": job.validated_courses,
-        "mode": job.mode
+        "mode": job.mode,
+        "trigger_timestamp": trigger_timestamp,
+        "open_timestamp": open_timestamp,
+        "trigger_at": trigger_at,
+        "clock_offset": time_offset,
+        # The worker only corrects the trigger with a newer reading of the same clock.
+        "clock_offset_source": time_offset_source
     }
     
     # 2. Запись "в приборной панели" для пользователя
@@ -145,6 +157,7 @@ async def create_registration_job(job: NewRegistrationJob, attempts_left: int =
         "status": "scheduled",
         "timestamp_pre_login": pre_login_timestamp,
         "timestamp_trigger": trigger_timestamp,
+        "timestamp_dispatch": dispatch_timestamp,
         "courses": [course.get('name', 'N/A') for course in job.validated_courses]
     }
 
@@ -156,19 +169,21 @@ async def create_registration_job(job: NewRegistrationJob, attempts_left: int =
         job_plan_json = json.dumps(job_plan)
         
         # Помещаем задание в очередь шедулера
-        pipe.rpush(f"schedule:{pre_login_timestamp}:pre_login", job_plan_json)
-        pipe.rpush(f"schedule:{trigger_timestamp}:registration", job_plan_json)
+        schedule_job(pipe, job_id, job_plan_json, {
+            "pre_login": pre_login_timestamp,
+            "registration": dispatch_timestamp,
+        })
         
         # Добавляем задание в "приборную панель" пользователя
         pipe.hset(job_index_key, job_id, json.dumps(job_dashboard_entry))
         
-        pipe.execute()
+        await pipe.execute()
         
         logger.info(f"Job {job_id} created successfully for chat_id {job.chat_id}")
         
     except Exception as e:
         # Если что-то пошло не так, возвращаем попытку
-        redis_client.hincrby(f"user:{job.chat_id}", "attempts_left", 1)
+        await redis_client.hincrby(f"user:{job.chat_id}", "attempts_left", 1)
         logger.error(f"Failed to schedule job {job_id} in Redis: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to schedule job: {e}")
 
@@ -188,10 +203,10 @@ async def get_user_jobs(chat_id: int):
     Читает job_index пользователя и возвращает все активные задания.
     """
     job_index_key = f"job_index:{chat_id}"
-    if not redis_client.exists(job_index_key):
+    if not await redis_client.exists(job_index_key):
         return {"status": "success", "jobs": []} # У пользователя еще нет заданий
         
-    jobs_raw = redis_client.hgetall(job_index_key)
+    jobs_raw = await redis_client.hgetall(job_index_key)
     jobs = []
     
     for job_id, job_json in jobs_raw.items():
@@ -216,48 +231,15 @@ async def cancel_registration_job(req: CancelJobRequest):
     Реализует команду /cancel_registration.
     Находит задание по job_id, удаляет его из job_index и из очередей scheduler'a.
     """
-    job_index_key = f"job_index:{req.chat_id}"
-    
-    # 1. Получаем детали задания, чтобы знать, какие timestamp удалять
-    job_json = redis_client.hget(job_index_key, req.job_id)
-    if not job_json:
+    # Одним Lua-скриптом: удаляем задание из "приборной панели" (HDEL),
+    # планы из индекса шедулера (ZREM + HDEL) и возвращаем попытку.
+    # Если задания нет (или его уже отменил параллельный запрос),
+    # скрипт ничего не меняет и попытка второй раз не возвращается.
+    cancelled = await cancel_user_job(redis_client, req.chat_id, req.job_id)
+    if cancelled is None:
         logger.warning(f"Job {req.job_id} not found for cancellation by chat_id {req.chat_id}")
         raise HTTPException(status_code=404, detail="Job not found or already cancelled.")
-
-    try:
-        job_data = json.loads(job_json)
-        pre_login_ts = job_data.get("timestamp_pre_login")
-        trigger_ts = job_data.get("timestamp_trigger")
-        if not (pre_login_ts and trigger_ts):
-             raise KeyError("Timestamps are missing from job data")
-    except (json.JSONDecodeError, KeyError) as e:
-        logger.error(f"Could not parse job data for cancellation {req.job_id}: {e}")
-        # Удаляем битую запись из индекса, но не можем очистить очередь
-        redis_client.hdel(job_index_key, req.job_id)
-        raise HTTPException(status_code=500, detail="Could not parse job data for cancellation.")
-
-    # 2. Находим и удаляем планы из очередей шедулера (LREM)
-    keys_to_check = [f"schedule:{pre_login_ts}:pre_login", f"schedule:{trigger_ts}:registration"]
-    plans_removed = 0
-    
-    for key in keys_to_check:
-        all_plans_json = redis_client.lrange(key, 0, -1)
-        for plan_json in all_plans_json:
-            try:
-                plan = json.loads(plan_json)
-                # Мы ищем по job_id, чтобы удалить нужный план
-                if plan.get("job_id") == req.job_id:
-                    redis_client.lrem(key, 1, plan_json)
-                    plans_removed += 1
-                    break 
-            except json.JSONDecodeError:
-                continue
-
-    # 3. Удаляем задание из "приборной панели" пользователя (HDEL)
-    redis_client.hdel(job_index_key, req.job_id)
-    
-    # 4. Возвращаем попытку
-    new_attempts = redis_client.hincrby(f"user:{req.chat_id}", "attempts_left", 1)
+    plans_removed, new_attempts = cancelled
     
     logger.info(f"Job {req.job_id} cancelled by {req.chat_id}. Removed {plans_removed} entries. Attempts set to {new_attempts}.")
 
@@ -274,7 +256,7 @@ async def get_registration_result(job_id: str, chat_id: int):
     окончательный отчет о регистрации.
     """
     job_index_key = f"job_index:{chat_id}"
-    job_json = redis_client.hget(job_index_key, job_id)
+    job_json = await redis_client.hget(job_index_key, job_id)
     if not job_json:
         # Может быть, отчет уже был получен и удален?
         # Или это неверный job_id.
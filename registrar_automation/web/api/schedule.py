@@ -1,17 +1,15 @@
 # web/api/schedule.py
 import json
-import redis
 import logging
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from core.tasks import update_course_ids
+from core.celery_app import celery_app
 from core.utils import parse_schedule_text
 from celery.result import AsyncResult
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/schedule", tags=["Schedule"])
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
 
 # --- Pydantic Models ---
 class ScheduleData(BaseModel):
@@ -29,10 +27,14 @@ async def validate_schedule(schedule: ScheduleData):
     if not course_names:
         raise HTTPException(status_code=400, detail="Schedule file is empty or invalid.")
 
-    task = update_course_ids.delay(
-        credentials={"username": schedule.username, "password": schedule.password},
-        desired_schedule=desired_schedule,
-        course_names=course_names
+    # Sent by name: importing core.scrape_tasks would load Playwright into the API.
+    task = celery_app.send_task(
+        'tasks.update_course_ids',
+        kwargs={
+            "credentials": {"username": schedule.username, "password": schedule.password},
+            "desired_schedule": desired_schedule,
+            "course_names": course_names
+        }
     )
 
     logger.info(f"Task {task.id} created for schedule validation.")
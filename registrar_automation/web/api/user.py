@@ -1,21 +1,17 @@
 # web/api/user.py
 
-import os
 import logging
-import redis
 import json
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from core.api_registrar import RegistrarAPI
-from core.redis_utils import hset_compat
+from core.redis_client import get_async_redis
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/user", tags=["User"])
 
-REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
-redis_client = redis.StrictRedis(host=REDIS_HOST, port=6379, db=0, decode_responses=True)
+redis_client = get_async_redis()
 
 
 # --- Constant Variables ---
@@ -38,9 +34,11 @@ async def validate_user_credentials(creds: UserCredentials):
     """
     logger.info(f"Validating credentials for user: {creds.username} against mode: {creds.mode}")
     try:
-        api = RegistrarAPI(mode=creds.mode)
-
-        is_valid = api.validate_login(creds.username, creds.password)
+        # Асинхронный клиент: проверка не блокирует event loop для других запросов.
+        # Импорт здесь, чтобы aiohttp не грузился при старте API.
+        from core.async_api_registrar import AsyncRegistrarAPI
+        async with AsyncRegistrarAPI(mode=creds.mode) as api:
+            is_valid = await api.validate_login(creds.username, creds.password)
         
         if not is_valid:
             logger.warning(f"Validation failed for user: {creds.username} on mode: {creds.mode}")
@@ -67,11 +65,14 @@ async def get_user_status(chat_id: int):
     """
     user_key = f"user:{chat_id}"
     
-    if not redis_client.exists(user_key):
+    # HSETNX + HGET in one transaction: one round trip, and a user key that
+    # only holds task ids (written by the scheduler) still gets its attempts.
+    pipe = redis_client.pipeline()
+    pipe.hsetnx(user_key, "attempts_left", DEFAULT_ATTEMPTS)
+    pipe.hget(user_key, "attempts_left")
+    created, attempts_left = await pipe.execute()
+    if created:
         print(f"New user detected. Initializing chat_id: {chat_id}")
-        hset_compat(redis_client, user_key, {"attempts_left": DEFAULT_ATTEMPTS})
-        
-    attempts_left = redis_client.hget(user_key, "attempts_left")
     
     return {
         "status": "success",
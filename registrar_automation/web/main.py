@@ -1,8 +1,9 @@
 # web/main.py
 
+import sys
 import logging
 from fastapi import FastAPI
-from .api import user, schedule, registration, notifications
+from .api import user, schedule, registration, notifications, metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +22,14 @@ app.include_router(user.router)
 app.include_router(schedule.router)
 app.include_router(registration.router)
 app.include_router(notifications.router)
+app.include_router(metrics.router)
+
+@app.on_event("shutdown")
+async def close_registrar_pool():
+    """Closes the keep-alive pool used to validate credentials against the registrar, if it was opened."""
+    registrar = sys.modules.get("core.async_api_registrar")
+    if registrar is not None:
+        await registrar.close_shared_connector()
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -1,7 +1,8 @@
 # web/time_utils.py
 
-import ntplib
 from time import ctime
+from core.time_sync import get_time_offset as get_published_time_offset, get_time_offset_async as get_published_time_offset_async
+
 
 def get_ntp_time_offset():
     """
@@ -9,9 +10,12 @@ def get_ntp_time_offset():
     and calculates the offset of the local system clock.
 
     Returns:
-        float: The clock offset in seconds. A positive value means the local
-               clock is ahead of the true time. A negative value means it's behind.
+        float: The clock offset in seconds (true time minus local time, as
+               ntplib reports it). A positive value means the local clock is
+               behind the true time. A negative value means it's ahead.
     """
+    import ntplib  # Only needed for this direct query; the API normally reads the published offset.
+
     ntp_client = ntplib.NTPClient()
     # A reliable public NTP server pool
     ntp_server = 'pool.ntp.org'
@@ -29,3 +33,29 @@ def get_ntp_time_offset():
         print("   -> Defaulting to zero offset. Timing will be based on local clock only.")
         # If we can't get the true time, we assume the local clock is correct.
         return 0.0
+
+
+def get_time_offset(mode):
+    """
+    Returns the clock offset (reference time minus local time) published by
+    the time sync service, preferring the registrar's own clock for `mode`.
+    Reads Redis only; never blocks on NTP or the registrar.
+    """
+    return _offset_value(get_published_time_offset(mode))
+
+
+async def get_time_offset_async(mode):
+    """
+    Like get_time_offset(), for async endpoints: reads Redis through the
+    asyncio client instead of blocking the event loop. Returns
+    (offset, source), the source being the published field the offset came
+    from (e.g. 'registrar:real', 'ntp') or 'none'.
+    """
+    entry = await get_published_time_offset_async(mode)
+    return _offset_value(entry), entry["source"]
+
+
+def _offset_value(entry):
+    if entry["stale"]:
+        print(f"⚠️ [TimeUtils] Time offset from '{entry['source']}' is stale (age: {entry['age']}). Is the timesync service running?")
+    return entry["offset"]